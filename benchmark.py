@@ -18,14 +18,19 @@ Options:
     --full      Run full benchmark (100K+ entries, production-like)
     --memory    Include memory profiling (requires psutil)
     --all       Run all benchmarks
+    --parallel  Run the selected versions concurrently
 """
 
 import sys
 import os
+import atexit
 import time
 import tempfile
 import shutil
 import argparse
+import csv
+import json
+import multiprocessing
 from pathlib import Path
 from typing import Dict, List, Tuple, Any
 import random
@@ -59,56 +64,74 @@ def check_dependencies():
 # Add sec_mcp to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-# Import storage modules directly to avoid dependency issues
-import importlib.util
-
-def import_storage_v1():
-    """Import StorageV1 directly from file."""
-    spec = importlib.util.spec_from_file_location("storage", Path(__file__).parent / "sec_mcp" / "storage.py")
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module.Storage
-
-def import_storage_v2():
-    """Import StorageV2 directly from file."""
-    spec = importlib.util.spec_from_file_location("storage_v2", Path(__file__).parent / "sec_mcp" / "storage_v2.py")
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module.HybridStorage
-
 try:
-    StorageV1 = import_storage_v1()
-except Exception as e:
+    from sec_mcp.storage import Storage as StorageV1
+except ImportError as e:
     print(f"Warning: Could not import v1 storage: {e}")
     StorageV1 = None
 
 try:
-    StorageV2 = import_storage_v2()
-except Exception as e:
+    from sec_mcp.storage_v2 import HybridStorage as StorageV2
+except ImportError as e:
     print(f"Warning: Could not import v2 storage: {e}")
     StorageV2 = None
 
 
+# Seed shared by data generation and lookup sampling for reproducible runs
+BENCHMARK_SEED = 0xC0FFEE
+
+
 class BenchmarkResults:
     """Store and display benchmark results."""
 
+    __slots__ = ('results', 'memory', 'meta')
+
     def __init__(self):
-        self.results: Dict[str, Dict[str, Any]] = {}
+        # (version, operation) -> {'time_ms': ..., **extra metrics}
+        self.results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # version -> RSS in MB
+        self.memory: Dict[str, float] = {}
+        # Run parameters (data size, iterations, ...) recorded in exports
+        self.meta: Dict[str, Any] = {}
 
     def add_result(self, version: str, operation: str, time_ms: float, **kwargs):
         """Add a benchmark result."""
-        if version not in self.results:
-            self.results[version] = {}
-        self.results[version][operation] = {
+        self.results[(version, operation)] = {
             'time_ms': time_ms,
             **kwargs
         }
 
     def add_memory(self, version: str, memory_mb: float):
         """Add memory usage result."""
-        if version not in self.results:
-            self.results[version] = {}
-        self.results[version]['memory_mb'] = memory_mb
+        self.memory[version] = memory_mb
+
+    def merge(self, other: 'BenchmarkResults'):
+        """Merge results collected by another (e.g. per-version) instance."""
+        self.results.update(other.results)
+        self.memory.update(other.memory)
+
+    def time_ms(self, version: str, operation: str) -> float:
+        """Measured time for one cell of the comparison table (0 if missing)."""
+        return self.results.get((version, operation), {}).get('time_ms', 0)
+
+    def to_json(self) -> str:
+        """Serialize results as JSON: {"results": {version: {op: {...}}}, "memory_mb", "meta"}."""
+        nested: Dict[str, Dict[str, Any]] = {}
+        for (version, op), result in sorted(self.results.items()):
+            nested.setdefault(version, {})[op] = result
+        return json.dumps(
+            {"results": nested, "memory_mb": self.memory, "meta": self.meta},
+            indent=2
+        )
+
+    def write_csv(self, path):
+        """Write one row per (version, operation) result to a CSV file."""
+        extra_fields = sorted({key for result in self.results.values() for key in result} - {'time_ms'})
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['version', 'operation', 'time_ms', *extra_fields])
+            writer.writeheader()
+            for (version, op), result in sorted(self.results.items()):
+                writer.writerow({'version': version, 'operation': op, **result})
 
     def print_comparison(self):
         """Print formatted comparison table."""
@@ -117,10 +140,7 @@ class BenchmarkResults:
         print("="*80)
 
         # Get all operations
-        all_ops = set()
-        for version_results in self.results.values():
-            all_ops.update(version_results.keys())
-        all_ops.discard('memory_mb')
+        all_ops = {op for _, op in self.results}
 
         # Print table header
         print(f"\n{'Operation':<25} {'v1 (DB)':<15} {'v0.3.0 (Hybrid)':<20} {'v0.4.0 (Optimized)':<20} {'Speedup':<15}")
@@ -128,9 +148,9 @@ class BenchmarkResults:
 
         # Print each operation
         for op in sorted(all_ops):
-            v1_time = self.results.get('v1', {}).get(op, {}).get('time_ms', 0)
-            v2_time = self.results.get('v0.3.0', {}).get(op, {}).get('time_ms', 0)
-            v2opt_time = self.results.get('v0.4.0', {}).get(op, {}).get('time_ms', 0)
+            v1_time = self.time_ms('v1', op)
+            v2_time = self.time_ms('v0.3.0', op)
+            v2opt_time = self.time_ms('v0.4.0', op)
 
             if v1_time > 0 and v2opt_time > 0:
                 speedup = f"{v1_time / v2opt_time:.1f}x"
@@ -147,7 +167,7 @@ class BenchmarkResults:
         print("\n" + "-" * 100)
         print(f"{'Memory Usage':<25} ", end="")
         for version in ['v1', 'v0.3.0', 'v0.4.0']:
-            mem = self.results.get(version, {}).get('memory_mb', 0)
+            mem = self.memory.get(version, 0)
             if mem > 0:
                 print(f"{mem:.1f}MB{' '*9} ", end="")
             else:
@@ -155,16 +175,16 @@ class BenchmarkResults:
         print()
 
         # Print optimization metrics for v0.4.0
-        if 'v0.4.0' in self.results:
-            v4_results = self.results['v0.4.0']
-            if 'hot_hit_rate' in v4_results.get('domain_lookup', {}):
-                print("\n" + "="*80)
-                print("v0.4.0 OPTIMIZATION METRICS")
-                print("="*80)
-                for op in ['domain_lookup', 'url_lookup', 'ip_lookup']:
-                    if op in v4_results and 'hot_hit_rate' in v4_results[op]:
-                        rate = v4_results[op]['hot_hit_rate']
-                        print(f"{op.replace('_', ' ').title():<25} Hot source hit rate: {rate:.1f}%")
+        if 'hot_hit_rate' in self.results.get(('v0.4.0', 'domain_lookup'), {}):
+            print("\n" + "="*80)
+            print("v0.4.0 OPTIMIZATION METRICS")
+            print("="*80)
+            for op in ['domain_lookup', 'domain_lookup_zipf', 'url_lookup', 'url_lookup_zipf',
+                       'ip_lookup', 'ip_lookup_zipf']:
+                result = self.results.get(('v0.4.0', op), {})
+                if 'hot_hit_rate' in result:
+                    rate = result['hot_hit_rate']
+                    print(f"{op.replace('_', ' ').title():<25} Hot source hit rate: {rate:.1f}%")
 
         print("\n" + "="*80 + "\n")
 
@@ -172,32 +192,61 @@ class BenchmarkResults:
 class BenchmarkData:
     """Generate realistic benchmark data matching production distribution."""
 
+    # Dedicated, fixed-seed RNG so every run generates the same data set
+    rng = random.Random(BENCHMARK_SEED)
+
+    TLDS = ['com', 'net', 'org', 'ru', 'cn', 'info']
+    CIDR_PREFIXES = [24, 16, 8]
+
+    @staticmethod
+    def _random_labels(count, length):
+        """Generate ``count`` random lowercase labels from a single RNG draw."""
+        letters = ''.join(BenchmarkData.rng.choices(string.ascii_lowercase, k=count * length))
+        return [letters[i:i + length] for i in range(0, count * length, length)]
+
+    @staticmethod
+    def random_domains(count, length=10):
+        """Generate ``count`` random domain names."""
+        names = BenchmarkData._random_labels(count, length)
+        tlds = BenchmarkData.rng.choices(BenchmarkData.TLDS, k=count)
+        return [f"{name}.{tld}" for name, tld in zip(names, tlds)]
+
     @staticmethod
-    def random_domain(length=10):
-        """Generate random domain name."""
-        name = ''.join(random.choices(string.ascii_lowercase, k=length))
-        tld = random.choice(['com', 'net', 'org', 'ru', 'cn', 'info'])
-        return f"{name}.{tld}"
+    def random_urls(count):
+        """Generate ``count`` random URLs on random domains."""
+        domains = BenchmarkData.random_domains(count)
+        paths = BenchmarkData._random_labels(count, 8)
+        return [f"http://{domain}/{path}" for domain, path in zip(domains, paths)]
 
     @staticmethod
-    def random_url(domain=None):
-        """Generate random URL."""
-        if domain is None:
-            domain = BenchmarkData.random_domain()
-        path = ''.join(random.choices(string.ascii_lowercase, k=8))
-        return f"http://{domain}/{path}"
+    def random_ips(count):
+        """Generate ``count`` random IPv4 addresses."""
+        octets = (
+            BenchmarkData.rng.choices(range(1, 256), k=count),
+            BenchmarkData.rng.choices(range(0, 256), k=count),
+            BenchmarkData.rng.choices(range(0, 256), k=count),
+            BenchmarkData.rng.choices(range(1, 255), k=count),
+        )
+        return [f"{a}.{b}.{c}.{d}" for a, b, c, d in zip(*octets)]
 
     @staticmethod
-    def random_ip():
-        """Generate random IPv4 address."""
-        return f"{random.randint(1, 255)}.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+    def random_cidrs(count):
+        """Generate ``count`` random CIDR ranges."""
+        ips = BenchmarkData.random_ips(count)
+        prefixes = BenchmarkData.rng.choices(BenchmarkData.CIDR_PREFIXES, k=count)
+        return [f"{ip}/{prefix}" for ip, prefix in zip(ips, prefixes)]
 
     @staticmethod
-    def random_cidr():
-        """Generate random CIDR range."""
-        ip = BenchmarkData.random_ip()
-        prefix = random.choice([24, 16, 8])
-        return f"{ip}/{prefix}"
+    def _unique_values(generate, count, seen):
+        """Draw ``count`` values from ``generate`` that are not already in ``seen``."""
+        values = []
+        while len(values) < count:
+            # Redraw only the shortfall left by collisions
+            for value in generate(count - len(values)):
+                if value not in seen:
+                    seen.add(value)
+                    values.append(value)
+        return values
 
     @staticmethod
     def generate_production_like_data(total_entries=10000):
@@ -213,12 +262,13 @@ class BenchmarkData:
         - EmergingThreats: 25K IPs (6%)
         - SpamhausDROP: 12K IPs (3%)
         - OpenPhish: 4K URLs (1%)
+
+        Each data type is returned column-wise:
+        ``{'values': [...], 'dates': [...], 'confidences': [...], 'sources': [...]}``
         """
         data = {
-            'domains': [],
-            'urls': [],
-            'ips': [],
-            'cidrs': []
+            data_key: {'values': [], 'dates': [], 'confidences': [], 'sources': []}
+            for data_key in ('domains', 'urls', 'ips', 'cidrs')
         }
 
         # Distribution based on production data (normalized to total_entries)
@@ -234,162 +284,162 @@ class BenchmarkData:
             ('OpenPhish', 'url', 0.01),      # 4K/449K
         ]
 
+        generators = {
+            'domain': ('domains', BenchmarkData.random_domains),
+            'url': ('urls', BenchmarkData.random_urls),
+            'ip': ('ips', BenchmarkData.random_ips),
+            'cidr': ('cidrs', BenchmarkData.random_cidrs),
+        }
+
+        # Share one interned string per date/source across all generated entries
+        date_added = sys.intern('2025-01-01')
+        sources = {source: sys.intern(source) for source, _, _ in distributions}
+
+        # Values already generated per data key, so no entry is duplicated
+        seen = {data_key: set() for data_key in data}
+
         for source, data_type, ratio in distributions:
             count = int(total_entries * ratio)
+            data_key, generate = generators[data_type]
+            source = sources[source]
 
-            for _ in range(count):
-                entry = {
-                    'source': source,
-                    'date_added': '2025-01-01',
-                    'confidence': random.uniform(7.0, 10.0)
-                }
-
-                if data_type == 'domain':
-                    entry['value'] = BenchmarkData.random_domain()
-                    data['domains'].append(entry)
-                elif data_type == 'url':
-                    entry['value'] = BenchmarkData.random_url()
-                    data['urls'].append(entry)
-                elif data_type == 'ip':
-                    entry['value'] = BenchmarkData.random_ip()
-                    data['ips'].append(entry)
-                elif data_type == 'cidr':
-                    entry['value'] = BenchmarkData.random_cidr()
-                    data['cidrs'].append(entry)
+            # Draw every value and confidence for this source in bulk
+            values = BenchmarkData._unique_values(generate, count, seen[data_key])
+            confidences = [BenchmarkData.rng.uniform(7.0, 10.0) for _ in range(count)]
+
+            columns = data[data_key]
+            columns['values'].extend(values)
+            columns['dates'].extend([date_added] * count)
+            columns['confidences'].extend(confidences)
+            columns['sources'].extend([source] * count)
 
         return data
 
 
+# (operation, label, data key, storage method) for each timed lookup type
+LOOKUP_TYPES = [
+    ('domain_lookup', 'Domain lookup', 'domains', 'is_domain_blacklisted'),
+    ('url_lookup', 'URL lookup', 'urls', 'is_url_blacklisted'),
+    ('ip_lookup', 'IP lookup', 'ips', 'is_ip_blacklisted'),
+]
+
+
 class StorageBenchmark:
     """Benchmark a storage implementation."""
 
-    def __init__(self, storage, version_name: str):
+    def __init__(self, storage, version_name: str, rng: random.Random = None):
         self.storage = storage
         self.version = version_name
+        # Each version gets its own identically seeded RNG so all of them
+        # sample the same lookup keys
+        self.rng = rng if rng is not None else random.Random(BENCHMARK_SEED)
         self.results = BenchmarkResults()
 
-    def load_data(self, data: Dict[str, List[Dict]]):
+    def _hit_counts(self) -> Tuple[int, int]:
+        """Cumulative (hot, cold) source hits for storages that report metrics."""
+        get_metrics = getattr(self.storage, 'get_metrics', None)
+        if get_metrics is None:
+            return (0, 0)
+        storage_metrics = get_metrics()
+        return storage_metrics.get('hot_source_hits', 0), storage_metrics.get('cold_source_hits', 0)
+
+    def _hot_rate(self, since: Tuple[int, int] = (0, 0)) -> Dict[str, float]:
+        """Hot-source hit rate (percent of hits) since a ``_hit_counts()`` snapshot."""
+        hot, cold = self._hit_counts()
+        hot -= since[0]
+        cold -= since[1]
+        if hot + cold == 0:
+            return {}
+        return {'hot_hit_rate': (hot / (hot + cold)) * 100}
+
+    def _time_lookups(self, operation: str, label: str, lookup, keys: Tuple[str, ...]):
+        """
+        Time ``lookup`` over ``keys`` as warm-up, steady-state and Zipf phases.
+
+        The first 10% of the keys are looked up untimed so first-touch costs
+        (e.g. v1 cache fills) stay out of the steady-state number, which is
+        recorded as ``operation``. A second pass draws the same keys with a
+        Zipf distribution to mimic skewed real traffic (``<operation>_zipf``).
+        """
+        split = len(keys) // 10
+        for value in keys[:split]:
+            lookup(value)
+
+        measured = keys[split:]
+        since = self._hit_counts()
+        start = time.perf_counter_ns()
+        for value in measured:
+            lookup(value)
+        elapsed_ms = (time.perf_counter_ns() - start) / len(measured) / 1e6
+        self.results.add_result(self.version, operation, elapsed_ms, **self._hot_rate(since))
+        print(f"    {label}: {elapsed_ms:.4f}ms")
+
+        weights = [1 / rank for rank in range(1, len(keys) + 1)]
+        zipf_keys = tuple(self.rng.choices(keys, weights=weights, k=len(keys)))
+        since = self._hit_counts()
+        start = time.perf_counter_ns()
+        for value in zipf_keys:
+            lookup(value)
+        elapsed_ms = (time.perf_counter_ns() - start) / len(zipf_keys) / 1e6
+        self.results.add_result(self.version, f'{operation}_zipf', elapsed_ms, **self._hot_rate(since))
+        print(f"    {label} (Zipf): {elapsed_ms:.4f}ms")
+
+    def load_data(self, data: Dict[str, Dict[str, List]]):
         """Load test data into storage."""
-        print(f"  Loading {sum(len(v) for v in data.values())} entries into {self.version}...", end=" ", flush=True)
-        start = time.perf_counter()
-
-        for domain_entry in data['domains']:
-            self.storage.add_domain(
-                domain_entry['value'],
-                domain_entry['date_added'],
-                domain_entry['confidence'],
-                domain_entry['source']
-            )
-
-        for url_entry in data['urls']:
-            self.storage.add_url(
-                url_entry['value'],
-                url_entry['date_added'],
-                url_entry['confidence'],
-                url_entry['source']
-            )
-
-        for ip_entry in data['ips']:
-            self.storage.add_ip(
-                ip_entry['value'],
-                ip_entry['date_added'],
-                ip_entry['confidence'],
-                ip_entry['source']
-            )
-
-        for cidr_entry in data['cidrs']:
-            self.storage.add_ip(
-                cidr_entry['value'],
-                cidr_entry['date_added'],
-                cidr_entry['confidence'],
-                cidr_entry['source']
-            )
-
-        elapsed = time.perf_counter() - start
-        print(f"Done in {elapsed:.2f}s")
-        self.results.add_result(self.version, 'data_load', elapsed * 1000)
-
-    def benchmark_lookups(self, data: Dict[str, List[Dict]], iterations=1000):
+        print(f"  Loading {sum(len(c['values']) for c in data.values())} entries into {self.version}...", end=" ", flush=True)
+        start = time.perf_counter_ns()
+
+        # Zip each type's columns into rows for the batch API (one
+        # executemany transaction per type)
+        for data_key, add_many in (
+            ('domains', self.storage.add_domains),
+            ('urls', self.storage.add_urls),
+            ('ips', self.storage.add_ips),
+            ('cidrs', self.storage.add_ips),
+        ):
+            columns = data[data_key]
+            if not columns['values']:
+                continue
+            # Intern sources so the storage metadata shares one string per source
+            sources = [sys.intern(source) for source in columns['sources']]
+            add_many(list(zip(columns['values'], columns['dates'], columns['confidences'], sources)))
+
+        elapsed_ms = (time.perf_counter_ns() - start) / 1e6
+        print(f"Done in {elapsed_ms / 1000:.2f}s")
+        self.results.add_result(self.version, 'data_load', elapsed_ms)
+
+    def benchmark_lookups(self, data: Dict[str, Dict[str, List]], iterations=1000):
         """Benchmark lookup operations."""
         print(f"  Running {iterations} lookup iterations for {self.version}...")
 
-        # Domain lookups
-        if data['domains']:
-            test_domains = random.sample(data['domains'], min(iterations, len(data['domains'])))
-            start = time.perf_counter()
-            for entry in test_domains:
-                self.storage.is_domain_blacklisted(entry['value'])
-            elapsed = (time.perf_counter() - start) / len(test_domains)
-
-            metrics = {}
-            if isinstance(self.storage, StorageV2):
-                storage_metrics = self.storage.get_metrics()
-                if 'hot_source_hits' in storage_metrics and 'cold_source_hits' in storage_metrics:
-                    total_hits = storage_metrics['hot_source_hits'] + storage_metrics['cold_source_hits']
-                    if total_hits > 0:
-                        metrics['hot_hit_rate'] = (storage_metrics['hot_source_hits'] / total_hits) * 100
-
-            self.results.add_result(self.version, 'domain_lookup', elapsed * 1000, **metrics)
-            print(f"    Domain lookup: {elapsed * 1000:.4f}ms")
-
-        # URL lookups
-        if data['urls']:
-            test_urls = random.sample(data['urls'], min(iterations, len(data['urls'])))
-            start = time.perf_counter()
-            for entry in test_urls:
-                self.storage.is_url_blacklisted(entry['value'])
-            elapsed = (time.perf_counter() - start) / len(test_urls)
-
-            metrics = {}
-            if isinstance(self.storage, StorageV2):
-                storage_metrics = self.storage.get_metrics()
-                if 'hot_source_hits' in storage_metrics and 'cold_source_hits' in storage_metrics:
-                    total_hits = storage_metrics['hot_source_hits'] + storage_metrics['cold_source_hits']
-                    if total_hits > 0:
-                        metrics['hot_hit_rate'] = (storage_metrics['hot_source_hits'] / total_hits) * 100
-
-            self.results.add_result(self.version, 'url_lookup', elapsed * 1000, **metrics)
-            print(f"    URL lookup: {elapsed * 1000:.4f}ms")
-
-        # IP lookups
-        if data['ips']:
-            test_ips = random.sample(data['ips'], min(iterations, len(data['ips'])))
-            start = time.perf_counter()
-            for entry in test_ips:
-                self.storage.is_ip_blacklisted(entry['value'])
-            elapsed = (time.perf_counter() - start) / len(test_ips)
-
-            metrics = {}
-            if isinstance(self.storage, StorageV2):
-                storage_metrics = self.storage.get_metrics()
-                if 'hot_source_hits' in storage_metrics and 'cold_source_hits' in storage_metrics:
-                    total_hits = storage_metrics['hot_source_hits'] + storage_metrics['cold_source_hits']
-                    if total_hits > 0:
-                        metrics['hot_hit_rate'] = (storage_metrics['hot_source_hits'] / total_hits) * 100
-
-            self.results.add_result(self.version, 'ip_lookup', elapsed * 1000, **metrics)
-            print(f"    IP lookup: {elapsed * 1000:.4f}ms")
+        for operation, label, data_key, method_name in LOOKUP_TYPES:
+            values = data[data_key]['values']
+            if not values:
+                continue
+            keys = tuple(self.rng.sample(values, min(iterations, len(values))))
+            self._time_lookups(operation, label, getattr(self.storage, method_name), keys)
 
         # CIDR lookups (IP in range)
-        if data['cidrs'] and data['ips']:
-            test_ips = random.sample(data['ips'], min(iterations, len(data['ips'])))
-            start = time.perf_counter()
-            for entry in test_ips:
-                self.storage.is_ip_blacklisted(entry['value'])  # Will check CIDR ranges too
-            elapsed = (time.perf_counter() - start) / len(test_ips)
-            self.results.add_result(self.version, 'cidr_lookup', elapsed * 1000)
-            print(f"    CIDR lookup: {elapsed * 1000:.4f}ms")
+        ips = data['ips']['values']
+        if data['cidrs']['values'] and ips:
+            test_ips = tuple(self.rng.sample(ips, min(iterations, len(ips))))
+            probe = self.storage.is_ip_blacklisted  # Will check CIDR ranges too
+            start = time.perf_counter_ns()
+            for value in test_ips:
+                probe(value)
+            elapsed_ms = (time.perf_counter_ns() - start) / len(test_ips) / 1e6
+            self.results.add_result(self.version, 'cidr_lookup', elapsed_ms)
+            print(f"    CIDR lookup: {elapsed_ms:.4f}ms")
 
         # Batch lookups
-        if data['ips']:
+        if ips:
             batch_size = 100
-            test_batch = random.sample(data['ips'], min(batch_size, len(data['ips'])))
-            start = time.perf_counter()
-            for entry in test_batch:
-                self.storage.is_ip_blacklisted(entry['value'])
-            elapsed = time.perf_counter() - start
-            self.results.add_result(self.version, f'batch_{batch_size}', elapsed * 1000)
-            print(f"    Batch {batch_size} items: {elapsed * 1000:.2f}ms")
+            test_batch = self.rng.sample(ips, min(batch_size, len(ips)))
+            start = time.perf_counter_ns()
+            self.storage.is_ip_blacklisted_many(test_batch)
+            elapsed_ms = (time.perf_counter_ns() - start) / 1e6
+            self.results.add_result(self.version, f'batch_{batch_size}', elapsed_ms)
+            print(f"    Batch {batch_size} items: {elapsed_ms:.2f}ms")
 
     def benchmark_memory(self):
         """Estimate memory usage."""
@@ -406,6 +456,39 @@ class StorageBenchmark:
             print(f"    Memory profiling skipped (psutil not installed)")
 
 
+# (version key, description, CLI flag) for each benchmarked storage version
+VERSIONS = [
+    ('v1', 'Database Storage', 'v1'),
+    ('v0.3.0', 'Hybrid Storage', 'v2'),
+    ('v0.4.0', 'Optimized Hybrid Storage', 'v2opt'),
+]
+
+
+def _storage_class(version_key: str):
+    """Storage implementation used for a benchmarked version."""
+    return StorageV1 if version_key == 'v1' else StorageV2
+
+
+def _run_one(version_key: str, data: Dict[str, Dict[str, List]], iterations: int,
+             measure_memory: bool, db_path: str, queue):
+    """Benchmark one storage version (in a child process) and put its results on ``queue``."""
+    try:
+        storage = _storage_class(version_key)(db_path)
+        bench = StorageBenchmark(storage, version_key)
+        bench.load_data(data)
+        bench.benchmark_lookups(data, iterations)
+        if measure_memory:
+            bench.benchmark_memory()
+        queue.put(bench.results)
+    finally:
+        # Clean up database files
+        for ext in ['', '-shm', '-wal']:
+            try:
+                os.unlink(db_path + ext)
+            except OSError:
+                pass
+
+
 def run_benchmark(args):
     """Run complete benchmark suite."""
     print("\n" + "="*80)
@@ -429,127 +512,63 @@ def run_benchmark(args):
     # Generate test data
     print(f"\nGenerating {data_size} test entries with production-like distribution...")
     data = BenchmarkData.generate_production_like_data(data_size)
-    print(f"  Domains: {len(data['domains'])}")
-    print(f"  URLs: {len(data['urls'])}")
-    print(f"  IPs: {len(data['ips'])}")
-    print(f"  CIDRs: {len(data['cidrs'])}")
+    print(f"  Domains: {len(data['domains']['values'])}")
+    print(f"  URLs: {len(data['urls']['values'])}")
+    print(f"  IPs: {len(data['ips']['values'])}")
+    print(f"  CIDRs: {len(data['cidrs']['values'])}")
 
     all_results = BenchmarkResults()
 
-    # Benchmark v1 (original database storage)
-    if args.all or args.v1:
-        if StorageV1 is None:
-            print("\n" + "-"*80)
-            print("SKIPPING v1 (Database Storage) - Could not import")
-            print("-"*80)
-        else:
+    # One scratch directory for all version databases, removed on exit
+    scratch_dir = tempfile.mkdtemp(prefix='sec_mcp_bench_')
+    atexit.register(shutil.rmtree, scratch_dir, ignore_errors=True)
+
+    # Run each version in its own process so its memory usage is isolated.
+    # Versions share nothing, so with --parallel all of them run at once.
+    running = []
+    for version_key, label, flag in VERSIONS:
+        if not (args.all or getattr(args, flag)):
+            continue
+        if _storage_class(version_key) is None:
             print("\n" + "-"*80)
-            print("BENCHMARKING v1 (Database Storage)")
+            print(f"SKIPPING {version_key} ({label}) - Could not import")
             print("-"*80)
-            # Use current directory with unique filename to avoid permission issues
-            import uuid
-            db_name = f'benchmark_v1_{uuid.uuid4().hex[:8]}.db'
-            tmp_path = os.path.join(os.getcwd(), db_name)
-            try:
-                storage_v1 = StorageV1(tmp_path)
-                bench_v1 = StorageBenchmark(storage_v1, 'v1')
-                bench_v1.load_data(data)
-                bench_v1.benchmark_lookups(data, iterations)
-                if args.memory:
-                    bench_v1.benchmark_memory()
-
-                # Merge results
-                for version, results in bench_v1.results.results.items():
-                    all_results.results[version] = results
-            finally:
-                try:
-                    # Clean up database files
-                    for ext in ['', '-shm', '-wal']:
-                        try:
-                            os.unlink(tmp_path + ext)
-                        except:
-                            pass
-                except:
-                    pass
-
-    # Benchmark v0.3.0 (hybrid storage)
-    if args.all or args.v2:
-        if StorageV2 is None:
-            print("\n" + "-"*80)
-            print("SKIPPING v0.3.0 (Hybrid Storage) - Could not import")
-            print("-"*80)
-        else:
-            print("\n" + "-"*80)
-            print("BENCHMARKING v0.3.0 (Hybrid Storage)")
-            print("-"*80)
-            # Use current directory with unique filename to avoid permission issues
-            import uuid
-            db_name = f'benchmark_v2_{uuid.uuid4().hex[:8]}.db'
-            tmp_path = os.path.join(os.getcwd(), db_name)
-            try:
-                storage_v2 = StorageV2(tmp_path)
-                bench_v2 = StorageBenchmark(storage_v2, 'v0.3.0')
-                bench_v2.load_data(data)
-                bench_v2.benchmark_lookups(data, iterations)
-                if args.memory:
-                    bench_v2.benchmark_memory()
-
-                # Merge results
-                for version, results in bench_v2.results.results.items():
-                    all_results.results[version] = results
-            finally:
-                try:
-                    # Clean up database files
-                    for ext in ['', '-shm', '-wal']:
-                        try:
-                            os.unlink(tmp_path + ext)
-                        except:
-                            pass
-                except:
-                    pass
-
-    # Benchmark v0.4.0 (optimized hybrid storage)
-    if args.all or args.v2opt:
-        if StorageV2 is None:
-            print("\n" + "-"*80)
-            print("SKIPPING v0.4.0 (Optimized Hybrid Storage) - Could not import")
-            print("-"*80)
-        else:
-            print("\n" + "-"*80)
-            print("BENCHMARKING v0.4.0 (Optimized Hybrid Storage)")
-            print("-"*80)
-            # Use current directory with unique filename to avoid permission issues
-            import uuid
-            db_name = f'benchmark_v2opt_{uuid.uuid4().hex[:8]}.db'
-            tmp_path = os.path.join(os.getcwd(), db_name)
-            try:
-                storage_v2opt = StorageV2(tmp_path)
-                bench_v2opt = StorageBenchmark(storage_v2opt, 'v0.4.0')
-                bench_v2opt.load_data(data)
-                bench_v2opt.benchmark_lookups(data, iterations)
-                if args.memory:
-                    bench_v2opt.benchmark_memory()
-
-                # Merge results
-                for version, results in bench_v2opt.results.results.items():
-                    all_results.results[version] = results
-            finally:
-                try:
-                    # Clean up database files
-                    for ext in ['', '-shm', '-wal']:
-                        try:
-                            os.unlink(tmp_path + ext)
-                        except:
-                            pass
-                except:
-                    pass
+            continue
+
+        print("\n" + "-"*80)
+        print(f"BENCHMARKING {version_key} ({label})")
+        print("-"*80, flush=True)
+        tmp_path = os.path.join(scratch_dir, f'benchmark_{flag}.db')
+
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_run_one,
+            args=(version_key, data, iterations, args.memory, tmp_path, queue)
+        )
+        process.start()
+        running.append((version_key, process, queue))
+        if not args.parallel:
+            process.join()
+
+    for version_key, process, queue in running:
+        process.join()
+        if process.exitcode != 0:
+            print(f"  {version_key} benchmark failed (exit code {process.exitcode})")
+            continue
+
+        # Merge results
+        all_results.merge(queue.get())
 
     # Print comparison
     all_results.print_comparison()
 
     # Save results to file
-    output_file = 'benchmark_results.txt'
-    print(f"Results saved to: {output_file}")
+    all_results.meta = {'data_size': data_size, 'iterations': iterations}
+    json_file = Path('benchmark_results.json')
+    json_file.write_text(all_results.to_json())
+    csv_file = Path('benchmark_results.csv')
+    all_results.write_csv(csv_file)
+    print(f"Results saved to: {json_file}, {csv_file}")
 
 
 def main():
@@ -566,6 +585,7 @@ Examples:
   python benchmark.py --full --memory      # Full test with memory profiling
   python benchmark.py --all                # Compare all versions
   python benchmark.py --v2 --v2opt         # Compare only v0.3.0 and v0.4.0
+  python benchmark.py --all --parallel     # Run all versions at the same time
         """
     )
 
@@ -588,6 +608,8 @@ Examples:
     # Additional options
     parser.add_argument('--memory', action='store_true',
                         help='Include memory profiling (requires psutil)')
+    parser.add_argument('--parallel', action='store_true',
+                        help='Run the selected versions concurrently (faster, but they compete for CPU)')
 
     args = parser.parse_args()
 
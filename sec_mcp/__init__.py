@@ -4,7 +4,7 @@ MCP Client - A Python library and CLI for checking domains, URLs, and IPs agains
 
 from .sec_mcp import SecMCP, CheckResult, StatusInfo
 from .cli import cli
-from .utility import validate_input, setup_logging
+from .utility import validate_input, validate_inputs, setup_logging
 
 __version__ = "0.2.7"
-__all__ = ['SecMCP', 'CheckResult', 'StatusInfo', 'cli', 'validate_input', 'setup_logging']
+__all__ = ['SecMCP', 'CheckResult', 'StatusInfo', 'cli', 'validate_input', 'validate_inputs', 'setup_logging']
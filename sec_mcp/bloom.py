@@ -0,0 +1,372 @@
+"""Compact membership structures for blacklist storage.
+
+BloomFilter/ScalableBloomFilter answer "definitely not stored" without a
+database query; FingerprintSet answers exact membership in one 8-byte slot
+per value. NetworkSet answers whether an address lies in any stored CIDR
+range with one binary search, and PrefixMap finds the value stored for the
+most specific range holding it.
+"""
+
+import hashlib
+import math
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List
+
+# Bits per block: all probes for one value land in a single 64-byte cache line
+BLOCK_BITS = 512
+BLOCK_BYTES = BLOCK_BITS // 8
+
+_MISSING = object()
+
+
+class BloomFilter:
+    """Fixed-size blocked Bloom filter over strings.
+
+    Membership tests never return false negatives, so a miss means the value
+    is definitely not stored and the database lookup can be skipped. Hits are
+    only "maybe" and must be confirmed against the backing store.
+
+    Each value hashes to one 512-bit block and sets all of its bits inside
+    that block, so a lookup touches one cache line instead of ``num_hashes``
+    scattered ones.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        # Optimal bit count and hash count for the requested false-positive rate,
+        # rounded up to whole blocks
+        num_bits = -self.capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.num_blocks = max(math.ceil(num_bits / BLOCK_BITS), 1)
+        self.num_bits = self.num_blocks * BLOCK_BITS
+        # One 128-bit digest supplies the block index (32 bits) and 9 bits per probe
+        self.num_hashes = min(max(int(round(num_bits / self.capacity * math.log(2))), 1), 10)
+        self._bits = bytearray(self.num_blocks * BLOCK_BYTES)
+        self._count = 0
+
+    def _locate(self, value: str):
+        """Return the byte offset of the value's block and its bit mask within it."""
+        h = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest(), "little")
+        offset = ((h & 0xFFFFFFFF) % self.num_blocks) * BLOCK_BYTES
+        h >>= 32
+        mask = 0
+        for _ in range(self.num_hashes):
+            mask |= 1 << (h & 0x1FF)
+            h >>= 9
+        return offset, mask
+
+    def add(self, value: str):
+        """Add a value to the filter."""
+        offset, mask = self._locate(value)
+        end = offset + BLOCK_BYTES
+        block = int.from_bytes(self._bits[offset:end], "little") | mask
+        self._bits[offset:end] = block.to_bytes(BLOCK_BYTES, "little")
+        self._count += 1
+
+    def update(self, values: Iterable[str]):
+        """Add every value from an iterable."""
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value: str) -> bool:
+        offset, mask = self._locate(value)
+        return int.from_bytes(self._bits[offset:offset + BLOCK_BYTES], "little") & mask == mask
+
+    def contains_many(self, values: Iterable[str]) -> List[bool]:
+        """Test many values at once, with the hashing loop kept free of attribute lookups."""
+        bits = self._bits
+        num_blocks = self.num_blocks
+        num_hashes = self.num_hashes
+        blake2b = hashlib.blake2b
+        from_bytes = int.from_bytes
+        results = []
+        append = results.append
+        for value in values:
+            h = from_bytes(blake2b(value.encode("utf-8"), digest_size=16).digest(), "little")
+            offset = ((h & 0xFFFFFFFF) % num_blocks) * BLOCK_BYTES
+            h >>= 32
+            mask = 0
+            for _ in range(num_hashes):
+                mask |= 1 << (h & 0x1FF)
+                h >>= 9
+            append(from_bytes(bits[offset:offset + BLOCK_BYTES], "little") & mask == mask)
+        return results
+
+    def __len__(self) -> int:
+        """Number of add() calls (duplicates included)."""
+        return self._count
+
+    @property
+    def is_full(self) -> bool:
+        """Whether the filter holds more values than it was sized for."""
+        return self._count > self.capacity
+
+
+class ScalableBloomFilter:
+    """Bloom filter that grows by adding stages instead of being rebuilt.
+
+    When the newest stage reaches its capacity a new stage twice as large is
+    started, so inserts never require rescanning the stored values. Each new
+    stage uses half the previous error rate, keeping the overall false-positive
+    rate bounded by roughly twice the initial one.
+    """
+
+    def __init__(self, initial_capacity: int = 100_000, error_rate: float = 0.001):
+        self.error_rate = error_rate
+        self._stages = [BloomFilter(initial_capacity, error_rate / 2)]
+
+    def add(self, value: str):
+        """Add a value, starting a new stage if the current one is full."""
+        stage = self._stages[-1]
+        if stage.is_full:
+            stage = BloomFilter(stage.capacity * 2, stage.error_rate / 2)
+            self._stages.append(stage)
+        stage.add(value)
+
+    def update(self, values: Iterable[str]):
+        """Add every value from an iterable."""
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value: str) -> bool:
+        return any(value in stage for stage in self._stages)
+
+    def contains_many(self, values: Iterable[str]) -> List[bool]:
+        """Test many values at once."""
+        values = list(values)
+        stages = self._stages
+        results = stages[0].contains_many(values)
+        for stage in stages[1:]:
+            results = [hit or stage_hit for hit, stage_hit in zip(results, stage.contains_many(values))]
+        return results
+
+    def __len__(self) -> int:
+        """Number of add() calls (duplicates included)."""
+        return sum(len(stage) for stage in self._stages)
+
+
+# Fingerprint 0 marks an empty FingerprintSet slot
+FINGERPRINT_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+def fingerprint(value: str) -> int:
+    """Return a non-zero 64-bit fingerprint of a value.
+
+    This is the interpreter's string hash (SipHash), which CPython caches on
+    the str object. It is randomized per process, so fingerprints must not be
+    persisted or shared between processes.
+    """
+    return (hash(value) & FINGERPRINT_MASK) or 1
+
+
+class FingerprintSet:
+    """Compact set of strings stored as 64-bit fingerprints in an open-addressing table.
+
+    Each member costs one 8-byte slot (the table is kept at most 3/4 full)
+    instead of a full ``str`` object. Lookups use linear probing and usually
+    touch a single slot. Distinct values collide with probability about
+    ``len(self) / 2**64`` per query, which is negligible for blacklist sizes.
+    """
+
+    MAX_LOAD = 0.75
+
+    def __init__(self, values: Iterable[str] = ()):
+        fps = {fingerprint(value) for value in values}
+        self._resize(len(fps))
+        self._insert_many(fps)
+
+    def _resize(self, count: int):
+        """Allocate an empty table big enough for count members and reinsert the current ones."""
+        size = 16
+        while size * self.MAX_LOAD < count + 1:
+            size *= 2
+        old = getattr(self, "_table", ())
+        self._table = array("Q", bytes(8 * size))
+        self._mask = size - 1
+        self._count = 0
+        self._insert_many(fp for fp in old if fp)
+
+    def _slot(self, fp: int) -> int:
+        """Return the slot holding fp, or the empty slot where it would go."""
+        table = self._table
+        mask = self._mask
+        i = fp & mask
+        while True:
+            current = table[i]
+            if current == fp or not current:
+                return i
+            i = (i + 1) & mask
+
+    def _insert(self, fp: int):
+        i = self._slot(fp)
+        if not self._table[i]:
+            self._table[i] = fp
+            self._count += 1
+
+    def _insert_many(self, fps: Iterable[int]):
+        """Insert fingerprints into a table already sized for them (probing inlined)."""
+        table = self._table
+        mask = self._mask
+        count = self._count
+        for fp in fps:
+            i = fp & mask
+            while True:
+                current = table[i]
+                if not current:
+                    table[i] = fp
+                    count += 1
+                    break
+                if current == fp:
+                    break
+                i = (i + 1) & mask
+        self._count = count
+
+    def add(self, value: str):
+        """Add a value."""
+        if (self._count + 1) > len(self._table) * self.MAX_LOAD:
+            self._resize(self._count * 2)
+        self._insert(fingerprint(value))
+
+    def update(self, values: Iterable[str]):
+        """Add every value from an iterable, growing the table at most once."""
+        fps = {fingerprint(value) for value in values}
+        if (self._count + len(fps)) > len(self._table) * self.MAX_LOAD:
+            self._resize(self._count + len(fps))
+        self._insert_many(fps)
+
+    def discard(self, value: str):
+        """Remove a value if present (backward-shift deletion, so no tombstones are left)."""
+        table = self._table
+        mask = self._mask
+        i = self._slot(fingerprint(value))
+        if not table[i]:
+            return
+        j = i
+        while True:
+            j = (j + 1) & mask
+            fp = table[j]
+            if not fp:
+                break
+            home = fp & mask
+            # Move fp back into the hole unless its home slot lies cyclically in (i, j]
+            if (i < j and (home <= i or home > j)) or (i > j and home <= i and home > j):
+                table[i] = fp
+                i = j
+        table[i] = 0
+        self._count -= 1
+
+    def __contains__(self, value: str) -> bool:
+        fp = fingerprint(value)
+        return self._table[self._slot(fp)] == fp
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class NetworkSet:
+    """Union of IP networks held as sorted, disjoint integer ranges per IP version.
+
+    Overlapping and nested networks are merged, so membership is one
+    ``bisect`` over the range starts and one comparison with the matching
+    end, instead of an ``addr in network`` test per stored network. Changes
+    only mark the ranges stale; they are rebuilt by the next lookup.
+    """
+
+    def __init__(self, networks: Iterable = ()):
+        self._networks = list(networks)
+        self._ranges = {}
+        self._stale = True
+
+    def _build(self) -> dict:
+        """Merge the current networks into (starts, ends) lists keyed by IP version."""
+        # Cleared before the snapshot so a network added meanwhile marks the ranges stale again
+        self._stale = False
+        spans = {4: [], 6: []}
+        for network in list(self._networks):
+            spans[network.version].append((int(network.network_address), int(network.broadcast_address)))
+        ranges = {}
+        for version, pairs in spans.items():
+            starts, ends = [], []
+            for start, end in sorted(pairs):
+                if ends and start <= ends[-1] + 1:
+                    if end > ends[-1]:
+                        ends[-1] = end
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            ranges[version] = (starts, ends)
+        self._ranges = ranges
+        return ranges
+
+    def add(self, network):
+        self._networks.append(network)
+        self._stale = True
+
+    def update(self, networks: Iterable):
+        self._networks.extend(networks)
+        self._stale = True
+
+    def discard(self, network):
+        """Remove every copy of a network; ranges still covered by others stay members."""
+        self._networks = [n for n in self._networks if n != network]
+        self._stale = True
+
+    def contains_int(self, version: int, value: int) -> bool:
+        """Whether the address with this integer value and IP version is covered."""
+        ranges = self._build() if self._stale else self._ranges
+        starts, ends = ranges[version]
+        i = bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
+
+    def __contains__(self, addr) -> bool:
+        return self.contains_int(addr.version, int(addr))
+
+    def __iter__(self):
+        return iter(self._networks)
+
+    def __len__(self) -> int:
+        return len(self._networks)
+
+
+class PrefixMap:
+    """Longest-prefix match from IP networks to values, without a radix tree.
+
+    Networks are kept in one dict per (IP version, prefix length), keyed by
+    the network address as an integer. A lookup masks the address for each
+    stored prefix length, longest first, and probes that dict, so it costs
+    one probe per distinct prefix length (a few dozen at most) however many
+    networks are stored. Per-version table lists are replaced, never
+    mutated, so readers need no lock.
+    """
+
+    def __init__(self):
+        # IP version -> [(prefix length, mask, {network int: value})], longest prefix first
+        self._tables = {4: [], 6: []}
+
+    def __setitem__(self, network, value):
+        tables = self._tables[network.version]
+        key = int(network.network_address)
+        for prefixlen, _, entries in tables:
+            if prefixlen == network.prefixlen:
+                entries[key] = value
+                return
+        bits = network.max_prefixlen
+        mask = (1 << bits) - (1 << (bits - network.prefixlen))
+        self._tables[network.version] = sorted(
+            tables + [(network.prefixlen, mask, {key: value})], key=lambda table: table[0], reverse=True
+        )
+
+    def get_int(self, version: int, value: int, default=None):
+        """Value of the longest stored network holding the address with this integer value."""
+        for _, mask, entries in self._tables[version]:
+            found = entries.get(value & mask, _MISSING)
+            if found is not _MISSING:
+                return found
+        return default
+
+    def get(self, addr, default=None):
+        return self.get_int(addr.version, int(addr), default)
+
+    def __len__(self) -> int:
+        return sum(len(entries) for tables in self._tables.values() for _, _, entries in tables)
@@ -0,0 +1,116 @@
+"""Lookup caches shared by concurrent request threads."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator
+
+
+class StripedLRUCache:
+    """Bounded LRU set of strings split into independently locked stripes.
+
+    A value always maps to the same stripe (``hash(value) & (stripes - 1)``),
+    so threads looking up different values rarely wait on the same lock.
+    Each stripe evicts its own least recently used values once it holds more
+    than ``max_size / stripes`` of them.
+    """
+
+    def __init__(self, max_size: int = 50_000, stripes: int = 32):
+        if stripes < 1 or stripes & (stripes - 1):
+            raise ValueError("stripes must be a power of two")
+        self._mask = stripes - 1
+        self.stripe_size = max(max_size // stripes, 1)
+        self._stripes = [OrderedDict() for _ in range(stripes)]
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def get(self, value: str) -> bool:
+        """Return whether a value is cached, marking it most recently used."""
+        i = hash(value) & self._mask
+        stripe = self._stripes[i]
+        with self._locks[i]:
+            if value in stripe:
+                stripe.move_to_end(value)
+                return True
+        return False
+
+    def put(self, value: str):
+        """Cache a value, evicting its stripe's least recently used values if full."""
+        i = hash(value) & self._mask
+        stripe = self._stripes[i]
+        with self._locks[i]:
+            stripe[value] = None
+            stripe.move_to_end(value)
+            while len(stripe) > self.stripe_size:
+                stripe.popitem(last=False)
+
+    def discard(self, value: str):
+        """Remove a value if cached."""
+        i = hash(value) & self._mask
+        with self._locks[i]:
+            self._stripes[i].pop(value, None)
+
+    def clear(self):
+        """Remove every value."""
+        for lock, stripe in zip(self._locks, self._stripes):
+            with lock:
+                stripe.clear()
+
+    def __contains__(self, value: str) -> bool:
+        """Membership test that does not change recency."""
+        i = hash(value) & self._mask
+        with self._locks[i]:
+            return value in self._stripes[i]
+
+    def __len__(self) -> int:
+        return sum(len(stripe) for stripe in self._stripes)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over a snapshot of the cached values, stripe by stripe."""
+        for lock, stripe in zip(self._locks, self._stripes):
+            with lock:
+                values = list(stripe)
+            yield from values
+
+
+class TTLCache:
+    """Bounded mapping whose entries expire ttl seconds after they are stored.
+
+    Entries are kept in insertion order, so once more than max_size are held
+    the oldest are evicted first. One lock guards the whole map; it is meant
+    for request-level results, where each access is a single dict operation.
+    """
+
+    def __init__(self, max_size: int = 100_000, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()  # key -> (expiry, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value stored for key, or default if absent or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] <= time.monotonic():
+                del self._data[key]
+                return default
+            return item[1]
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value for ttl seconds, evicting the oldest entries if full."""
+        expiry = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expiry, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        """Number of stored entries, including any that have expired but not been evicted."""
+        return len(self._data)
@@ -1,8 +1,15 @@
 import click
 from .sec_mcp import SecMCP
 
-# Global SecMCP instance for CLI
-core = SecMCP()
+# SecMCP instance for CLI, created on first use so --help and --version stay cheap
+_core = None
+
+def get_core() -> SecMCP:
+    """Return the CLI's SecMCP instance (storage only, no update scheduler)."""
+    global _core
+    if _core is None:
+        _core = SecMCP(start_scheduler=False)
+    return _core
 
 @click.group()
 @click.version_option(version="0.2.7", message="%(version)s (MCP Client)")
@@ -16,11 +23,18 @@ def cli():
     """
     pass
 
-@cli.command(help="Check a single domain, URL, or IP against the blacklist.\n\nExample: mcp check https://example.com --json")
-@click.argument('value')
+@cli.command(help="Check a single domain, URL, or IP against the blacklist.\n\nExample: mcp check https://example.com --json\n\nWith --stdin, checks one value per line from standard input in a single batch.")
+@click.argument('value', required=False)
 @click.option('--json', is_flag=True, help='Output in JSON format')
-def check(value: str, json: bool):
-    result = core.check(value)
+@click.option('--stdin', 'from_stdin', is_flag=True, help='Read values (one per line) from standard input')
+def check(value: str, json: bool, from_stdin: bool):
+    if from_stdin:
+        values = [line.strip() for line in click.get_text_stream('stdin') if line.strip()]
+        _echo_batch(values, get_core().check_batch(values), json)
+        return
+    if value is None:
+        raise click.UsageError("Missing argument 'VALUE' (or use --stdin).")
+    result = get_core().check(value)
     if json:
         click.echo(result.to_json())
     else:
@@ -34,7 +48,7 @@ def check(value: str, json: bool):
 @click.argument('domain')
 @click.option('--json', is_flag=True, help='Output in JSON format')
 def check_domain(domain: str, json: bool):
-    result = core.check_domain(domain)
+    result = get_core().check_domain(domain)
     if json:
         click.echo(result.to_json())
     else:
@@ -48,7 +62,7 @@ def check_domain(domain: str, json: bool):
 @click.argument('url')
 @click.option('--json', is_flag=True, help='Output in JSON format')
 def check_url(url: str, json: bool):
-    result = core.check_url(url)
+    result = get_core().check_url(url)
     if json:
         click.echo(result.to_json())
     else:
@@ -62,7 +76,7 @@ def check_url(url: str, json: bool):
 @click.argument('ip')
 @click.option('--json', is_flag=True, help='Output in JSON format')
 def check_ip(ip: str, json: bool):
-    result = core.check_ip(ip)
+    result = get_core().check_ip(ip)
     if json:
         click.echo(result.to_json())
     else:
@@ -78,7 +92,10 @@ def check_ip(ip: str, json: bool):
 def batch(file: str, json: bool):
     with open(file) as f:
         values = [line.strip() for line in f if line.strip()]
-    results = core.check_batch(values)
+    _echo_batch(values, get_core().check_batch(values), json)
+
+def _echo_batch(values, results, json: bool):
+    """Print batch check results as JSON or per-value status lines."""
     if json:
         import json as _json
         click.echo(_json.dumps([r.to_json() for r in results], indent=2))
@@ -94,6 +111,7 @@ def batch(file: str, json: bool):
 @cli.command(help="Show blacklist status (entry count, last update, sources).\n\nExample: mcp status --json")
 @click.option('--json', is_flag=True, help='Output in JSON format')
 def status(json):
+    core = get_core()
     status = core.get_status()
     source_counts = core.storage.get_source_counts()
     source_type_counts = core.storage.get_source_type_counts()
@@ -125,7 +143,7 @@ def status(json):
 @click.option('--json', is_flag=True, help='Output minimal JSON confirmation')
 def update(json):
     """Force an immediate update of all blacklists."""
-    core.update()
+    get_core().update()
     if json:
         import json as _json
         click.echo(_json.dumps({"updated": True}))
@@ -135,7 +153,7 @@ def update(json):
 @cli.command(help="Clear the in-memory URL/IP cache.")
 @click.option('--json', is_flag=True, help='Output in JSON format')
 def flush_cache(json):
-    cleared = core.storage.flush_cache()
+    cleared = get_core().storage.flush_cache()
     if json:
         import json as _json
         click.echo(_json.dumps({"cleared": cleared}))
@@ -149,6 +167,6 @@ def flush_cache(json):
 @click.option('-n', '--count', default=10, help='Number of entries to sample')
 def sample(count: int):
     """Output a random sample of blacklist values for quick tests."""
-    entries = core.sample(count)
+    entries = get_core().sample(count)
     for value in entries:
         click.echo(value)
@@ -1,37 +1,87 @@
 from mcp.server.fastmcp import FastMCP
 import anyio
+import functools
+import json
 # import SecMCP for server logic
 from .sec_mcp import SecMCP
-from .utility import validate_input
+from .cache import TTLCache
+from .utility import validate_inputs
 from datetime import datetime
 from typing import List, Optional
 
 # Initialize FastMCP server
 mcp = FastMCP("mcp-blacklist")
 
-# Global SecMCP instance for MCP server
-core = SecMCP()
+# Recent check results by value, so clients re-checking the same hosts skip
+# the storage; cleared whenever entries change through add_entry/remove_entry,
+# and otherwise stale for at most RESULT_CACHE_TTL seconds after an update
+RESULT_CACHE_SIZE = 100_000
+RESULT_CACHE_TTL = 60.0
+_result_cache = TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+
+@functools.cache
+def get_core() -> SecMCP:
+    """Return the SecMCP instance shared by all tools, creating it on first use.
+
+    Building it opens the database and starts the update scheduler, so it is
+    deferred until the server actually starts instead of happening on import.
+    """
+    return SecMCP()
+
+
+def __getattr__(name):
+    # Keep `from sec_mcp.mcp_server import core` working
+    if name == "core":
+        return get_core()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ============================================================================
 # CORE TOOLS - Primary functionality
 # ============================================================================
 
-@mcp.tool(name="check_batch", description="Check multiple domains/URLs/IPs in one call. Returns list of {value, is_safe, explanation}.")
-async def check_batch(values: List[str]):
-    """Check multiple values against the blacklist in a single call."""
+def _check_batch(values: List[str]) -> list:
+    """Validate and check a batch synchronously (runs in a worker thread)."""
+    core = get_core()
+    valid = validate_inputs(values)
+    checked = {}
+    for value, ok in zip(values, valid):
+        if ok and value not in checked:
+            checked[value] = _result_cache.get(value)
+    # One check_batch call for every valid value not answered by the cache
+    misses = [value for value, res in checked.items() if res is None]
+    if misses:
+        for value, res in zip(misses, core.check_batch(misses)):
+            _result_cache.put(value, res)
+            checked[value] = res
     results = []
-    for value in values:
-        if not validate_input(value):
+    for value, ok in zip(values, valid):
+        if not ok:
             results.append({"value": value, "is_safe": False, "explanation": "Invalid input format."})
         else:
-            res = core.check(value)
+            res = checked[value]
             results.append({"value": value, "is_safe": not res.blacklisted, "explanation": res.explanation})
     return results
 
 
+def _check_batch_json(values: List[str]) -> str:
+    """Check a batch and encode the results as one compact JSON array."""
+    return json.dumps(_check_batch(values), separators=(",", ":"))
+
+
+@mcp.tool(name="check_batch", description="Check multiple domains/URLs/IPs in one call. Returns a JSON-encoded array of {value, is_safe, explanation}.")
+async def check_batch(values: List[str]) -> str:
+    """Check multiple values against the blacklist in a single call."""
+    # Offload to a worker thread so a large batch does not block other tool calls.
+    # The result is encoded there too: a returned list would be split by FastMCP
+    # into one content block per entry, each serialized on the event loop
+    return await anyio.to_thread.run_sync(_check_batch_json, values)
+
+
 @mcp.tool(name="get_status", description="Get blacklist status including entry counts and sources. Returns JSON: {entry_count, last_update, sources, server_status, source_counts}.")
 async def get_status():
     """Return current blacklist status, including per-source entry counts."""
+    core = get_core()
     status = core.get_status()
     source_counts = core.storage.get_source_counts()
     return {
@@ -43,12 +93,13 @@ async def get_status():
     }
 
 
-@mcp.tool(description="Force immediate update of all blacklists. Returns JSON: {updated: bool}.")
+@mcp.tool(description="Start an immediate update of all blacklists in the background. Returns JSON: {requested: bool}.")
 async def update_blacklists():
     """Trigger an immediate blacklist refresh."""
-    # Offload to thread to avoid nested event loops
-    await anyio.to_thread.run_sync(core.update)
-    return {"updated": True}
+    # The scheduler thread runs the update, so the call returns at once
+    # instead of holding a worker thread for the whole download
+    get_core().request_update()
+    return {"requested": True}
 
 
 # ============================================================================
@@ -67,6 +118,7 @@ async def get_diagnostics(mode: str = "summary", sample_count: int = 10):
     - performance: Performance metrics and hit rates (v2 only)
     - sample: Random sample of blacklist entries
     """
+    core = get_core()
 
     if mode == "health":
         # Health check
@@ -109,18 +161,15 @@ async def get_diagnostics(mode: str = "summary", sample_count: int = 10):
         }
 
     elif mode == "full":
-        # Full diagnostics - everything
-        total = core.storage.count_entries()
-        per_source = core.storage.get_source_counts()
-        last_updates = core.storage.get_last_update_per_source()
-        per_source_detail = core.storage.get_source_type_counts()
-
-        # Health
+        # Full diagnostics - everything, from one cached storage snapshot
+        snapshot = core.storage.get_diagnostics_snapshot()
+        total = snapshot["total_entries"]
+        per_source = snapshot["per_source"]
+        last_updates = snapshot["last_updates"]
+        per_source_detail = snapshot["per_source_detail"]
+
+        # Health (the snapshot itself was read from the database)
         db_ok = True
-        try:
-            core.storage.count_entries()
-        except Exception:
-            db_ok = False
 
         # Performance (if available)
         metrics = {}
@@ -161,13 +210,17 @@ async def get_diagnostics(mode: str = "summary", sample_count: int = 10):
 @mcp.tool(name="add_entry", description="Add a manual blacklist entry.")
 async def add_entry(url: str, ip: Optional[str] = None, date: Optional[str] = None, score: float = 8.0, source: str = "manual"):
     """Add a manual blacklist entry."""
+    core = get_core()
     ts = date or datetime.now().isoformat(sep=' ', timespec='seconds')
     core.storage.add_entries([(url, ip, ts, score, source)])
+    _result_cache.clear()
     return {"success": True}
 
 
 @mcp.tool(name="remove_entry", description="Remove a blacklist entry by URL or IP.")
 async def remove_entry(value: str):
     """Remove a blacklist entry by URL or IP."""
+    core = get_core()
     success = core.storage.remove_entry(value)
+    _result_cache.clear()
     return {"success": success}
@@ -1,3 +1,4 @@
+import socket
 from dataclasses import dataclass
 from datetime import datetime
 from typing import List, Optional
@@ -34,12 +35,18 @@ import os
 import json
 
 class SecMCP:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, start_scheduler: bool = True):
+        """Open the blacklist storage.
+
+        Long-running hosts (the MCP server) keep the default and get the daily
+        update scheduler; one-shot callers such as the CLI pass
+        start_scheduler=False so no background thread is started.
+        """
         config_path = os.path.join(os.path.dirname(__file__), "config.json")
         with open(config_path) as f:
             config = json.load(f)
         self.storage = create_storage(db_path=db_path)
-        self.updater = BlacklistUpdater(self.storage)
+        self.updater = BlacklistUpdater(self.storage, start_scheduler=start_scheduler)
 
     def check(self, value: str) -> CheckResult:
         """Check a single value (domain, URL, or IP) against the blacklist, following rules:
@@ -107,10 +114,6 @@ class SecMCP:
             return CheckResult(True, f"Blacklisted IP by {src}")
         return CheckResult(False, "Not blacklisted")
 
-    def check_batch(self, values: List[str]) -> List[CheckResult]:
-        """Check multiple values against the blacklist."""
-        return [self.check(value) for value in values]
-
     @staticmethod
     def is_url(value: str) -> bool:
         import re
@@ -118,6 +121,15 @@ class SecMCP:
 
     @staticmethod
     def is_ip(value: str) -> bool:
+        # inet_pton accepts exactly the dotted quads ipaddress does, in C and
+        # without building an address object; anything else that is an IP
+        # at all is IPv6 and contains ':'
+        try:
+            socket.inet_pton(socket.AF_INET, value)
+            return True
+        except (OSError, ValueError, TypeError):
+            if ':' not in value:
+                return False
         import ipaddress
         try:
             ipaddress.ip_address(value)
@@ -143,8 +155,67 @@ class SecMCP:
         return url if '.' in url else None
 
     def check_batch(self, values: List[str]) -> List[CheckResult]:
-        """Check multiple values against the blacklist."""
-        return [self.check(value) for value in values]
+        """Check multiple values against the blacklist.
+
+        Repeated values are looked up once and the result is reused. Results
+        match check(); membership is resolved first (all IPs in one
+        is_ip_blacklisted_many call) and the sources of all hits are then
+        fetched with one get_blacklist_sources call per kind instead of one
+        query per blacklisted value.
+        """
+        results = {}
+        hits = {}  # value -> (kind, candidate keys, most specific first)
+        unique = sorted(set(values))
+        # All IPs share one storage call (and one CIDR scan)
+        ips = [value.strip() for value in unique if self.is_ip(value.strip())]
+        ip_hits = dict(zip(ips, self.storage.is_ip_blacklisted_many(ips))) if ips else {}
+        for value in unique:
+            v = value.strip()
+            if v in ip_hits:
+                if ip_hits[v]:
+                    hits[value] = ("ip", [v])
+            elif self.is_url(v):
+                domain = self.extract_domain(v)
+                if self.storage.is_url_blacklisted(v):
+                    hits[value] = ("url", [v])
+                elif domain and self.storage.is_domain_blacklisted(domain):
+                    hits[value] = ("domain", self._parent_domains(domain))
+            elif self.is_domain(v):
+                if self.storage.is_domain_blacklisted(v):
+                    hits[value] = ("domain", self._parent_domains(v))
+            else:
+                results[value] = CheckResult(False, "Invalid input type")
+                continue
+            if value not in hits:
+                results[value] = CheckResult(False, "Not blacklisted")
+
+        labels = {"ip": "IP", "url": "URL", "domain": "domain"}
+        for kind, label in labels.items():
+            keys = {key for k, candidates in hits.values() if k == kind for key in candidates}
+            if not keys:
+                continue
+            sources = self.storage.get_blacklist_sources(kind, sorted(keys))
+            getter = getattr(self.storage, f"get_{kind}_blacklist_source")
+            for value, (k, candidates) in hits.items():
+                if k != kind:
+                    continue
+                src = next((sources[key] for key in candidates if key in sources), None)
+                if src is None:
+                    # Not an exact entry (e.g. a CIDR match): use the single-value lookup
+                    src = getter(candidates[0])
+                results[value] = CheckResult(True, f"Blacklisted {label} by {src}")
+        return [results[value] for value in values]
+
+    @staticmethod
+    def _parent_domains(domain: str) -> List[str]:
+        """Return a domain and its parent domains, most specific first (TLD excluded)."""
+        # Slice past each dot instead of splitting into labels and re-joining them
+        candidates = []
+        sub = domain.lower()
+        while '.' in sub:
+            candidates.append(sub)
+            sub = sub[sub.index('.') + 1:]
+        return candidates
 
     def get_status(self) -> StatusInfo:
         """Get current status of the blacklist service."""
@@ -159,6 +230,10 @@ class SecMCP:
         """Force an immediate update of all blacklists."""
         self.updater.force_update()
 
+    def request_update(self) -> None:
+        """Have the scheduler thread update all blacklists now, without waiting for it."""
+        self.updater.request_update()
+
     def sample(self, count: int = 10) -> List[str]:
         """Return a random sample of blacklist entries for testing."""
         return self.storage.sample_entries(count)
@@ -1,12 +1,133 @@
+import atexit
+import ipaddress
+import json
+import logging
 import sqlite3
+import time
 from datetime import datetime
-from typing import List, Optional, Set, Tuple, Dict
+from typing import Callable, Iterable, List, Optional, Tuple, Dict
 import threading
+from contextlib import contextmanager
 import random
 import os
 import sys
+import weakref
+from collections import deque
 from pathlib import Path
 
+from .bloom import FingerprintSet, NetworkSet
+from .cache import StripedLRUCache
+from .utility import split_http_url
+
+# Seconds a diagnostics snapshot is reused before the database is queried again
+DIAGNOSTICS_TTL = 5.0
+
+# Lookups check for writes from other connections at most once per this many seconds
+INDEX_CHECK_INTERVAL = 1.0
+
+# Most recently confirmed hits kept in each kind's LRU cache, split across lock stripes
+CACHE_MAX_SIZE = 50_000
+CACHE_STRIPES = 32
+
+# Memory-mapped I/O window for read queries (256MB)
+MMAP_SIZE = 268435456
+
+# add_entries rows are written by a background flusher every FLUSH_INTERVAL
+# seconds, or as soon as FLUSH_BATCH of them are queued
+FLUSH_INTERVAL = 0.1
+FLUSH_BATCH = 1000
+# After a failed write the flusher retries with doubling waits, up to this many seconds
+FLUSH_RETRY_MAX = 5.0
+
+logger = logging.getLogger("sec_mcp.storage")
+
+# Entry kind -> (table, value column)
+BLACKLIST_TABLES = {
+    "domain": ("blacklist_domain", "domain"),
+    "url": ("blacklist_url", "url"),
+    "ip": ("blacklist_ip", "ip"),
+}
+
+class WriteBehindQueue:
+    """Rows stored by a background thread, in one transaction per batch.
+
+    put() queues (kind, row) pairs; a daemon thread, started on demand and
+    stopped once the queue is empty, hands them to write every
+    FLUSH_INTERVAL seconds, or as soon as FLUSH_BATCH are queued. Rows stay
+    pending until write returns: if it raises they go back to the front of
+    the queue and are retried.
+    """
+
+    def __init__(self, write: Callable[[List[Tuple[str, Tuple]]], None], db_path: str):
+        self._write = write
+        self._db_path = db_path
+        self._rows = deque()
+        # The batch taken from the queue that write has not finished with
+        self._in_flight: List[Tuple[str, Tuple]] = []
+        self._lock = threading.Lock()
+        # Held for a whole write, so wait() cannot return while one is running
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, rows: Iterable[Tuple[str, Tuple]]):
+        """Queue rows, starting the background writer if it is not running."""
+        with self._lock:
+            self._rows.extend(rows)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sec-mcp-flush", daemon=True)
+                self._thread.start()
+            if len(self._rows) >= FLUSH_BATCH:
+                self._wakeup.set()
+
+    def pending(self) -> List[Tuple[str, Tuple]]:
+        """Rows not stored yet: the batch being written, then the queue."""
+        with self._lock:
+            return self._in_flight + list(self._rows)
+
+    def flush(self):
+        """Write every queued row now; on failure the rows are queued again and the error raised."""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._rows)
+                self._rows.clear()
+                self._in_flight = batch
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except BaseException:
+                with self._lock:
+                    self._rows.extendleft(reversed(batch))
+                raise
+            finally:
+                with self._lock:
+                    self._in_flight = []
+
+    def wait(self):
+        """Return once every row queued so far is stored, including a batch being written right now."""
+        with self._lock:
+            busy = bool(self._rows or self._in_flight)
+        if busy:
+            self.flush()
+
+    def _run(self):
+        """Background writer; exits once the queue is empty."""
+        delay = FLUSH_INTERVAL
+        while True:
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                delay = FLUSH_INTERVAL
+            except Exception as e:
+                logger.error(f"Failed to write queued entries to {self._db_path}, will retry: {e}")
+                delay = min(delay * 2, FLUSH_RETRY_MAX)
+            with self._lock:
+                if not self._rows:
+                    self._thread = None
+                    return
+
 class Storage:
     """SQLite-based storage with in-memory caching for high-throughput blacklist checks."""
     
@@ -39,14 +160,101 @@ class Storage:
                 except OSError as e:
                     raise RuntimeError(f"Cannot create database directory {db_dir_from_path}: {e}")
         self.db_path = db_path
-        self._cache: Set[str] = set()  # In-memory cache for faster lookups
+        # LRU of confirmed hits per kind; each has its own striped locks, so
+        # concurrent lookups of different values do not serialize on one lock
+        self._caches = {kind: StripedLRUCache(CACHE_MAX_SIZE, CACHE_STRIPES) for kind in BLACKLIST_TABLES}
+        # Guards the per-kind fingerprint indexes and the CIDR networks
         self._cache_lock = threading.Lock()
+        # Held by every write of this instance, and while the indexes are rebuilt
+        self._write_lock = threading.RLock()
+        # Stored in index_tokens while the in-memory indexes match the tables
+        self._index_token = random.getrandbits(62)
+        self._index_checked_at = 0.0
+        # One connection per thread, reused across calls (WAL lets readers run concurrently)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_time = 0.0
+        self._snapshot_lock = threading.Lock()
+        # Rows queued by add_entries: (kind, (value, date, score, source))
+        self._writer = WriteBehindQueue(self._write_rows, self.db_path)
         self._init_db()
+        self._recount_entries()
+        self._build_indexes()
+        atexit.register(_flush_at_exit, weakref.ref(self))
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("PRAGMA temp_store=MEMORY;")
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _bulk_transaction(self):
+        """Run a bulk load in one BEGIN IMMEDIATE transaction with fsync turned off.
+
+        Only used for batch loads of feed data, which can be downloaded again:
+        a crash may lose the batch, in exchange for no sync barriers while it
+        is written. The write lock is taken up front, so a load never fails
+        halfway on a busy database.
+        """
+        conn = self._get_connection()
+        conn.commit()  # PRAGMA synchronous cannot change inside a transaction
+        conn.execute("PRAGMA synchronous=OFF;")
+        try:
+            with self._write_transaction() as conn:
+                yield conn
+            # Refresh planner statistics if the load changed the tables enough to matter
+            conn.execute("PRAGMA optimize;")
+        finally:
+            conn.execute("PRAGMA synchronous=NORMAL;")
+
+    @contextmanager
+    def _write_transaction(self):
+        """Run writes of this instance in one BEGIN IMMEDIATE transaction, keeping its index token.
+
+        The triggers clear every token on any change to the tables. If ours
+        was still stored when the transaction began, no other writer has
+        changed them since the indexes were built, so it is stored again:
+        the caller applies its own changes to the indexes after the commit.
+        """
+        with self._write_lock:
+            conn = self._get_connection()
+            conn.commit()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                in_sync = conn.execute(
+                    "SELECT 1 FROM index_tokens WHERE token = ?", (self._index_token,)
+                ).fetchone() is not None
+                yield conn
+                if in_sync:
+                    conn.execute("INSERT OR IGNORE INTO index_tokens (token) VALUES (?)", (self._index_token,))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def close(self):
+        """Write any queued entries, then close every connection opened by this storage instance."""
+        self.flush()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
 
     def _init_db(self):
         """Initialize the SQLite database with required tables and performance PRAGMAs."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._get_connection() as conn:
                 conn.execute("PRAGMA journal_mode=WAL;")
                 conn.execute("PRAGMA synchronous=NORMAL;")
                 conn.execute("PRAGMA cache_size=10000;")
@@ -57,33 +265,36 @@ class Storage:
                         date TEXT,
                         score REAL,
                         source TEXT
-                    )
-                """)
-                conn.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_blacklist_domain ON blacklist_domain(domain);
+                    ) WITHOUT ROWID
                 """)
+                ensure_without_rowid(conn, "blacklist_domain")
+                # The primary key holds the whole row, so no secondary index is needed
+                conn.execute("DROP INDEX IF EXISTS idx_blacklist_domain")
+                conn.execute("DROP INDEX IF EXISTS idx_blacklist_domain_source")
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS blacklist_url (
                         url TEXT PRIMARY KEY,
                         date TEXT,
                         score REAL,
                         source TEXT
-                    )
-                """)
-                conn.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_blacklist_url ON blacklist_url(url);
+                    ) WITHOUT ROWID
                 """)
+                ensure_without_rowid(conn, "blacklist_url")
+                # The primary key holds the whole row, so no secondary index is needed
+                conn.execute("DROP INDEX IF EXISTS idx_blacklist_url")
+                conn.execute("DROP INDEX IF EXISTS idx_blacklist_url_source")
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS blacklist_ip (
                         ip TEXT PRIMARY KEY,
                         date TEXT,
                         score REAL,
                         source TEXT
-                    )
-                """)
-                conn.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_blacklist_ip ON blacklist_ip(ip);
+                    ) WITHOUT ROWID
                 """)
+                ensure_without_rowid(conn, "blacklist_ip")
+                # The primary key holds the whole row, so no secondary index is needed
+                conn.execute("DROP INDEX IF EXISTS idx_blacklist_ip")
+                conn.execute("DROP INDEX IF EXISTS idx_blacklist_ip_source")
                 # Create updates table (unchanged)
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS updates (
@@ -93,178 +304,348 @@ class Storage:
                         entry_count INTEGER NOT NULL
                     )
                 """)
+                conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_updates_timestamp ON updates(timestamp);
+                """)
+                # Per-source, per-kind row counts kept current by triggers, so status
+                # and count queries read a handful of rows instead of scanning tables
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS entry_counts (
+                        source TEXT NOT NULL,
+                        kind TEXT NOT NULL,
+                        count INTEGER NOT NULL,
+                        PRIMARY KEY (source, kind)
+                    )
+                """)
+                for kind, (table, _) in BLACKLIST_TABLES.items():
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table}
+                        BEGIN
+                            INSERT INTO entry_counts (source, kind, count)
+                            VALUES (IFNULL(NEW.source, ''), '{kind}', 1)
+                            ON CONFLICT (source, kind) DO UPDATE SET count = count + 1;
+                        END
+                    """)
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table}
+                        BEGIN
+                            UPDATE entry_counts SET count = count - 1
+                            WHERE source = IFNULL(OLD.source, '') AND kind = '{kind}';
+                        END
+                    """)
+                # Tokens of Storage instances whose in-memory indexes match the
+                # tables. Any change, by this or any other process, clears them
+                # all; the WHEN clause keeps the per-row cost of a bulk insert
+                # to one read once they are cleared
+                conn.execute("CREATE TABLE IF NOT EXISTS index_tokens (token INTEGER PRIMARY KEY)")
+                for table, _ in BLACKLIST_TABLES.values():
+                    for event in ("INSERT", "UPDATE", "DELETE"):
+                        conn.execute(f"""
+                            CREATE TRIGGER IF NOT EXISTS {table}_index_{event.lower()} AFTER {event} ON {table}
+                            WHEN EXISTS (SELECT 1 FROM index_tokens)
+                            BEGIN
+                                DELETE FROM index_tokens;
+                            END
+                        """)
                 conn.commit()
         except sqlite3.OperationalError as e:
             raise RuntimeError(f"Cannot initialize database at {self.db_path}: {e}. Check directory permissions and disk space.")
 
+    def _recount_entries(self):
+        """Rebuild entry_counts from the tables.
+
+        Done once per start: the tables may predate the triggers or have been
+        written by HybridStorage, whose INSERT OR REPLACE skips the delete trigger.
+        """
+        with self._write_lock, self._get_connection() as conn:
+            conn.execute("DELETE FROM entry_counts")
+            for kind, (table, _) in BLACKLIST_TABLES.items():
+                conn.execute(
+                    f"INSERT INTO entry_counts (source, kind, count) "
+                    f"SELECT IFNULL(source, ''), ?, COUNT(*) FROM {table} GROUP BY IFNULL(source, '')",
+                    (kind,)
+                )
+
+    def _build_indexes(self):
+        """Build a fingerprint index per kind, and the CIDR networks, from the tables.
+
+        Called at startup, and again by _refresh_index once another writer has
+        changed the tables; this instance's own inserts and removals update
+        them incrementally. Exact-match lookups are answered from these without
+        querying the database, and CIDR entries are kept as parsed networks so
+        IP misses skip it too.
+        """
+        # Own writes wait, so none of them lands between the scan and the swap
+        with self._write_lock:
+            conn = self._get_connection()
+            conn.commit()
+            # Stored before the scan: a change committed after this clears it
+            # again, so it is either in the scan or seen by the next refresh
+            conn.execute("INSERT OR IGNORE INTO index_tokens (token) VALUES (?)", (self._index_token,))
+            conn.commit()
+            self._index_checked_at = time.monotonic()
+            conn.execute("BEGIN")  # one read snapshot for all three tables
+            try:
+                values = {
+                    kind: [row[0] for row in conn.execute(f"SELECT {column} FROM {table}")]
+                    for kind, (table, column) in BLACKLIST_TABLES.items()
+                }
+            finally:
+                conn.commit()
+            fingerprints = {kind: FingerprintSet(kind_values) for kind, kind_values in values.items()}
+            networks = NetworkSet(self._parse_networks(values["ip"]))
+            with self._cache_lock:
+                self._fingerprints, self._networks = fingerprints, networks
+                # Rows queued by add_entries are indexed but not in the tables yet
+                for kind, kind_values in self._group_by_kind(self._writer.pending()).items():
+                    networks = self._parse_networks(kind_values) if kind == "ip" else []
+                    self._index_values(kind, kind_values, networks)
+            # Hits cached before may have been removed by the other writer
+            for cache in self._caches.values():
+                cache.clear()
+
+    def _refresh_index(self):
+        """Rebuild the in-memory indexes if another writer changed the tables since they were built.
+
+        The database is asked at most once per INDEX_CHECK_INTERVAL, so other
+        lookups in between are answered from memory alone.
+        """
+        now = time.monotonic()
+        if now - self._index_checked_at < INDEX_CHECK_INTERVAL:
+            return
+        self._index_checked_at = now
+        conn = self._get_connection()
+        if conn.execute("SELECT 1 FROM index_tokens WHERE token = ?", (self._index_token,)).fetchone():
+            return
+        with self._write_lock:
+            # Another thread may have rebuilt them while this one waited
+            if conn.execute("SELECT 1 FROM index_tokens WHERE token = ?", (self._index_token,)).fetchone():
+                return
+            logger.info(f"Blacklist tables in {self.db_path} changed elsewhere; rebuilding the in-memory index")
+            self._build_indexes()
+
+    @staticmethod
+    def _parse_networks(values) -> List:
+        """Parse CIDR entries, skipping invalid ones."""
+        networks = []
+        for value in values:
+            if '/' in value:
+                try:
+                    networks.append(ipaddress.ip_network(value, strict=False))
+                except ValueError:
+                    continue
+        return networks
+
+    def _is_in_networks(self, addr) -> bool:
+        """Whether an address falls inside any stored CIDR entry."""
+        return addr in self._networks
+
+    @staticmethod
+    def _group_by_kind(rows) -> Dict[str, List[str]]:
+        """Values of queued (kind, row) pairs, by kind."""
+        values = {}
+        for kind, row in rows:
+            values.setdefault(kind, []).append(row[0])
+        return values
+
+    def _index_values(self, kind: str, values: List[str], networks: List):
+        """Record inserted values of one kind, and parsed CIDR networks; the caller holds _cache_lock."""
+        self._fingerprints[kind].update(values)
+        if networks:
+            self._networks.update(networks)
+
+    def _index_add(self, kind: str, values):
+        """Record newly inserted values of one kind in its fingerprint index."""
+        values = list(values)
+        networks = self._parse_networks(values) if kind == "ip" else []
+        with self._cache_lock:
+            self._index_values(kind, values, networks)
+
+    def _index_discard(self, kind: str, value: str):
+        """Forget a removed value."""
+        with self._cache_lock:
+            self._fingerprints[kind].discard(value)
+        self._caches[kind].discard(value)
+
+    def _is_indexed(self, kind: str, value: str) -> bool:
+        """Exact membership in one kind, from its fingerprint index."""
+        with self._cache_lock:
+            return value in self._fingerprints[kind]
+
     def is_domain_blacklisted(self, domain: str) -> bool:
         """Check if a domain or its parent domains are blacklisted."""
-        # Check domain and all parent domains
-        domain_parts = domain.lower().split('.')
-        for i in range(len(domain_parts) - 1):
-            sub = '.'.join(domain_parts[i:])
+        self._refresh_index()
+        cache = self._caches["domain"]
+        # Check domain and all parent domains (TLD excluded), slicing past each dot
+        sub = domain.lower()
+        while '.' in sub:
             # Check cache first
-            with self._cache_lock:
-                if sub in self._cache:
-                    return True
-            # If not in cache, check DB
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    "SELECT 1 FROM blacklist_domain WHERE domain = ?",
-                    (sub,)
-                )
-                if cursor.fetchone():
-                    with self._cache_lock:
-                        self._cache.add(sub) # Add to cache if found in DB
-                    return True
+            if cache.get(sub):
+                return True
+            # If not in cache, check the in-memory index
+            if self._is_indexed("domain", sub):
+                cache.put(sub)
+                return True
+            sub = sub[sub.index('.') + 1:]
         return False
 
     def is_url_blacklisted(self, url: str) -> bool:
         """Check if a URL is blacklisted (exact match)."""
+        self._refresh_index()
+        cache = self._caches["url"]
         # Check cache first
-        with self._cache_lock:
-            if url in self._cache:
-                return True
-        # If not in cache, check DB
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT 1 FROM blacklist_url WHERE url = ?",
-                (url,)
-            )
-            if cursor.fetchone():
-                with self._cache_lock:
-                    self._cache.add(url) # Add to cache if found in DB
-                return True
+        if cache.get(url):
+            return True
+        # If not in cache, check the in-memory index
+        if self._is_indexed("url", url):
+            cache.put(url)
+            return True
         return False
 
     def is_ip_blacklisted(self, ip: str) -> bool:
         """Check if an IP is blacklisted (either exact match or contained in any network mask)."""
-        import ipaddress
         try:
-            ip_obj = ipaddress.ip_address(ip)
+            addr = ipaddress.ip_address(ip)
         except ValueError:
             return False
+        self._refresh_index()
+        cache = self._caches["ip"]
         # Check cache first for exact IP
-        with self._cache_lock:
-            if ip in self._cache:
-                return True
-        # If not in cache, check DB for exact IP
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "SELECT 1 FROM blacklist_ip WHERE ip = ?",
-                (ip,)
-            )
-            if cursor.fetchone():
-                with self._cache_lock:
-                    self._cache.add(ip) # Add exact IP to cache if found
-                return True
+        if cache.get(ip):
+            return True
+        # If not in cache, check the in-memory index for the exact IP
+        if self._is_indexed("ip", ip):
+            cache.put(ip) # Add exact IP to cache if found
+            return True
+        # CIDR entries are held as parsed networks, so a miss is answered without a query.
+        # An IP found via CIDR IS blacklisted, so it is cached like an exact hit.
+        if self._is_in_networks(addr):
+            cache.put(ip)
+            return True
+        return False
 
-            # Check for network mask (this part is more complex and less cacheable directly without processing all masks)
-            # The current implementation checks all network masks, which might be slow.
-            # For CIDR matches, we won't cache the specific IP 'ip' under the CIDR key directly here,
-            # as the cache is for exact matches. A positive CIDR match means the IP is bad,
-            # but caching 'ip' itself might be misleading if 'ip' isn't an exact entry.
-            # However, if an IP is found via CIDR, it IS blacklisted.
-            cursor = conn.execute(
-                "SELECT ip FROM blacklist_ip WHERE INSTR(ip, '/') > 0"  # Select only CIDRs
-            )
+    def is_ip_blacklisted_many(self, ips: List[str]) -> List[bool]:
+        """Check multiple IPs against the in-memory index and CIDR networks."""
+        addrs = {}
+        for ip in ips:
             try:
-                addr = ipaddress.ip_address(ip)
-                for row in cursor.fetchall():
-                    net_str = row[0]
-                    # Ensure net_str is a valid network before creating ip_network object
-                    try:
-                        network = ipaddress.ip_network(net_str, strict=False)
-                        if addr in network:
-                            # We found it via CIDR. We can cache the specific IP as blacklisted.
-                            with self._cache_lock:
-                                self._cache.add(ip)
-                            return True
-                    except ValueError:
-                        # Invalid network string in DB, log or handle as appropriate
-                        continue 
+                addrs[ip] = ipaddress.ip_address(ip)
             except ValueError:
-                pass # Invalid IP format for 'ip', should not happen if input is validated
-        return False
+                continue
+        self._refresh_index()
+        cache = self._caches["ip"]
+        found = {ip for ip in addrs if cache.get(ip)}
+        pending = [ip for ip in addrs if ip not in found]
+        if pending:
+            with self._cache_lock:
+                fingerprints = self._fingerprints["ip"]
+                found.update(ip for ip in pending if ip in fingerprints)
+            found.update(ip for ip in pending if ip not in found and self._is_in_networks(addrs[ip]))
+            for ip in found:
+                cache.put(ip)
+        return [ip in found for ip in ips]
 
     def add_domain(self, domain: str, date: str, score: float, source: str):
         """Add a domain to the domain blacklist."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._write_transaction() as conn:
             conn.execute(
                 "INSERT OR IGNORE INTO blacklist_domain (domain, date, score, source) VALUES (?, ?, ?, ?)",
                 (domain, date, score, source)
             )
-            conn.commit()
+        self._index_add("domain", (domain,))
 
     def add_url(self, url: str, date: str, score: float, source: str):
         """Add a URL to the URL blacklist."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._write_transaction() as conn:
             conn.execute(
                 "INSERT OR IGNORE INTO blacklist_url (url, date, score, source) VALUES (?, ?, ?, ?)",
                 (url, date, score, source)
             )
-            conn.commit()
+        self._index_add("url", (url,))
 
     def add_ip(self, ip: str, date: str, score: float, source: str):
         """Add an IP to the IP blacklist."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_transaction() as conn:
                 conn.execute(
                     "INSERT OR IGNORE INTO blacklist_ip (ip, date, score, source) VALUES (?, ?, ?, ?)",
                     (ip, date, score, source)
                 )
-                conn.commit()
         except sqlite3.OperationalError as e:
             raise RuntimeError(f"Cannot write to database at {self.db_path}: {e}. Check directory permissions and that the database was initialized properly.")
+        self._index_add("ip", (ip,))
 
     def remove_domain(self, domain: str) -> bool:
         """Remove a domain from the domain blacklist."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
+        self._flush_pending()
+        with self._write_transaction() as conn:
+            removed = conn.execute(
                 "DELETE FROM blacklist_domain WHERE domain = ?",
                 (domain,)
-            )
-            conn.commit()
-        return cursor.rowcount > 0
+            ).rowcount > 0
+        # Only a deleted row is forgotten: the index may hold the same value for the other kinds
+        if removed:
+            self._index_discard("domain", domain)
+        return removed
 
     def remove_url(self, url: str) -> bool:
         """Remove a URL from the URL blacklist."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
+        self._flush_pending()
+        with self._write_transaction() as conn:
+            removed = conn.execute(
                 "DELETE FROM blacklist_url WHERE url = ?",
                 (url,)
-            )
-            conn.commit()
-        return cursor.rowcount > 0
+            ).rowcount > 0
+        # Only a deleted row is forgotten: the index may hold the same value for the other kinds
+        if removed:
+            self._index_discard("url", url)
+        return removed
 
     def remove_ip(self, ip: str) -> bool:
         """Remove an IP from the IP blacklist."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
+        self._flush_pending()
+        with self._write_transaction() as conn:
+            removed = conn.execute(
                 "DELETE FROM blacklist_ip WHERE ip = ?",
                 (ip,)
-            )
-            conn.commit()
-        return cursor.rowcount > 0
+            ).rowcount > 0
+        if not removed:
+            return False
+        self._index_discard("ip", ip)
+        if '/' in ip:
+            networks = self._parse_networks((ip,))
+            with self._cache_lock:
+                for network in networks:
+                    self._networks.discard(network)
+            # Cached IPs may have matched through this network
+            self._caches["ip"].clear()
+        return True
 
     def get_domain_blacklist_source(self, domain: str) -> Optional[str]:
         """Get the source that blacklisted a domain (including parent domains)."""
-        domain_parts = domain.lower().split('.')
-        for i in range(len(domain_parts) - 1):
-            sub = '.'.join(domain_parts[i:])
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
-                    "SELECT source FROM blacklist_domain WHERE domain = ?",
-                    (sub,)
-                )
-                result = cursor.fetchone()
-                if result:
-                    return result[0]
-        return None
+        self._flush_pending()
+        # The domain and its parents (TLD excluded), slicing past each dot
+        candidates = []
+        sub = domain.lower()
+        while '.' in sub:
+            candidates.append(sub)
+            sub = sub[sub.index('.') + 1:]
+        if not candidates:
+            return None
+        # All parent domains in one statement (one primary-key seek each);
+        # the most specific match wins
+        placeholders = ",".join("?" * len(candidates))
+        with self._get_connection() as conn:
+            rows = dict(conn.execute(
+                f"SELECT domain, source FROM blacklist_domain WHERE domain IN ({placeholders})",
+                candidates
+            ).fetchall())
+        return next((rows[sub] for sub in candidates if sub in rows), None)
 
     def get_url_blacklist_source(self, url: str) -> Optional[str]:
         """Get the source that blacklisted a URL (exact match)."""
-        with sqlite3.connect(self.db_path) as conn:
+        self._flush_pending()
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 "SELECT source FROM blacklist_url WHERE url = ?",
                 (url,)
@@ -274,7 +655,8 @@ class Storage:
 
     def get_ip_blacklist_source(self, ip: str) -> Optional[str]:
         """Get the source that blacklisted an IP (exact match)."""
-        with sqlite3.connect(self.db_path) as conn:
+        self._flush_pending()
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 "SELECT source FROM blacklist_ip WHERE ip = ?",
                 (ip,)
@@ -282,36 +664,127 @@ class Storage:
             result = cursor.fetchone()
             return result[0] if result else None
 
-    def add_domains(self, domains: List[Tuple[str, str, float, str]]):
-        """Add multiple domains to the domain blacklist."""
-        with sqlite3.connect(self.db_path) as conn:
+    def get_blacklist_sources(self, kind: str, values: Iterable[str]) -> Dict[str, str]:
+        """Get the sources for many values of one kind ('domain', 'url' or 'ip'), exact match only.
+
+        The values are loaded into a TEMP table and joined against the
+        blacklist table, so the whole batch is one indexed query instead of
+        one SELECT per value. Values that are not blacklisted are omitted.
+        """
+        self._flush_pending()
+        table, column = BLACKLIST_TABLES[kind]
+        conn = self._get_connection()
+        with conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_values (value TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM lookup_values")
+            conn.executemany(
+                "INSERT OR IGNORE INTO lookup_values (value) VALUES (?)",
+                ((value,) for value in values)
+            )
+            # Drive the join from the (small) lookup table into the primary key
+            rows = conn.execute(
+                f"SELECT b.{column}, b.source FROM lookup_values q "
+                f"CROSS JOIN {table} b ON b.{column} = q.value"
+            ).fetchall()
+            conn.execute("DELETE FROM lookup_values")
+        return dict(rows)
+
+    @staticmethod
+    def _collect_values(rows, values: List[str]):
+        """Yield rows unchanged while recording their first column for the in-memory index."""
+        for row in rows:
+            values.append(row[0])
+            yield row
+
+    def add_domains(self, domains: Iterable[Tuple[str, str, float, str]]):
+        """Add multiple domains to the domain blacklist (any iterable, streamed into one transaction)."""
+        values = []
+        with self._bulk_transaction() as conn:
             conn.executemany(
                 "INSERT OR IGNORE INTO blacklist_domain (domain, date, score, source) VALUES (?, ?, ?, ?)",
-                domains
+                self._collect_values(domains, values)
             )
-            conn.commit()
+        self._index_add("domain", values)
 
-    def add_urls(self, urls: List[Tuple[str, str, float, str]]):
-        """Add multiple URLs to the URL blacklist."""
-        with sqlite3.connect(self.db_path) as conn:
+    def add_urls(self, urls: Iterable[Tuple[str, str, float, str]]):
+        """Add multiple URLs to the URL blacklist (any iterable, streamed into one transaction)."""
+        values = []
+        with self._bulk_transaction() as conn:
             conn.executemany(
                 "INSERT OR IGNORE INTO blacklist_url (url, date, score, source) VALUES (?, ?, ?, ?)",
-                urls
+                self._collect_values(urls, values)
             )
-            conn.commit()
+        self._index_add("url", values)
 
-    def add_ips(self, ips: List[Tuple[str, str, float, str]]):
-        """Add multiple IPs to the IP blacklist."""
-        with sqlite3.connect(self.db_path) as conn:
+    def add_ips(self, ips: Iterable[Tuple[str, str, float, str]]):
+        """Add multiple IPs to the IP blacklist (any iterable, streamed into one transaction)."""
+        values = []
+        with self._bulk_transaction() as conn:
             conn.executemany(
                 "INSERT OR IGNORE INTO blacklist_ip (ip, date, score, source) VALUES (?, ?, ?, ?)",
-                ips
+                self._collect_values(ips, values)
             )
-            conn.commit()
+        self._index_add("ip", values)
+
+    def add_entries(self, entries: Iterable[Tuple[str, Optional[str], str, float, str]]):
+        """Queue manual entries, given as (url, ip, date, score, source) tuples.
+
+        Entries are classified like HybridStorage.add_entries: an http(s) URL
+        without a path is a domain entry, one with a path a URL entry, and
+        the ip field an IP entry. The in-memory index is updated right away,
+        so lookups see the entries immediately; the rows are written by a
+        background thread in one transaction per FLUSH_INTERVAL instead of
+        one commit per call.
+        """
+        rows = []
+        for url_val, ip_val, date_val, score_val, source in entries:
+            if ip_val:
+                rows.append(("ip", (ip_val, date_val, score_val, source)))
+            if url_val and url_val.startswith(('http://', 'https://')):
+                try:
+                    netloc, path = split_http_url(url_val)
+                except ValueError:
+                    continue
+                if netloc and (not path or path == '/'):
+                    rows.append(("domain", (netloc, date_val, score_val, source)))
+                else:
+                    rows.append(("url", (url_val, date_val, score_val, source)))
+        if not rows:
+            return
+        values = self._group_by_kind(rows)
+        networks = self._parse_networks(values.get("ip", ()))
+        # Queued under the same lock, so a rebuild of the indexes either sees
+        # these rows pending or finds them already indexed
+        with self._cache_lock:
+            for kind, kind_values in values.items():
+                self._index_values(kind, kind_values, networks if kind == "ip" else [])
+            self._writer.put(rows)
+
+    def _write_rows(self, pending: List[Tuple[str, Tuple]]):
+        """Insert a batch of queued (kind, row) pairs in one transaction."""
+        rows = {kind: [] for kind in BLACKLIST_TABLES}
+        for kind, row in pending:
+            rows[kind].append(row)
+        with self._write_transaction() as conn:
+            for kind, kind_rows in rows.items():
+                if kind_rows:
+                    table, column = BLACKLIST_TABLES[kind]
+                    conn.executemany(
+                        f"INSERT OR IGNORE INTO {table} ({column}, date, score, source) VALUES (?, ?, ?, ?)",
+                        kind_rows
+                    )
+
+    def flush(self):
+        """Write all rows queued by add_entries to the database."""
+        self._writer.flush()
+
+    def _flush_pending(self):
+        """Wait for queued rows, including a batch being written, before a read or delete that must see them."""
+        self._writer.wait()
 
     def log_update(self, source: str, entry_count: int):
         """Log a successful update from a source."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             conn.execute(
                 "INSERT INTO updates (source, entry_count) VALUES (?, ?)",
                 (source, entry_count)
@@ -320,50 +793,72 @@ class Storage:
 
     def count_entries(self) -> int:
         """Get total number of blacklist entries (sum of all tables)."""
-        with sqlite3.connect(self.db_path) as conn:
-            domain_count = conn.execute("SELECT COUNT(*) FROM blacklist_domain").fetchone()[0]
-            url_count = conn.execute("SELECT COUNT(*) FROM blacklist_url").fetchone()[0]
-            ip_count = conn.execute("SELECT COUNT(*) FROM blacklist_ip").fetchone()[0]
-            return domain_count + url_count + ip_count
+        self._flush_pending()
+        with self._get_connection() as conn:
+            return self._count_rows(conn)
+
+    @staticmethod
+    def _count_rows(conn: sqlite3.Connection) -> int:
+        """Sum the row counts of the three blacklist tables on an open connection."""
+        return conn.execute("SELECT IFNULL(SUM(count), 0) FROM entry_counts").fetchone()[0]
 
     def get_source_counts(self) -> Dict[str, int]:
         """Get the number of blacklist entries for each source (all tables)."""
-        counts = {}
-        with sqlite3.connect(self.db_path) as conn:
-            for table in ["blacklist_domain", "blacklist_url", "blacklist_ip"]:
-                cursor = conn.execute(f"SELECT source, COUNT(*) FROM {table} GROUP BY source")
-                for row in cursor.fetchall():
-                    src = row[0]
-                    counts[src] = counts.get(src, 0) + row[1]
-        return counts
+        self._flush_pending()
+        with self._get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT source, SUM(count) FROM entry_counts GROUP BY source HAVING SUM(count) > 0"
+            )
+            return {row[0]: row[1] for row in cursor.fetchall()}
 
     def get_source_type_counts(self) -> Dict[str, dict]:
         """Get the number of domain, url, and ip entries for each source."""
+        self._flush_pending()
         stats = {}
-        with sqlite3.connect(self.db_path) as conn:
-            # Domains
-            cursor = conn.execute("SELECT source, COUNT(*) FROM blacklist_domain GROUP BY source")
-            for row in cursor.fetchall():
-                src = row[0]
-                stats.setdefault(src, {"domain": 0, "url": 0, "ip": 0})
-                stats[src]["domain"] = row[1]
-            # URLs
-            cursor = conn.execute("SELECT source, COUNT(*) FROM blacklist_url GROUP BY source")
-            for row in cursor.fetchall():
-                src = row[0]
-                stats.setdefault(src, {"domain": 0, "url": 0, "ip": 0})
-                stats[src]["url"] = row[1]
-            # IPs
-            cursor = conn.execute("SELECT source, COUNT(*) FROM blacklist_ip GROUP BY source")
-            for row in cursor.fetchall():
-                src = row[0]
+        with self._get_connection() as conn:
+            cursor = conn.execute("SELECT source, kind, count FROM entry_counts WHERE count > 0")
+            for src, kind, count in cursor.fetchall():
                 stats.setdefault(src, {"domain": 0, "url": 0, "ip": 0})
-                stats[src]["ip"] = row[1]
+                stats[src][kind] = count
         return stats
 
+    def get_diagnostics_snapshot(self) -> Dict[str, object]:
+        """Get total, per-source, per-type and last-update figures from one query.
+
+        The result is reused for DIAGNOSTICS_TTL seconds, so monitoring that
+        polls diagnostics does not query the database on every call.
+        """
+        with self._snapshot_lock:
+            if self._snapshot is not None and time.monotonic() - self._snapshot_time < DIAGNOSTICS_TTL:
+                return self._snapshot
+            self._flush_pending()
+            with self._get_connection() as conn:
+                total, per_source, last_updates, detail = conn.execute("""
+                    SELECT
+                        (SELECT IFNULL(SUM(count), 0) FROM entry_counts),
+                        (SELECT json_group_object(source, total) FROM (
+                            SELECT source, SUM(count) AS total FROM entry_counts
+                            GROUP BY source HAVING SUM(count) > 0)),
+                        (SELECT json_group_object(source, ts) FROM (
+                            SELECT source, MAX(timestamp) AS ts FROM updates GROUP BY source)),
+                        (SELECT json_group_array(json_array(source, kind, count))
+                            FROM entry_counts WHERE count > 0)
+                """).fetchone()
+            per_source_detail = {}
+            for src, kind, count in json.loads(detail):
+                per_source_detail.setdefault(src, {"domain": 0, "url": 0, "ip": 0})[kind] = count
+            self._snapshot = {
+                "total_entries": total,
+                "per_source": json.loads(per_source),
+                "last_updates": json.loads(last_updates),
+                "per_source_detail": per_source_detail,
+            }
+            self._snapshot_time = time.monotonic()
+            return self._snapshot
+
     def get_last_update(self) -> datetime:
         """Get timestamp of last update."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 "SELECT MAX(timestamp) FROM updates"
             )
@@ -372,26 +867,47 @@ class Storage:
 
     def get_active_sources(self) -> List[str]:
         """Get list of active blacklist sources (from all tables)."""
-        sources = set()
-        with sqlite3.connect(self.db_path) as conn:
-            for table in ["blacklist_domain", "blacklist_url", "blacklist_ip"]:
-                cursor = conn.execute(f"SELECT DISTINCT source FROM {table}")
-                sources.update(row[0] for row in cursor.fetchall())
-        return list(sources)
+        self._flush_pending()
+        with self._get_connection() as conn:
+            cursor = conn.execute("SELECT DISTINCT source FROM entry_counts WHERE count > 0")
+            return [row[0] for row in cursor.fetchall()]
 
     def sample_entries(self, count: int = 10) -> List[str]:
         """Return a random sample of blacklist entries from all tables for testing."""
+        self._flush_pending()
         entries = []
-        with sqlite3.connect(self.db_path) as conn:
-            for table, field in [("blacklist_domain", "domain"), ("blacklist_url", "url"), ("blacklist_ip", "ip")]:
-                cursor = conn.execute(f"SELECT {field} FROM {table} ORDER BY RANDOM() LIMIT ?", (count,))
-                entries.extend(row[0] for row in cursor.fetchall())
+        with self._get_connection() as conn:
+            totals = dict(conn.execute("SELECT kind, SUM(count) FROM entry_counts GROUP BY kind").fetchall())
+            for kind, (table, field) in BLACKLIST_TABLES.items():
+                entries.extend(self._sample_table(conn, table, field, count, totals.get(kind, 0)))
         random.shuffle(entries)
         return entries[:count]
 
+    @staticmethod
+    def _sample_table(conn: sqlite3.Connection, table: str, field: str, count: int, total: int) -> List[str]:
+        """Pick up to count random values from a table of total rows in one scan.
+
+        The tables have no rowids to probe, so each row is kept with
+        probability 2 * count / total instead: a single pass with no sort,
+        unlike ORDER BY RANDOM(), which is only used if the draw comes up short.
+        """
+        if total <= 0 or count <= 0:
+            return []
+        if count * 2 >= total:
+            values = [row[0] for row in conn.execute(f"SELECT {field} FROM {table}")]
+        else:
+            cursor = conn.execute(
+                f"SELECT {field} FROM {table} WHERE abs(random()) % ? < ?", (total, count * 2)
+            )
+            values = [row[0] for row in cursor.fetchall()]
+            if len(values) < count:
+                cursor = conn.execute(f"SELECT {field} FROM {table} ORDER BY RANDOM() LIMIT ?", (count,))
+                return [row[0] for row in cursor.fetchall()]
+        return random.sample(values, min(count, len(values)))
+
     def get_last_update_per_source(self) -> Dict[str, str]:
         """Get last update timestamp for each source."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 "SELECT source, MAX(timestamp) FROM updates GROUP BY source"
             )
@@ -399,7 +915,7 @@ class Storage:
 
     def get_update_history(self, source: str = None, start: str = None, end: str = None) -> list:
         """Return update history records, optionally filtered by source and time range."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             parts = []
             params = []
             if source:
@@ -419,23 +935,49 @@ class Storage:
             ]
 
     def flush_cache(self) -> bool:
-        """Clear the in-memory URL/IP cache."""
-        with self._cache_lock:
-            self._cache.clear()
+        """Clear the in-memory domain/URL/IP caches."""
+        for cache in self._caches.values():
+            cache.clear()
         return True
 
     def remove_entry(self, value: str) -> bool:
-        """Remove a blacklist entry by URL or IP."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute(
-                "DELETE FROM blacklist WHERE url = ? OR ip = ?",
-                (value, value)
-            )
-            conn.commit()
-        with self._cache_lock:
-            self._cache.discard(value)
-        return cursor.rowcount > 0
-
+        """Remove a blacklist entry by domain, URL or IP."""
+        # One indexed equality DELETE per table (remove_* also update the in-memory indexes)
+        removed = [self.remove_domain(value), self.remove_url(value), self.remove_ip(value)]
+        return any(removed)
+
+def ensure_without_rowid(conn: sqlite3.Connection, table: str):
+    """Rebuild a blacklist table created by an older version as WITHOUT ROWID.
+
+    The primary key B-tree then holds the whole row, so a lookup is one
+    descent and no (value, source) index has to be kept alongside. The new
+    table is created from the stored DDL, so columns added later with ALTER
+    TABLE are kept; indexes and triggers on the old table are dropped with
+    it and recreated by the caller. Rowid tables accept NULL primary keys,
+    which WITHOUT ROWID does not; such rows can never match a lookup and are
+    left out with a warning.
+    """
+    sql = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()[0]
+    if sql.rstrip().upper().endswith("WITHOUT ROWID"):
+        return
+    key = next(row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[5])
+    rebuilt = f"{table}_rebuild"
+    conn.execute(f"DROP TABLE IF EXISTS {rebuilt}")
+    conn.execute(sql.replace(table, rebuilt, 1) + " WITHOUT ROWID")
+    conn.execute(f"INSERT INTO {rebuilt} SELECT * FROM {table} WHERE {key} IS NOT NULL")
+    skipped = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {key} IS NULL").fetchone()[0]
+    if skipped:
+        logger.warning(f"Dropped {skipped} row(s) with a NULL {key} while rebuilding {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {rebuilt} RENAME TO {table}")
+
+def _flush_at_exit(ref):
+    """Write entries still queued when the interpreter exits (the flusher is a daemon thread)."""
+    storage = ref()
+    if storage is not None:
+        storage.flush()
 
 def create_storage(db_path=None):
     """
@@ -11,7 +11,8 @@ Performance targets (v0.4.0):
 - Memory usage: 40-50MB for 450K entries (30-40% reduction from v0.3.0)
 
 Optimizations:
-- Tiered lookup (hot/cold sources) for early exit
+- One metadata map per entry type, also used for membership (hot/cold
+  source hits are tracked in metrics only)
 - Source-aware routing to skip irrelevant sources
 - URL normalization to reduce duplicates
 - Integer-based IP storage for memory efficiency
@@ -21,17 +22,29 @@ import sqlite3
 import threading
 import logging
 import ipaddress
+import re
 import random
 import time
+import itertools
+import functools
+import atexit
+import weakref
+import marshal
 import os
 import sys
+import socket
 import struct
+from collections import Counter
 from datetime import datetime
-from typing import List, Optional, Set, Dict, Tuple
+from typing import List, Optional, Dict, Tuple
 from dataclasses import dataclass, field
 from pathlib import Path
 from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
 
+from .bloom import NetworkSet, PrefixMap
+from .storage import BLACKLIST_TABLES, WriteBehindQueue, _flush_at_exit, ensure_without_rowid
+from .utility import split_http_url
+
 
 # ========== Source Classification ==========
 # Based on production data analysis (449K entries)
@@ -54,25 +67,160 @@ IP_ONLY_SOURCES = frozenset([
 # Domain/URL-only sources (55% of domains from these sources)
 DOMAIN_URL_ONLY_SOURCES = frozenset(['PhishTank', 'OpenPhish'])
 
+# Seconds a diagnostics snapshot is reused before it is recomputed
+DIAGNOSTICS_TTL = 5.0
 
-@dataclass
+# Memory-mapped I/O window for read queries (256MB)
+MMAP_SIZE = 268435456
+
+# Single lookups are timed once every TIMING_SAMPLE_MASK + 1 calls
+TIMING_SAMPLE_MASK = 127
+
+# Rows fetched per sqlite3 call while loading the tables into memory
+LOAD_FETCH_SIZE = 10000
+
+# Distinct URLs whose normalized form is remembered between lookups
+URL_CACHE_SIZE = 8192
+
+# A load from the database also writes the loaded maps to db_path +
+# SNAPSHOT_SUFFIX; a restart reads them back instead of decoding every row,
+# as long as no entry changed since (see _load_snapshot_file)
+SNAPSHOT_SUFFIX = ".snap"
+SNAPSHOT_FORMAT = 1
+# Metadata maps saved in a snapshot, in order; CIDR trees and ranges are rebuilt from _cidr_metadata
+SNAPSHOT_MAPS = ("_domain_meta", "_url_meta", "_ip_int_meta", "_ip_meta", "_cidr_metadata")
+
+# Statements writing rows queued by add_entries, by entry kind (URL rows carry url_norm)
+QUEUED_INSERTS = {
+    "domain": "INSERT OR REPLACE INTO blacklist_domain (domain, date, score, source) VALUES (?, ?, ?, ?)",
+    "url": "INSERT OR REPLACE INTO blacklist_url (url, date, score, source, url_norm) VALUES (?, ?, ?, ?, ?)",
+    "ip": "INSERT OR REPLACE INTO blacklist_ip (ip, date, score, source) VALUES (?, ?, ?, ?)",
+}
+
+# Rows written per transaction by the batch add_* methods, so a large load
+# keeps the WAL bounded and lets other connections write between chunks
+BULK_CHUNK = 10000
+
+# Big-endian 32-bit unsigned, for packed IPv4 addresses
+_IPV4_STRUCT = struct.Struct('!I')
+# Bound once: ip_to_int runs on every IP lookup, where each attribute load shows
+_unpack_ipv4 = _IPV4_STRUCT.unpack
+_inet_pton = socket.inet_pton
+_AF_INET = socket.AF_INET
+
+
+@dataclass(slots=True, frozen=True)
 class EntryMetadata:
-    """Metadata for a blacklist entry."""
+    """Metadata for a blacklist entry.
+
+    Hundreds of thousands of entries share a handful of source names and
+    feed dates, so both are interned: every entry points at one string object
+    per distinct value instead of carrying its own copy. Records are
+    immutable, so bulk loads can share one instance between entries with
+    the same values (see _MetadataPool).
+    """
     source: str
     date: str
     score: float
 
+    def __post_init__(self):
+        if type(self.source) is str:
+            object.__setattr__(self, "source", sys.intern(self.source))
+        if type(self.date) is str:
+            object.__setattr__(self, "date", sys.intern(self.date))
+
+
+class _MetadataPool(dict):
+    """One shared EntryMetadata per distinct (source, date, score) in a bulk load.
+
+    Feeds stamp a whole download with one date and score, so a load of
+    hundreds of thousands of rows usually needs only a few hundred records.
+    The pool lives for one load or batch; the entries keep the shared
+    records and the pool itself is dropped.
+    """
+    __slots__ = ()
+
+    def metadata(self, source: str, date: str, score: float) -> EntryMetadata:
+        key = (source, date, score)
+        metadata = self.get(key)
+        if metadata is None:
+            metadata = self[key] = EntryMetadata(source, date, score)
+        return metadata
+
+
+_MISSING = object()
+
+
+class _CountedMetadata(dict):
+    """
+    Metadata map (value -> EntryMetadata) for one entry kind.
+
+    Every insert, replace, pop and clear also updates a counter of entries
+    per (source, kind) shared by all the maps of a storage, so per-source
+    statistics are read from a few dozen counters instead of a scan over
+    every entry. Lookups are plain dict lookups.
+    """
+
+    __slots__ = ("_kind", "_counts")
+
+    def __init__(self, kind: str, counts: Counter):
+        super().__init__()
+        self._kind = kind
+        self._counts = counts
+
+    def _discount(self, source: str):
+        key = (source, self._kind)
+        self._counts[key] -= 1
+        if self._counts[key] <= 0:
+            del self._counts[key]
+
+    def __setitem__(self, key, metadata: EntryMetadata):
+        old = self.get(key)
+        if old is not None:
+            self._discount(old.source)
+        super().__setitem__(key, metadata)
+        self._counts[(metadata.source, self._kind)] += 1
+
+    def update_counted(self, entries: Dict):
+        """Insert many entries, counting them in one pass instead of per entry."""
+        if self:
+            for key in entries.keys() & self.keys():
+                self._discount(super().__getitem__(key).source)
+        super().update(entries)
+        self._counts.update((metadata.source, self._kind) for metadata in entries.values())
+
+    def update_shared(self, keys: List, metadata: EntryMetadata):
+        """Map many keys to one shared metadata record, counting them in one step."""
+        entries = dict.fromkeys(keys, metadata)
+        if self:
+            for key in entries.keys() & self.keys():
+                self._discount(super().__getitem__(key).source)
+        super().update(entries)
+        self._counts[(metadata.source, self._kind)] += len(entries)
+
+    def pop(self, key, default=_MISSING):
+        metadata = super().pop(key, _MISSING)
+        if metadata is _MISSING:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        self._discount(metadata.source)
+        return metadata
+
+    def clear(self):
+        for metadata in self.values():
+            self._discount(metadata.source)
+        super().clear()
+
 
 @dataclass
 class StorageMetrics:
     """Performance metrics for storage operations."""
-    total_lookups: int = 0
-    domain_lookups: int = 0
-    url_lookups: int = 0
-    ip_lookups: int = 0
-    cache_hits: int = 0
-    cache_misses: int = 0
-    avg_lookup_time_ms: float = 0.0
+    # Lookups per (kind, found); totals and hit rates are derived in get_metrics()
+    lookup_counts: Counter = field(default_factory=Counter)
+    # Time spent in the sampled lookups, averaged lazily in get_metrics()
+    lookup_time_ns: int = 0
+    timed_lookups: int = 0
     memory_usage_mb: float = 0.0
     last_reload: Optional[datetime] = None
 
@@ -83,6 +231,19 @@ class StorageMetrics:
     ips_as_integers: int = 0
 
 
+# Query parameters removed by normalize_url
+TRACKING_PARAMS = frozenset([
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
+    'fbclid', 'gclid', 'mc_eid', '_ga', 'ref', 'referrer'
+])
+
+# http(s) URLs that normalize_url can take apart by slicing (no brackets,
+# ';' params or empty host), and query parameters that parse_qs/urlencode
+# would return unchanged (name=value, both made of unreserved characters)
+_SIMPLE_URL_RE = re.compile(r'(https?://[^/?#\[\];]+)([^?#\[\];]*)(?:\?([^#\[\];]*))?(?:#.*)?', re.DOTALL)
+_SIMPLE_QUERY_RE = re.compile(r'[a-z0-9_.~-]+=[a-z0-9_.~-]+(?:&[a-z0-9_.~-]+=[a-z0-9_.~-]+)*')
+
+
 def normalize_url(url: str) -> str:
     """
     Normalize URL to reduce duplicates.
@@ -93,6 +254,11 @@ def normalize_url(url: str) -> str:
     - Strip trailing slashes from path
     - Ensure scheme (default to http if missing)
 
+    Plain http(s) URLs are handled with string slicing; anything else (odd
+    characters, percent-encoded or repeated query parameters, ...) goes
+    through urlparse/parse_qs. Both paths give the same result, which is
+    also what is stored in the url_norm column.
+
     Args:
         url: URL to normalize
 
@@ -105,21 +271,35 @@ def normalize_url(url: str) -> str:
         >>> normalize_url("http://evil.com/?utm_source=spam")
         "http://evil.com"
     """
+    lowered = url.lower()
+    if lowered.isascii() and lowered.isprintable() and ' ' not in lowered:
+        match = _SIMPLE_URL_RE.fullmatch(lowered)
+        if match:
+            base, path, query = match.groups()
+            path = path.rstrip('/') or '/'
+            if not query:
+                return base + path
+            if _SIMPLE_QUERY_RE.fullmatch(query):
+                params = query.split('&')
+                names = [param.partition('=')[0] for param in params]
+                if len(set(names)) == len(names):
+                    kept = [param for param, name in zip(params, names) if name not in TRACKING_PARAMS]
+                    return base + path + ('?' + '&'.join(kept) if kept else '')
+    return _normalize_url_parsed(lowered)
+
+
+def _normalize_url_parsed(url: str) -> str:
+    """normalize_url for an already lowercased URL, using the urllib parsers."""
     try:
         # Parse URL
-        parsed = urlparse(url.lower())
+        parsed = urlparse(url)
 
         # Filter out tracking parameters
         if parsed.query:
             query_params = parse_qs(parsed.query)
-            # Remove common tracking parameters
-            tracking_params = {
-                'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content',
-                'fbclid', 'gclid', 'mc_eid', '_ga', 'ref', 'referrer'
-            }
             filtered_params = {
                 k: v for k, v in query_params.items()
-                if k.lower() not in tracking_params
+                if k.lower() not in TRACKING_PARAMS
             }
             query_string = urlencode(filtered_params, doseq=True)
         else:
@@ -138,7 +318,13 @@ def normalize_url(url: str) -> str:
         return normalized
     except Exception:
         # If normalization fails, return original lowercase
-        return url.lower()
+        return url
+
+
+# Lookups see the same URLs again and again; normalization is a pure function
+# of the text, so its results stay valid across adds and reloads. Loading and
+# adding call normalize_url directly so bulk inserts do not churn the cache
+_normalize_lookup_url = functools.lru_cache(maxsize=URL_CACHE_SIZE)(normalize_url)
 
 
 def ip_to_int(ip: str) -> Optional[int]:
@@ -160,11 +346,18 @@ def ip_to_int(ip: str) -> Optional[int]:
         >>> ip_to_int("10.0.0.1")
         167772161
     """
+    if ':' in ip:
+        # IPv6 - too large for int, keep as string
+        return None
+
+    # Canonical dotted quads are parsed in C; anything inet_pton rejects
+    # (leading zeros, short forms, ...) keeps the lenient parsing below
     try:
-        if ':' in ip:
-            # IPv6 - too large for int, keep as string
-            return None
+        return _unpack_ipv4(_inet_pton(_AF_INET, ip))[0]
+    except (OSError, ValueError):
+        pass
 
+    try:
         # IPv4 - convert to 32-bit integer
         parts = ip.split('.')
         if len(parts) != 4:
@@ -206,7 +399,7 @@ class HybridStorage:
     while maintaining SQLite persistence for data durability and historical queries.
 
     Key features (v0.4.0):
-    - In-memory sets for domain/URL/IP lookups (O(1) average case)
+    - In-memory hash maps for domain/URL/IP lookups (O(1) average case)
     - PyTricia radix trees for fast CIDR matching (O(log n))
     - Tiered lookup (hot/cold sources) for early exit optimization
     - URL normalization to reduce duplicates and memory usage
@@ -241,49 +434,54 @@ class HybridStorage:
             os.makedirs(db_dir, exist_ok=True)
 
         self.db_path = db_path
+        self._snapshot_file = None if db_path == ":memory:" else db_path + SNAPSHOT_SUFFIX
 
         # ========== In-memory data structures ==========
 
-        # Legacy unified storage (kept for backward compatibility)
-        self._domains: Set[str] = set()
-        self._urls: Set[str] = set()
-        self._ips: Set[str] = set()
-
-        # v0.4.0: Tiered storage for optimized lookup
-        self._hot_domains: Set[str] = set()
-        self._cold_domains: Set[str] = set()
-        self._hot_urls: Set[str] = set()
-        self._cold_urls: Set[str] = set()
-
-        # v0.4.0: Integer-based IP storage for IPv4
-        self._ips_int: Set[int] = set()  # IPv4 as integers
-        self._ips_str: Set[str] = set()  # IPv6 as strings
-        self._hot_ips_int: Set[int] = set()
-        self._cold_ips_int: Set[int] = set()
-        self._hot_ips_str: Set[str] = set()
-        self._cold_ips_str: Set[str] = set()
-
-        # Metadata storage (value -> entry info)
-        self._domain_meta: Dict[str, EntryMetadata] = {}
-        self._url_meta: Dict[str, EntryMetadata] = {}
-        self._ip_meta: Dict[str, EntryMetadata] = {}
-        self._ip_int_meta: Dict[int, EntryMetadata] = {}  # Integer IP metadata
+        # Metadata storage (value -> entry info), counted per (source, kind).
+        # The maps are the only copy of each entry: lookups probe them
+        # directly, and hot/cold source tiers are only tracked in metrics,
+        # from the metadata of each hit
+        self._entry_counts: Counter = Counter()
+        self._domain_meta: Dict[str, EntryMetadata] = _CountedMetadata("domain", self._entry_counts)
+        self._url_meta: Dict[str, EntryMetadata] = _CountedMetadata("url", self._entry_counts)
+        # v0.4.0: IPv4 is keyed by integer, IPv6 by string
+        self._ip_int_meta: Dict[int, EntryMetadata] = _CountedMetadata("ip", self._entry_counts)
+        self._ip_meta: Dict[str, EntryMetadata] = _CountedMetadata("ip", self._entry_counts)
+
+        # Read-only set views of the keys above
+        self._domains = self._domain_meta.keys()
+        self._urls = self._url_meta.keys()
 
         # CIDR handling (will be initialized later if pytricia available)
         self._ipv4_cidr_tree = None
         self._ipv6_cidr_tree = None
-        self._cidr_metadata: Dict[str, EntryMetadata] = {}
+        self._cidr_metadata: Dict[str, EntryMetadata] = _CountedMetadata("ip", self._entry_counts)
         self._use_pytricia = False
 
-        # Fallback CIDR list (if pytricia not available)
-        self._cidr_ranges: List[Tuple] = []
+        # Fallback CIDR structures (if pytricia not available): merged ranges
+        # answering membership, and a longest-prefix map of sources like the trees
+        self._cidr_networks = NetworkSet()
+        self._cidr_sources = PrefixMap()
 
         # Thread safety
         self._lock = threading.RLock()
+        # One connection per thread, kept open for the life of the storage
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
         self._loading = threading.Event()
 
         # Performance metrics
         self.metrics = StorageMetrics()
+        # Numbers single lookups so only every TIMING_SAMPLE_MASK + 1'th is timed
+        self._lookup_seq = itertools.count()
+        self._snapshot = None
+        self._snapshot_time = 0.0
+        # Guards only the diagnostics snapshot, so polling never waits on a reload or bulk add
+        self._snapshot_lock = threading.Lock()
+        # Rows queued by add_entries: (kind, row)
+        self._writer = WriteBehindQueue(self._write_rows, self.db_path)
 
         # Initialize database and load data
         try:
@@ -295,6 +493,7 @@ class HybridStorage:
             self.logger.error(f"Failed to initialize storage: {e}", exc_info=True)
             self.logger.warning("Starting with empty blacklist")
             self._loading.set()
+        atexit.register(_flush_at_exit, weakref.ref(self))
 
     def _get_default_db_path(self) -> str:
         """Get platform-specific default database path."""
@@ -320,7 +519,7 @@ class HybridStorage:
 
     def _init_db(self):
         """Initialize SQLite database with required tables."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._get_connection() as conn:
             # Enable optimizations
             conn.execute("PRAGMA journal_mode=WAL;")
             conn.execute("PRAGMA synchronous=NORMAL;")
@@ -333,11 +532,12 @@ class HybridStorage:
                     date TEXT,
                     score REAL,
                     source TEXT
-                )
-            """)
-            conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_blacklist_domain ON blacklist_domain(domain);
+                ) WITHOUT ROWID
             """)
+            ensure_without_rowid(conn, "blacklist_domain")
+            # The primary key holds the whole row, so no secondary index is needed
+            conn.execute("DROP INDEX IF EXISTS idx_blacklist_domain")
+            conn.execute("DROP INDEX IF EXISTS idx_blacklist_domain_source")
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_domain_source ON blacklist_domain(source);
             """)
@@ -348,14 +548,19 @@ class HybridStorage:
                     date TEXT,
                     score REAL,
                     source TEXT
-                )
-            """)
-            conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_blacklist_url ON blacklist_url(url);
+                ) WITHOUT ROWID
             """)
+            ensure_without_rowid(conn, "blacklist_url")
+            # The primary key holds the whole row, so no secondary index is needed
+            conn.execute("DROP INDEX IF EXISTS idx_blacklist_url")
+            conn.execute("DROP INDEX IF EXISTS idx_blacklist_url_source")
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_url_source ON blacklist_url(source);
             """)
+            # Normalized URL stored at insert time so loading skips normalize_url
+            url_columns = {row[1] for row in conn.execute("PRAGMA table_info(blacklist_url)")}
+            if 'url_norm' not in url_columns:
+                conn.execute("ALTER TABLE blacklist_url ADD COLUMN url_norm TEXT")
 
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS blacklist_ip (
@@ -363,14 +568,35 @@ class HybridStorage:
                     date TEXT,
                     score REAL,
                     source TEXT
-                )
+                ) WITHOUT ROWID
             """)
+            ensure_without_rowid(conn, "blacklist_ip")
+            # The primary key holds the whole row, so no secondary index is needed
+            conn.execute("DROP INDEX IF EXISTS idx_blacklist_ip")
+            conn.execute("DROP INDEX IF EXISTS idx_blacklist_ip_source")
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_blacklist_ip ON blacklist_ip(ip);
+                CREATE INDEX IF NOT EXISTS idx_ip_source ON blacklist_ip(source);
             """)
+
+            # Token of the snapshot file that matches the tables. Any change to an
+            # entry, by this or any other process, clears it; the WHEN clause
+            # keeps the per-row cost of a bulk insert to one read once it is clear
             conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_ip_source ON blacklist_ip(source);
+                CREATE TABLE IF NOT EXISTS snapshot_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    token INTEGER
+                )
             """)
+            conn.execute("INSERT OR IGNORE INTO snapshot_state (id, token) VALUES (0, NULL)")
+            for table, _ in BLACKLIST_TABLES.values():
+                for event in ("INSERT", "UPDATE", "DELETE"):
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_snapshot_{event.lower()} AFTER {event} ON {table}
+                        WHEN (SELECT token FROM snapshot_state WHERE id = 0) IS NOT NULL
+                        BEGIN
+                            UPDATE snapshot_state SET token = NULL WHERE id = 0;
+                        END
+                    """)
 
             # Create updates table
             conn.execute("""
@@ -405,8 +631,26 @@ class HybridStorage:
             self._use_pytricia = False
 
     def _get_connection(self) -> sqlite3.Connection:
-        """Get a database connection."""
-        return sqlite3.connect(self.db_path, timeout=30.0)
+        """Get this thread's database connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("PRAGMA temp_store=MEMORY;")
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Write any queued entries, then close every database connection opened by this storage instance."""
+        self.flush()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
 
     def _load_all_data(self):
         """Load all blacklist data from database into memory."""
@@ -414,57 +658,161 @@ class HybridStorage:
         self.logger.info("Loading blacklist data into memory (v0.4.0 optimized)...")
 
         with self._lock:
-            # Clear existing data
-            self._domains.clear()
-            self._urls.clear()
-            self._ips.clear()
-            self._hot_domains.clear()
-            self._cold_domains.clear()
-            self._hot_urls.clear()
-            self._cold_urls.clear()
-            self._ips_int.clear()
-            self._ips_str.clear()
-            self._hot_ips_int.clear()
-            self._cold_ips_int.clear()
-            self._hot_ips_str.clear()
-            self._cold_ips_str.clear()
-            self._domain_meta.clear()
-            self._url_meta.clear()
-            self._ip_meta.clear()
-            self._ip_int_meta.clear()
-            self._cidr_metadata.clear()
-
-            if self._use_pytricia:
-                # Clear CIDR trees
-                self._ipv4_cidr_tree = None
-                self._ipv6_cidr_tree = None
-                self._init_cidr_trees()
-            else:
-                self._cidr_ranges.clear()
-
-            # Load data
-            self._load_domains_from_db()
-            self._load_urls_from_db()
-            self._load_ips_from_db()
+            # Rows still queued by add_entries must be in the tables read below
+            self._flush_pending()
+            # Load into fresh containers while lookups keep using the current
+            # ones, then publish them all in one dict update (atomic under
+            # the GIL), so a reload never exposes empty or half-loaded sets.
+            # The loaders run one after the other: they are bound by Python
+            # work that holds the GIL, and measured slower on three threads
+            index = self._load_snapshot_file()
+            if index is None:
+                # The backfill fires the snapshot triggers, so it has to
+                # commit before the token is stored
+                self._backfill_url_norm()
+                token = self._claim_snapshot_token()
+                index = self._new_index()
+                self._load_domains_from_db(index)
+                self._load_urls_from_db(index)
+                self._load_ips_from_db(index)
+                if token is not None:
+                    self._save_snapshot_file(index, token)
+            vars(self).update(index)
 
         elapsed = time.perf_counter() - start_time
-        total_entries = len(self._domains) + len(self._urls) + len(self._ips) + len(self._ips_int) + len(self._ips_str) + len(self._cidr_metadata)
+        total_entries = self.count_entries()
 
         self.logger.info(
             f"Loaded {total_entries} entries in {elapsed:.2f}s "
-            f"({len(self._domains)} domains [{len(self._hot_domains)} hot], "
-            f"{len(self._urls)} URLs [{len(self._hot_urls)} hot], "
-            f"{len(self._ips) + len(self._ips_int) + len(self._ips_str)} IPs "
-            f"[{len(self._hot_ips_int) + len(self._hot_ips_str)} hot, {len(self._ips_int)} as int], "
+            f"({len(self._domains)} domains, "
+            f"{len(self._urls)} URLs, "
+            f"{len(self._ip_int_meta) + len(self._ip_meta)} IPs "
+            f"[{len(self._ip_int_meta)} as int], "
             f"{len(self._cidr_metadata)} CIDRs)"
         )
 
         self.metrics.last_reload = datetime.now()
 
-    def _load_domains_from_db(self):
-        """Load all domains from database into memory with tiered classification."""
-        conn = self._get_connection()
+    def _new_index(self) -> Dict[str, object]:
+        """Empty in-memory containers, keyed by the attribute each one replaces."""
+        entry_counts = Counter()
+        index = {
+            "_entry_counts": entry_counts,
+            "_domain_meta": _CountedMetadata("domain", entry_counts),
+            "_url_meta": _CountedMetadata("url", entry_counts),
+            "_ip_int_meta": _CountedMetadata("ip", entry_counts),
+            "_ip_meta": _CountedMetadata("ip", entry_counts),
+            "_cidr_metadata": _CountedMetadata("ip", entry_counts),
+            "_cidr_networks": NetworkSet(),
+            "_cidr_sources": PrefixMap(),
+            "_ipv4_cidr_tree": None,
+            "_ipv6_cidr_tree": None,
+        }
+        index["_domains"] = index["_domain_meta"].keys()
+        index["_urls"] = index["_url_meta"].keys()
+        if self._use_pytricia:
+            import pytricia
+            index["_ipv4_cidr_tree"] = pytricia.PyTricia(32)
+            index["_ipv6_cidr_tree"] = pytricia.PyTricia(128)
+        return index
+
+    def _claim_snapshot_token(self) -> Optional[int]:
+        """Store a new snapshot token before the tables are read, or return None if it cannot be stored.
+
+        A change committed after this clears the token again, so a snapshot
+        written under it is only ever trusted if it saw every change.
+        """
+        if self._snapshot_file is None:
+            return None
+        token = random.getrandbits(62)
+        try:
+            with self._get_connection() as conn:
+                conn.execute("UPDATE snapshot_state SET token = ? WHERE id = 0", (token,))
+                conn.commit()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Not writing a snapshot: {e}")
+            return None
+        return token
+
+    def _save_snapshot_file(self, index: Dict[str, object], token: int):
+        """Write the loaded maps to the snapshot file, tagged with token."""
+        # One (source, date, score) record per shared EntryMetadata, and per
+        # map the keys of each record, so loading builds each group with one
+        # dict.fromkeys and counts it with one addition
+        shared = {}
+        maps = []
+        for name in SNAPSHOT_MAPS:
+            groups = {}
+            for key, metadata in index[name].items():
+                keys = groups.get(id(metadata))
+                if keys is None:
+                    keys = groups[id(metadata)] = []
+                    shared.setdefault(id(metadata), metadata)
+                keys.append(key)
+            maps.append(groups)
+        positions = {ref: i for i, ref in enumerate(shared)}
+        records = [(m.source, m.date, m.score) for m in shared.values()]
+        maps = [[(positions[ref], keys) for ref, keys in groups.items()] for groups in maps]
+        temp_path = f"{self._snapshot_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                marshal.dump((SNAPSHOT_FORMAT, token, records, maps, self.metrics.urls_normalized), f)
+            os.replace(temp_path, self._snapshot_file)
+        except OSError as e:
+            self.logger.warning(f"Failed to write snapshot {self._snapshot_file}: {e}")
+
+    def _load_snapshot_file(self) -> Optional[Dict[str, object]]:
+        """Containers rebuilt from the snapshot file, or None if it is missing or out of date."""
+        if self._snapshot_file is None:
+            return None
         try:
+            with open(self._snapshot_file, "rb") as f:
+                snapshot = marshal.loads(f.read())
+            if snapshot[0] != SNAPSHOT_FORMAT:
+                return None
+            _, token, records, maps, urls_normalized = snapshot
+            with self._get_connection() as conn:
+                row = conn.execute("SELECT token FROM snapshot_state WHERE id = 0").fetchone()
+            if row is None or row[0] != token:
+                return None
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, TypeError, IndexError, sqlite3.Error) as e:
+            self.logger.warning(f"Ignoring snapshot {self._snapshot_file}: {e}")
+            return None
+
+        shared = [EntryMetadata(*record) for record in records]
+        index = self._new_index()
+        for name, groups in zip(SNAPSHOT_MAPS, maps):
+            entries = index[name]
+            for position, keys in groups:
+                entries.update_shared(keys, shared[position])
+
+        for ip, metadata in index["_cidr_metadata"].items():
+            if self._use_pytricia:
+                tree = index["_ipv6_cidr_tree"] if ':' in ip else index["_ipv4_cidr_tree"]
+                tree[ip] = metadata.source
+            else:
+                network = ipaddress.ip_network(ip, strict=False)
+                index["_cidr_networks"].add(network)
+                index["_cidr_sources"][network] = metadata.source
+
+        self.metrics.urls_normalized = urls_normalized
+        self.metrics.ips_as_integers = len(index["_ip_int_meta"])
+        self.logger.debug(f"Loaded snapshot {self._snapshot_file}")
+        return index
+
+    @staticmethod
+    def _fetch_rows(cursor: sqlite3.Cursor):
+        """Iterate over a cursor's rows, fetched LOAD_FETCH_SIZE at a time."""
+        cursor.arraysize = LOAD_FETCH_SIZE
+        return itertools.chain.from_iterable(iter(cursor.fetchmany, []))
+
+    def _load_domains_from_db(self, index: Dict[str, object]):
+        """Load all domains from database into the given containers."""
+        pool = _MetadataPool()
+        domain_meta = {}
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 "SELECT domain, source, date, score FROM blacklist_domain"
             )
@@ -472,23 +820,15 @@ class HybridStorage:
             loaded = 0
             errors = 0
 
-            for domain, source, date, score in cursor:
+            for domain, source, date, score in self._fetch_rows(cursor):
                 try:
                     if not domain or not isinstance(domain, str):
                         raise ValueError("Invalid domain")
 
                     domain_lower = domain.lower()
-                    metadata = EntryMetadata(source, date, score)
-
-                    # Add to unified storage (backward compatibility)
-                    self._domains.add(domain_lower)
-                    self._domain_meta[domain_lower] = metadata
+                    metadata = pool.metadata(source, date, score)
 
-                    # v0.4.0: Add to tiered storage
-                    if source in HOT_DOMAIN_SOURCES:
-                        self._hot_domains.add(domain_lower)
-                    else:
-                        self._cold_domains.add(domain_lower)
+                    domain_meta[domain_lower] = metadata
 
                     loaded += 1
 
@@ -496,47 +836,56 @@ class HybridStorage:
                     self.logger.warning(f"Skipping invalid domain entry: {e}")
                     errors += 1
 
+            index["_domain_meta"].update_counted(domain_meta)
+
             if errors > 0:
                 self.logger.info(f"Loaded {loaded} domains ({errors} errors)")
             else:
                 self.logger.debug(f"Loaded {loaded} domains")
 
-        finally:
-            conn.close()
+    def _backfill_url_norm(self):
+        """Store the normalized form of URLs written without one, so later loads reuse it."""
+        with self._get_connection() as conn:
+            urls = [row[0] for row in conn.execute("SELECT url FROM blacklist_url WHERE url_norm IS NULL")]
+            backfill = []
+            for url in urls:
+                try:
+                    backfill.append((normalize_url(url), url))
+                except Exception as e:
+                    self.logger.warning(f"Not normalizing URL entry {url!r}: {e}")
+            if backfill:
+                conn.executemany("UPDATE blacklist_url SET url_norm = ? WHERE url = ?", backfill)
+                conn.commit()
 
-    def _load_urls_from_db(self):
-        """Load all URLs from database into memory with normalization and tiering."""
-        conn = self._get_connection()
-        try:
+    def _load_urls_from_db(self, index: Dict[str, object]):
+        """Load all URLs from database into the given containers, normalized."""
+        pool = _MetadataPool()
+        url_meta = {}
+        with self._get_connection() as conn:
             cursor = conn.execute(
-                "SELECT url, source, date, score FROM blacklist_url"
+                "SELECT url, url_norm, source, date, score FROM blacklist_url"
             )
 
             loaded = 0
             errors = 0
             normalized_count = 0
 
-            for url, source, date, score in cursor:
+            for url, url_norm, source, date, score in self._fetch_rows(cursor):
                 try:
                     if not url or not isinstance(url, str):
                         raise ValueError("Invalid URL")
 
-                    # v0.4.0: Normalize URL to reduce duplicates
-                    url_normalized = normalize_url(url)
+                    # v0.4.0: Normalize URL to reduce duplicates (rows written
+                    # without url_norm since the backfill are normalized here)
+                    url_normalized = url_norm
+                    if url_normalized is None:
+                        url_normalized = normalize_url(url)
                     if url_normalized != url:
                         normalized_count += 1
 
-                    metadata = EntryMetadata(source, date, score)
+                    metadata = pool.metadata(source, date, score)
 
-                    # Add to unified storage (backward compatibility)
-                    self._urls.add(url_normalized)
-                    self._url_meta[url_normalized] = metadata
-
-                    # v0.4.0: Add to tiered storage
-                    if source in HOT_URL_SOURCES:
-                        self._hot_urls.add(url_normalized)
-                    else:
-                        self._cold_urls.add(url_normalized)
+                    url_meta[url_normalized] = metadata
 
                     loaded += 1
 
@@ -544,6 +893,7 @@ class HybridStorage:
                     self.logger.warning(f"Skipping invalid URL entry: {e}")
                     errors += 1
 
+            index["_url_meta"].update_counted(url_meta)
             self.metrics.urls_normalized = normalized_count
 
             if errors > 0:
@@ -551,13 +901,13 @@ class HybridStorage:
             else:
                 self.logger.debug(f"Loaded {loaded} URLs ({normalized_count} normalized)")
 
-        finally:
-            conn.close()
-
-    def _load_ips_from_db(self):
-        """Load all IPs and CIDR ranges with integer storage and tiering."""
-        conn = self._get_connection()
-        try:
+    def _load_ips_from_db(self, index: Dict[str, object]):
+        """Load all IPs and CIDR ranges into the given containers."""
+        pool = _MetadataPool()
+        ip_meta, ip_int_meta, cidr_metadata = {}, {}, {}
+        cidr_networks, cidr_sources = index["_cidr_networks"], index["_cidr_sources"]
+        ipv4_tree, ipv6_tree = index["_ipv4_cidr_tree"], index["_ipv6_cidr_tree"]
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 "SELECT ip, source, date, score FROM blacklist_ip"
             )
@@ -567,32 +917,33 @@ class HybridStorage:
             errors = 0
             ips_as_int = 0
 
-            for ip, source, date, score in cursor:
+            for ip, source, date, score in self._fetch_rows(cursor):
                 try:
                     if not ip or not isinstance(ip, str):
                         raise ValueError("Invalid IP")
 
-                    metadata = EntryMetadata(source, date, score)
+                    metadata = pool.metadata(source, date, score)
 
                     if '/' in ip:
                         # CIDR range
                         if self._use_pytricia:
                             # Add to radix tree
                             if ':' in ip:  # IPv6
-                                self._ipv6_cidr_tree[ip] = source
+                                ipv6_tree[ip] = source
                             else:  # IPv4
-                                self._ipv4_cidr_tree[ip] = source
+                                ipv4_tree[ip] = source
                         else:
                             # Add to fallback list
                             try:
                                 network = ipaddress.ip_network(ip, strict=False)
-                                self._cidr_ranges.append((network, metadata))
+                                cidr_networks.add(network)
+                                cidr_sources[network] = source
                             except ValueError as e:
                                 self.logger.warning(f"Invalid CIDR {ip}: {e}")
                                 errors += 1
                                 continue
 
-                        self._cidr_metadata[ip] = metadata
+                        cidr_metadata[ip] = metadata
                         loaded_cidrs += 1
                     else:
                         # Single IP - v0.4.0: Store IPv4 as integer
@@ -600,30 +951,11 @@ class HybridStorage:
 
                         if ip_int is not None:
                             # IPv4 - store as integer
-                            self._ips_int.add(ip_int)
-                            self._ip_int_meta[ip_int] = metadata
+                            ip_int_meta[ip_int] = metadata
                             ips_as_int += 1
-
-                            # Tiered storage for IPv4
-                            if source in HOT_IP_SOURCES:
-                                self._hot_ips_int.add(ip_int)
-                            else:
-                                self._cold_ips_int.add(ip_int)
                         else:
                             # IPv6 - keep as string
-                            self._ips_str.add(ip)
-                            self._ip_meta[ip] = metadata
-
-                            # Tiered storage for IPv6
-                            if source in HOT_IP_SOURCES:
-                                self._hot_ips_str.add(ip)
-                            else:
-                                self._cold_ips_str.add(ip)
-
-                        # Also add to legacy storage (backward compatibility)
-                        self._ips.add(ip)
-                        if ip not in self._ip_meta:
-                            self._ip_meta[ip] = metadata
+                            ip_meta[ip] = metadata
 
                         loaded_ips += 1
 
@@ -631,6 +963,9 @@ class HybridStorage:
                     self.logger.warning(f"Skipping invalid IP entry: {e}")
                     errors += 1
 
+            index["_ip_meta"].update_counted(ip_meta)
+            index["_ip_int_meta"].update_counted(ip_int_meta)
+            index["_cidr_metadata"].update_counted(cidr_metadata)
             self.metrics.ips_as_integers = ips_as_int
 
             if errors > 0:
@@ -640,20 +975,15 @@ class HybridStorage:
             else:
                 self.logger.debug(f"Loaded {loaded_ips} IPs ({ips_as_int} as integers), {loaded_cidrs} CIDRs")
 
-        finally:
-            conn.close()
-
     # ========== Fast Lookup Methods (v0.4.0 Optimized) ==========
 
     def is_domain_blacklisted(self, domain: str) -> bool:
         """
         Check if a domain or any parent domain is blacklisted.
 
-        v0.4.0 optimization: Checks hot sources first for early exit.
-
         Performance: O(depth) where depth is number of domain levels (typically 2-5).
-        All lookups are in-memory O(1) hash lookups.
-        Hot source optimization provides 25-40% speedup for most lookups.
+        All lookups are in-memory O(1) hash lookups in a single set, so a miss
+        costs one probe per level.
 
         Args:
             domain: Domain name to check (e.g., "example.com")
@@ -668,41 +998,30 @@ class HybridStorage:
             >>> storage.is_domain_blacklisted("sub.evil.com")
             True
         """
-        start = time.perf_counter()
-
-        domain = domain.lower()
-
-        # v0.4.0: Check hot sources first (PhishTank, PhishStats = ~91K domains)
-        if domain in self._hot_domains:
-            self.metrics.hot_source_hits += 1
-            self._update_metrics('domain', start, True)
-            return True
-
-        # Check parent domains in hot sources
-        parts = domain.split('.')
-        for i in range(1, len(parts)):
-            parent = '.'.join(parts[i:])
-            if parent in self._hot_domains:
-                self.metrics.hot_source_hits += 1
-                self._update_metrics('domain', start, True)
-                return True
-
-        # Check cold sources only if not found in hot
-        if domain in self._cold_domains:
-            self.metrics.cold_source_hits += 1
-            self._update_metrics('domain', start, True)
-            return True
-
-        # Check parent domains in cold sources
-        for i in range(1, len(parts)):
-            parent = '.'.join(parts[i:])
-            if parent in self._cold_domains:
-                self.metrics.cold_source_hits += 1
-                self._update_metrics('domain', start, True)
-                return True
-
-        self._update_metrics('domain', start, False)
-        return False
+        start = 0 if next(self._lookup_seq) & TIMING_SAMPLE_MASK else time.perf_counter_ns()
+
+        domains = self._domain_meta
+
+        # Walk the domain and its parents by slicing past each dot, so no
+        # label list is built or re-joined per level
+        hit = None
+        candidate = domain.lower()
+        while True:
+            if candidate in domains:
+                hit = candidate
+                break
+            dot = candidate.find('.')
+            if dot < 0:
+                break
+            candidate = candidate[dot + 1:]
+
+        found = hit is not None
+        if found:
+            self._count_tier_hit(self._domain_meta.get(hit), HOT_DOMAIN_SOURCES)
+        self.metrics.lookup_counts['domain', found] += 1
+        if start:
+            self._record_timing(start)
+        return found
 
     def is_url_blacklisted(self, url: str) -> bool:
         """
@@ -710,10 +1029,8 @@ class HybridStorage:
 
         v0.4.0 optimizations:
         - Normalizes URL before lookup to catch variations
-        - Checks hot sources first (PhishTank + URLhaus = 74% of URLs)
 
         Performance: O(1) hash lookup in memory.
-        Hot source optimization provides 30-40% speedup.
 
         Args:
             url: URL to check (e.g., "http://example.com/path")
@@ -721,25 +1038,18 @@ class HybridStorage:
         Returns:
             True if URL is blacklisted, False otherwise
         """
-        start = time.perf_counter()
+        start = 0 if next(self._lookup_seq) & TIMING_SAMPLE_MASK else time.perf_counter_ns()
 
         # v0.4.0: Normalize URL to catch variations
-        url_normalized = normalize_url(url)
-
-        # v0.4.0: Check hot sources first (PhishTank + URLhaus = 153K/207K URLs)
-        if url_normalized in self._hot_urls:
-            self.metrics.hot_source_hits += 1
-            self._update_metrics('url', start, True)
-            return True
+        url_normalized = _normalize_lookup_url(url)
 
-        # Check cold sources only if not found in hot
-        if url_normalized in self._cold_urls:
-            self.metrics.cold_source_hits += 1
-            self._update_metrics('url', start, True)
-            return True
-
-        self._update_metrics('url', start, False)
-        return False
+        found = url_normalized in self._url_meta
+        if found:
+            self._count_tier_hit(self._url_meta.get(url_normalized), HOT_URL_SOURCES)
+        self.metrics.lookup_counts['url', found] += 1
+        if start:
+            self._record_timing(start)
+        return found
 
     def is_ip_blacklisted(self, ip: str) -> bool:
         """
@@ -747,12 +1057,10 @@ class HybridStorage:
 
         v0.4.0 optimizations:
         - Integer-based IPv4 lookups (4x smaller, faster comparison)
-        - Hot source check first (BlocklistDE + CINSSCORE = 90% of IPs)
 
         Performance:
         - Exact match: O(1)
         - CIDR with PyTricia: O(log n)
-        - Hot source optimization: 30-40% speedup
 
         Args:
             ip: IP address to check (e.g., "192.168.1.1" or "2001:db8::1")
@@ -760,87 +1068,109 @@ class HybridStorage:
         Returns:
             True if IP is blacklisted, False otherwise
         """
-        start = time.perf_counter()
+        start = 0 if next(self._lookup_seq) & TIMING_SAMPLE_MASK else time.perf_counter_ns()
 
         # v0.4.0: Convert IPv4 to integer for fast lookup
         ip_int = ip_to_int(ip)
 
         if ip_int is not None:
-            # IPv4 - check as integer (hot sources first)
-            if ip_int in self._hot_ips_int:
-                self.metrics.hot_source_hits += 1
-                self._update_metrics('ip', start, True)
-                return True
-
-            if ip_int in self._cold_ips_int:
-                self.metrics.cold_source_hits += 1
-                self._update_metrics('ip', start, True)
-                return True
+            # IPv4 - check as integer; one probe finds the entry and its source
+            metadata = self._ip_int_meta.get(ip_int)
+            found = metadata is not None
+            if found:
+                self._count_tier_hit(metadata, HOT_IP_SOURCES)
+        else:
+            # IPv6 - check as string
+            found = ip in self._ip_meta
+            if found:
+                self._count_tier_hit(self._ip_meta.get(ip), HOT_IP_SOURCES)
+
+        if not found:
+            # Check CIDR ranges (if not exact match)
+            found = self._match_cidr(ip)
+        self.metrics.lookup_counts['ip', found] += 1
+        if start:
+            self._record_timing(start)
+        return found
+
+    def is_ip_blacklisted_many(self, ips: List[str]) -> List[bool]:
+        """
+        Check several IPs in one call (exact match or CIDR containment).
+
+        Exact IPv4/IPv6 hits are resolved with set membership and only misses
+        walk the CIDR structures. Metrics are recorded once for the whole batch
+        instead of per value, and every batch is timed.
+
+        Args:
+            ips: IP addresses to check
+
+        Returns:
+            List of booleans, one per input IP, in input order
+        """
+        start = time.perf_counter_ns()
+
+        results = []
+        hot_hits = 0
+        cold_hits = 0
+        for ip in ips:
+            ip_int = ip_to_int(ip)
+            if ip_int is not None:
+                metadata = self._ip_int_meta.get(ip_int)
+                hit = metadata is not None
+            else:
+                metadata = self._ip_meta.get(ip)
+                hit = metadata is not None
+
+            if hit:
+                if metadata is not None and metadata.source in HOT_IP_SOURCES:
+                    hot_hits += 1
+                else:
+                    cold_hits += 1
+                results.append(True)
+            else:
+                results.append(self._match_cidr(ip))
+
+        found = sum(results)
+        self.metrics.hot_source_hits += hot_hits
+        self.metrics.cold_source_hits += cold_hits
+        self.metrics.lookup_counts['ip', True] += found
+        self.metrics.lookup_counts['ip', False] += len(results) - found
+        self._record_timing(start, len(results))
+        return results
+
+    def _count_tier_hit(self, metadata: Optional[EntryMetadata], hot_sources: frozenset):
+        """Count a hit against the hot or cold source tier (metrics only)."""
+        if metadata is not None and metadata.source in hot_sources:
+            self.metrics.hot_source_hits += 1
         else:
-            # IPv6 - check as string (hot sources first)
-            if ip in self._hot_ips_str:
-                self.metrics.hot_source_hits += 1
-                self._update_metrics('ip', start, True)
-                return True
-
-            if ip in self._cold_ips_str:
-                self.metrics.cold_source_hits += 1
-                self._update_metrics('ip', start, True)
-                return True
-
-        # Check CIDR ranges (if not exact match)
+            self.metrics.cold_source_hits += 1
+
+    def _match_cidr(self, ip: str) -> bool:
+        """Check whether an IP falls inside any blacklisted CIDR range."""
         if self._use_pytricia:
             # Fast radix tree lookup
             try:
                 if ':' in ip:  # IPv6
-                    result = ip in self._ipv6_cidr_tree
+                    return ip in self._ipv6_cidr_tree
                 else:  # IPv4
-                    result = ip in self._ipv4_cidr_tree
-                self._update_metrics('ip', start, result)
-                return result
+                    return ip in self._ipv4_cidr_tree
             except (KeyError, ValueError):
-                self._update_metrics('ip', start, False)
                 return False
         else:
-            # Fallback: linear scan through CIDR ranges
+            # Fallback: binary search over the merged CIDR ranges
+            ip_int = ip_to_int(ip)
+            if ip_int is not None:
+                return self._cidr_networks.contains_int(4, ip_int)
             try:
-                addr = ipaddress.ip_address(ip)
-                for network, _ in self._cidr_ranges:
-                    if addr in network:
-                        self._update_metrics('ip', start, True)
-                        return True
+                return ipaddress.ip_address(ip) in self._cidr_networks
             except ValueError:
                 pass
-
-        self._update_metrics('ip', start, False)
         return False
 
-    def _update_metrics(self, lookup_type: str, start_time: float, found: bool):
-        """Update performance metrics."""
-        elapsed_ms = (time.perf_counter() - start_time) * 1000
-
-        self.metrics.total_lookups += 1
-
-        if lookup_type == 'domain':
-            self.metrics.domain_lookups += 1
-        elif lookup_type == 'url':
-            self.metrics.url_lookups += 1
-        elif lookup_type == 'ip':
-            self.metrics.ip_lookups += 1
-
-        if found:
-            self.metrics.cache_hits += 1
-        else:
-            self.metrics.cache_misses += 1
-
-        # Update running average
-        if self.metrics.total_lookups == 1:
-            self.metrics.avg_lookup_time_ms = elapsed_ms
-        else:
-            self.metrics.avg_lookup_time_ms = (
-                (self.metrics.avg_lookup_time_ms * (self.metrics.total_lookups - 1) + elapsed_ms)
-                / self.metrics.total_lookups
-            )
+    def _record_timing(self, start_ns: int, count: int = 1):
+        """Add the time since start_ns, spent on count lookups, to the timing sample."""
+        self.metrics.lookup_time_ns += time.perf_counter_ns() - start_ns
+        self.metrics.timed_lookups += count
 
     # ========== Metadata Retrieval Methods ==========
 
@@ -854,20 +1184,18 @@ class HybridStorage:
         Returns:
             Source name if blacklisted, None otherwise
         """
-        domain = domain.lower()
-
-        # Check exact match
-        if domain in self._domain_meta:
-            return self._domain_meta[domain].source
+        domains = self._domain_meta
 
-        # Check parent domains
-        parts = domain.split('.')
-        for i in range(1, len(parts)):
-            parent = '.'.join(parts[i:])
-            if parent in self._domain_meta:
-                return self._domain_meta[parent].source
-
-        return None
+        # The domain, then each parent, in one pass with one probe per level
+        candidate = domain.lower()
+        while True:
+            metadata = domains.get(candidate)
+            if metadata is not None:
+                return metadata.source
+            dot = candidate.find('.')
+            if dot < 0:
+                return None
+            candidate = candidate[dot + 1:]
 
     def get_url_blacklist_source(self, url: str) -> Optional[str]:
         """
@@ -879,7 +1207,7 @@ class HybridStorage:
         Returns:
             Source name if blacklisted, None otherwise
         """
-        url_normalized = normalize_url(url)
+        url_normalized = _normalize_lookup_url(url)
         metadata = self._url_meta.get(url_normalized)
         return metadata.source if metadata else None
 
@@ -915,17 +1243,48 @@ class HybridStorage:
             except (KeyError, ValueError):
                 return None
         else:
-            # Fallback: find matching CIDR
+            # Fallback: longest matching CIDR, as the trees report it (IPv4
+            # reuses the integer from the exact-match check)
+            if ip_int is not None:
+                return self._cidr_sources.get_int(4, ip_int)
             try:
-                addr = ipaddress.ip_address(ip)
-                for network, metadata in self._cidr_ranges:
-                    if addr in network:
-                        return metadata.source
+                return self._cidr_sources.get(ipaddress.ip_address(ip))
             except ValueError:
                 pass
 
         return None
 
+    def get_blacklist_sources(self, kind: str, values: List[str]) -> Dict[str, str]:
+        """
+        Get the sources for many values of one kind, exact match only.
+
+        Same contract as Storage.get_blacklist_sources; everything is served
+        from the in-memory metadata (URLs are normalized before lookup).
+
+        Args:
+            kind: 'domain', 'url' or 'ip'
+            values: Values to look up
+
+        Returns:
+            Dict of value -> source for the values that are blacklisted
+        """
+        sources = {}
+        for value in values:
+            if kind == 'domain':
+                metadata = self._domain_meta.get(value.lower())
+            elif kind == 'url':
+                metadata = self._url_meta.get(_normalize_lookup_url(value))
+            elif kind == 'ip':
+                ip_int = ip_to_int(value)
+                metadata = self._ip_int_meta.get(ip_int) if ip_int is not None else None
+                if metadata is None:
+                    metadata = self._ip_meta.get(value)
+            else:
+                raise KeyError(kind)
+            if metadata:
+                sources[value] = metadata.source
+        return sources
+
     # ========== Write Operations (Dual Write) ==========
 
     def add_domain(self, domain: str, date: str, score: float, source: str):
@@ -939,79 +1298,56 @@ class HybridStorage:
             source: Source name
         """
         with self._lock:
+            self._flush_pending()
             domain_lower = domain.lower()
             metadata = EntryMetadata(source, date, score)
 
             # Update memory first
-            self._domains.add(domain_lower)
             self._domain_meta[domain_lower] = metadata
 
-            # v0.4.0: Add to tiered storage
-            if source in HOT_DOMAIN_SOURCES:
-                self._hot_domains.add(domain_lower)
-            else:
-                self._cold_domains.add(domain_lower)
-
             # Persist to database
             try:
-                conn = self._get_connection()
-                try:
+                with self._get_connection() as conn:
                     conn.execute(
                         "INSERT OR REPLACE INTO blacklist_domain (domain, date, score, source) VALUES (?, ?, ?, ?)",
                         (domain, date, score, source)
                     )
                     conn.commit()
-                finally:
-                    conn.close()
             except Exception as e:
                 # Rollback memory changes on DB failure
-                self._domains.discard(domain_lower)
                 self._domain_meta.pop(domain_lower, None)
-                self._hot_domains.discard(domain_lower)
-                self._cold_domains.discard(domain_lower)
                 self.logger.error(f"Failed to add domain to database: {e}")
                 raise
 
     def add_url(self, url: str, date: str, score: float, source: str):
         """Add a URL to both memory and database with normalization."""
         with self._lock:
+            self._flush_pending()
             # v0.4.0: Normalize URL
             url_normalized = normalize_url(url)
             metadata = EntryMetadata(source, date, score)
 
             # Update memory first
-            self._urls.add(url_normalized)
             self._url_meta[url_normalized] = metadata
 
-            # v0.4.0: Add to tiered storage
-            if source in HOT_URL_SOURCES:
-                self._hot_urls.add(url_normalized)
-            else:
-                self._cold_urls.add(url_normalized)
-
             # Persist to database (store original for compatibility)
             try:
-                conn = self._get_connection()
-                try:
+                with self._get_connection() as conn:
                     conn.execute(
-                        "INSERT OR REPLACE INTO blacklist_url (url, date, score, source) VALUES (?, ?, ?, ?)",
-                        (url, date, score, source)
+                        "INSERT OR REPLACE INTO blacklist_url (url, date, score, source, url_norm) VALUES (?, ?, ?, ?, ?)",
+                        (url, date, score, source, url_normalized)
                     )
                     conn.commit()
-                finally:
-                    conn.close()
             except Exception as e:
                 # Rollback
-                self._urls.discard(url_normalized)
                 self._url_meta.pop(url_normalized, None)
-                self._hot_urls.discard(url_normalized)
-                self._cold_urls.discard(url_normalized)
                 self.logger.error(f"Failed to add URL to database: {e}")
                 raise
 
     def add_ip(self, ip: str, date: str, score: float, source: str):
         """Add an IP or CIDR range to both memory and database."""
         with self._lock:
+            self._flush_pending()
             metadata = EntryMetadata(source, date, score)
 
             # Determine if CIDR or single IP
@@ -1027,7 +1363,8 @@ class HybridStorage:
                 else:
                     try:
                         network = ipaddress.ip_network(ip, strict=False)
-                        self._cidr_ranges.append((network, metadata))
+                        self._cidr_networks.add(network)
+                        self._cidr_sources[network] = source
                     except ValueError as e:
                         self.logger.error(f"Invalid CIDR {ip}: {e}")
                         raise
@@ -1038,183 +1375,136 @@ class HybridStorage:
                 ip_int = ip_to_int(ip)
 
                 if ip_int is not None:
-                    self._ips_int.add(ip_int)
                     self._ip_int_meta[ip_int] = metadata
-
-                    if source in HOT_IP_SOURCES:
-                        self._hot_ips_int.add(ip_int)
-                    else:
-                        self._cold_ips_int.add(ip_int)
                 else:
-                    self._ips_str.add(ip)
-                    self._ip_meta[ip] = metadata
-
-                    if source in HOT_IP_SOURCES:
-                        self._hot_ips_str.add(ip)
-                    else:
-                        self._cold_ips_str.add(ip)
-
-                # Also add to legacy storage
-                self._ips.add(ip)
-                if ip not in self._ip_meta:
                     self._ip_meta[ip] = metadata
 
             # Persist to database
             try:
-                conn = self._get_connection()
-                try:
+                with self._get_connection() as conn:
                     conn.execute(
                         "INSERT OR REPLACE INTO blacklist_ip (ip, date, score, source) VALUES (?, ?, ?, ?)",
                         (ip, date, score, source)
                     )
                     conn.commit()
-                finally:
-                    conn.close()
             except Exception as e:
                 # Rollback
                 if is_cidr:
                     self._cidr_metadata.pop(ip, None)
                 else:
                     if ip_int is not None:
-                        self._ips_int.discard(ip_int)
                         self._ip_int_meta.pop(ip_int, None)
-                        self._hot_ips_int.discard(ip_int)
-                        self._cold_ips_int.discard(ip_int)
                     else:
-                        self._ips_str.discard(ip)
                         self._ip_meta.pop(ip, None)
-                        self._hot_ips_str.discard(ip)
-                        self._cold_ips_str.discard(ip)
-                    self._ips.discard(ip)
                 self.logger.error(f"Failed to add IP to database: {e}")
                 raise
 
+    def _index_domains(self, domains: List[Tuple[str, str, float, str]], pool: _MetadataPool):
+        """Add (domain, date, score, source) rows to the in-memory index."""
+        for domain, date, score, source in domains:
+            self._domain_meta[domain.lower()] = pool.metadata(source, date, score)
+
+    def _index_urls(self, urls: List[Tuple[str, str, float, str]], pool: _MetadataPool) -> List[Tuple]:
+        """Add (url, date, score, source) rows to the in-memory index; return them with url_norm appended."""
+        rows = []
+        for url, date, score, source in urls:
+            url_normalized = normalize_url(url)
+            rows.append((url, date, score, source, url_normalized))
+            self._url_meta[url_normalized] = pool.metadata(source, date, score)
+        return rows
+
+    def _index_ips(self, ips: List[Tuple[str, str, float, str]], pool: _MetadataPool):
+        """Add (ip, date, score, source) rows, single IPs or CIDR ranges, to the in-memory index."""
+        for ip, date, score, source in ips:
+            metadata = pool.metadata(source, date, score)
+
+            if '/' in ip:  # CIDR
+                if self._use_pytricia:
+                    if ':' in ip:
+                        self._ipv6_cidr_tree[ip] = source
+                    else:
+                        self._ipv4_cidr_tree[ip] = source
+                else:
+                    try:
+                        network = ipaddress.ip_network(ip, strict=False)
+                        self._cidr_networks.add(network)
+                        self._cidr_sources[network] = source
+                    except ValueError:
+                        continue
+                self._cidr_metadata[ip] = metadata
+            else:  # Single IP
+                ip_int = ip_to_int(ip)
+
+                if ip_int is not None:
+                    self._ip_int_meta[ip_int] = metadata
+                else:
+                    self._ip_meta[ip] = metadata
+
+    def _write_chunked(self, sql: str, rows: List[Tuple]):
+        """Run sql over rows in BEGIN IMMEDIATE transactions of at most BULK_CHUNK rows."""
+        conn = self._get_connection()
+        conn.commit()
+        for start in range(0, len(rows), BULK_CHUNK):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(sql, rows[start:start + BULK_CHUNK])
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
     def add_domains(self, domains: List[Tuple[str, str, float, str]]):
         """Add multiple domains efficiently (batch operation)."""
         with self._lock:
-            # Update memory
-            for domain, date, score, source in domains:
-                domain_lower = domain.lower()
-                metadata = EntryMetadata(source, date, score)
-                self._domains.add(domain_lower)
-                self._domain_meta[domain_lower] = metadata
-
-                # v0.4.0: Tiered storage
-                if source in HOT_DOMAIN_SOURCES:
-                    self._hot_domains.add(domain_lower)
-                else:
-                    self._cold_domains.add(domain_lower)
+            self._flush_pending()
+            self._index_domains(domains, _MetadataPool())
 
             # Persist to database in transaction
-            conn = self._get_connection()
             try:
-                conn.executemany(
-                    "INSERT OR REPLACE INTO blacklist_domain (domain, date, score, source) VALUES (?, ?, ?, ?)",
-                    domains
-                )
-                conn.commit()
+                self._write_chunked(QUEUED_INSERTS["domain"], domains)
             except Exception as e:
                 self.logger.error(f"Failed to add domains batch: {e}")
                 # Reload from DB to ensure consistency
-                self._load_domains_from_db()
+                self._load_all_data()
                 raise
-            finally:
-                conn.close()
 
     def add_urls(self, urls: List[Tuple[str, str, float, str]]):
         """Add multiple URLs efficiently (batch operation with normalization)."""
         with self._lock:
-            # Update memory
-            for url, date, score, source in urls:
-                url_normalized = normalize_url(url)
-                metadata = EntryMetadata(source, date, score)
-                self._urls.add(url_normalized)
-                self._url_meta[url_normalized] = metadata
-
-                # v0.4.0: Tiered storage
-                if source in HOT_URL_SOURCES:
-                    self._hot_urls.add(url_normalized)
-                else:
-                    self._cold_urls.add(url_normalized)
+            self._flush_pending()
+            rows = self._index_urls(urls, _MetadataPool())
 
             # Persist to database
-            conn = self._get_connection()
             try:
-                conn.executemany(
-                    "INSERT OR REPLACE INTO blacklist_url (url, date, score, source) VALUES (?, ?, ?, ?)",
-                    urls
-                )
-                conn.commit()
+                self._write_chunked(QUEUED_INSERTS["url"], rows)
             except Exception as e:
                 self.logger.error(f"Failed to add URLs batch: {e}")
-                self._load_urls_from_db()
+                self._load_all_data()
                 raise
-            finally:
-                conn.close()
 
     def add_ips(self, ips: List[Tuple[str, str, float, str]]):
         """Add multiple IPs efficiently (batch operation with integer storage)."""
         with self._lock:
-            # Update memory
-            for ip, date, score, source in ips:
-                metadata = EntryMetadata(source, date, score)
-
-                if '/' in ip:  # CIDR
-                    if self._use_pytricia:
-                        if ':' in ip:
-                            self._ipv6_cidr_tree[ip] = source
-                        else:
-                            self._ipv4_cidr_tree[ip] = source
-                    else:
-                        try:
-                            network = ipaddress.ip_network(ip, strict=False)
-                            self._cidr_ranges.append((network, metadata))
-                        except ValueError:
-                            continue
-                    self._cidr_metadata[ip] = metadata
-                else:  # Single IP
-                    ip_int = ip_to_int(ip)
-
-                    if ip_int is not None:
-                        self._ips_int.add(ip_int)
-                        self._ip_int_meta[ip_int] = metadata
-
-                        if source in HOT_IP_SOURCES:
-                            self._hot_ips_int.add(ip_int)
-                        else:
-                            self._cold_ips_int.add(ip_int)
-                    else:
-                        self._ips_str.add(ip)
-                        self._ip_meta[ip] = metadata
-
-                        if source in HOT_IP_SOURCES:
-                            self._hot_ips_str.add(ip)
-                        else:
-                            self._cold_ips_str.add(ip)
-
-                    self._ips.add(ip)
-                    if ip not in self._ip_meta:
-                        self._ip_meta[ip] = metadata
+            self._flush_pending()
+            self._index_ips(ips, _MetadataPool())
 
             # Persist to database
-            conn = self._get_connection()
             try:
-                conn.executemany(
-                    "INSERT OR REPLACE INTO blacklist_ip (ip, date, score, source) VALUES (?, ?, ?, ?)",
-                    ips
-                )
-                conn.commit()
+                self._write_chunked(QUEUED_INSERTS["ip"], ips)
             except Exception as e:
                 self.logger.error(f"Failed to add IPs batch: {e}")
-                self._load_ips_from_db()
+                self._load_all_data()
                 raise
-            finally:
-                conn.close()
 
     def add_entries(self, entries: List[Tuple[str, Optional[str], str, float, str]]):
         """
         Add entries from blacklist updater (legacy compatibility).
 
+        The in-memory index is updated right away, so lookups see the entries
+        immediately; the rows are written by a background thread in one
+        transaction per FLUSH_INTERVAL instead of one commit per call (the
+        WriteBehindQueue Storage.add_entries uses too). flush() writes them now.
+
         Args:
             entries: List of (url, ip, date, score, source) tuples
         """
@@ -1229,11 +1519,9 @@ class HybridStorage:
             if url_val:
                 # Determine if it's a domain-only URL or a full URL
                 if url_val.startswith(('http://', 'https://')):
-                    from urllib.parse import urlparse
                     try:
-                        parsed = urlparse(url_val)
-                        domain = parsed.netloc
-                        is_domain_entry = not parsed.path or parsed.path == '/'
+                        domain, path = split_http_url(url_val)
+                        is_domain_entry = not path or path == '/'
 
                         if is_domain_entry and domain:
                             domains_to_add.append((domain, date_val, score_val, source))
@@ -1242,131 +1530,132 @@ class HybridStorage:
                     except:
                         pass
 
-        if domains_to_add:
-            self.add_domains(domains_to_add)
-        if urls_to_add:
-            self.add_urls(urls_to_add)
-        if ips_to_add:
-            self.add_ips(ips_to_add)
+        rows = []
+        with self._lock:
+            pool = _MetadataPool()
+            if domains_to_add:
+                self._index_domains(domains_to_add, pool)
+                rows.extend(("domain", row) for row in domains_to_add)
+            if urls_to_add:
+                rows.extend(("url", row) for row in self._index_urls(urls_to_add, pool))
+            if ips_to_add:
+                self._index_ips(ips_to_add, pool)
+                rows.extend(("ip", row) for row in ips_to_add)
+            # Queued under the same lock, so a remove_entry or reload cannot
+            # run between the index update and the enqueue
+            if rows:
+                self._writer.put(rows)
+
+    def _write_rows(self, pending: List[Tuple[str, Tuple]]):
+        """Insert a batch of queued (kind, row) pairs in one transaction."""
+        rows = {kind: [] for kind in QUEUED_INSERTS}
+        for kind, row in pending:
+            rows[kind].append(row)
+        with self._get_connection() as conn:
+            for kind, kind_rows in rows.items():
+                if kind_rows:
+                    conn.executemany(QUEUED_INSERTS[kind], kind_rows)
+
+    def flush(self):
+        """Write all rows queued by add_entries to the database."""
+        self._writer.flush()
+
+    def _flush_pending(self):
+        """Wait for queued rows, including a batch being written, before a write, delete or reload that must come after them."""
+        self._writer.wait()
 
     # ========== Statistics & Query Methods ==========
 
     def count_entries(self) -> int:
         """Get total count of all entries (instant from memory)."""
-        return len(self._domains) + len(self._urls) + len(self._ips) + len(self._ips_int) + len(self._ips_str) + len(self._cidr_metadata)
+        return (
+            len(self._domain_meta) + len(self._url_meta) + len(self._ip_int_meta)
+            + len(self._ip_meta) + len(self._cidr_metadata)
+        )
 
     def get_source_counts(self) -> Dict[str, int]:
-        """Count entries per source from memory."""
+        """Count entries per source from the in-memory counters."""
         counts: Dict[str, int] = {}
-
-        # Count domains
-        for meta in self._domain_meta.values():
-            counts[meta.source] = counts.get(meta.source, 0) + 1
-
-        # Count URLs
-        for meta in self._url_meta.values():
-            counts[meta.source] = counts.get(meta.source, 0) + 1
-
-        # Count IPs (string)
-        for meta in self._ip_meta.values():
-            counts[meta.source] = counts.get(meta.source, 0) + 1
-
-        # Count IPs (integer)
-        for meta in self._ip_int_meta.values():
-            counts[meta.source] = counts.get(meta.source, 0) + 1
-
-        # Count CIDRs
-        for meta in self._cidr_metadata.values():
-            counts[meta.source] = counts.get(meta.source, 0) + 1
-
+        for (source, _kind), n in dict(self._entry_counts).items():
+            counts[source] = counts.get(source, 0) + n
         return counts
 
     def get_source_type_counts(self) -> Dict[str, dict]:
         """Get breakdown of domain/url/ip entries per source."""
         stats: Dict[str, dict] = {}
+        for (source, kind), n in dict(self._entry_counts).items():
+            if source not in stats:
+                stats[source] = {"domain": 0, "url": 0, "ip": 0}
+            stats[source][kind] += n
+        return stats
 
-        # Domains
-        for meta in self._domain_meta.values():
-            if meta.source not in stats:
-                stats[meta.source] = {"domain": 0, "url": 0, "ip": 0}
-            stats[meta.source]["domain"] += 1
-
-        # URLs
-        for meta in self._url_meta.values():
-            if meta.source not in stats:
-                stats[meta.source] = {"domain": 0, "url": 0, "ip": 0}
-            stats[meta.source]["url"] += 1
-
-        # IPs (string and int) and CIDRs
-        for meta in self._ip_meta.values():
-            if meta.source not in stats:
-                stats[meta.source] = {"domain": 0, "url": 0, "ip": 0}
-            stats[meta.source]["ip"] += 1
-
-        for meta in self._ip_int_meta.values():
-            if meta.source not in stats:
-                stats[meta.source] = {"domain": 0, "url": 0, "ip": 0}
-            stats[meta.source]["ip"] += 1
-
-        for meta in self._cidr_metadata.values():
-            if meta.source not in stats:
-                stats[meta.source] = {"domain": 0, "url": 0, "ip": 0}
-            stats[meta.source]["ip"] += 1
+    def get_diagnostics_snapshot(self) -> Dict[str, object]:
+        """
+        Get total, per-source, per-type and last-update figures in one pass.
 
-        return stats
+        Same contract as Storage.get_diagnostics_snapshot: per-source counts are
+        derived from the per-type breakdown instead of a second scan of the
+        metadata, and the result is reused for DIAGNOSTICS_TTL seconds.
+        """
+        with self._snapshot_lock:
+            if self._snapshot is not None and time.monotonic() - self._snapshot_time < DIAGNOSTICS_TTL:
+                return self._snapshot
+            detail = self.get_source_type_counts()
+            self._snapshot = {
+                "total_entries": self.count_entries(),
+                "per_source": {src: sum(kinds.values()) for src, kinds in detail.items()},
+                "last_updates": self.get_last_update_per_source(),
+                "per_source_detail": detail,
+            }
+            self._snapshot_time = time.monotonic()
+            return self._snapshot
 
     def get_active_sources(self) -> List[str]:
         """Get list of active sources."""
-        sources = set()
-        sources.update(meta.source for meta in self._domain_meta.values())
-        sources.update(meta.source for meta in self._url_meta.values())
-        sources.update(meta.source for meta in self._ip_meta.values())
-        sources.update(meta.source for meta in self._ip_int_meta.values())
-        sources.update(meta.source for meta in self._cidr_metadata.values())
-        return list(sources)
+        return list({source for source, _kind in dict(self._entry_counts)})
 
     def sample_entries(self, count: int = 10) -> List[str]:
         """Return a random sample of entries."""
-        all_entries = (
-            list(self._domains) +
-            list(self._urls) +
-            list(self._ips) +
-            [int_to_ip(ip_int) for ip_int in self._ips_int] +
-            list(self._ips_str) +
-            list(self._cidr_metadata.keys())
-        )
-
-        if not all_entries:
+        # Copy each map's keys (one C-level copy, safe against concurrent
+        # writers) and draw positions across them, so only the sampled IPv4
+        # integers are converted back to strings
+        ip_ints = list(self._ip_int_meta)
+        groups = [
+            list(self._domain_meta), list(self._url_meta), ip_ints,
+            list(self._ip_meta), list(self._cidr_metadata),
+        ]
+        total = sum(map(len, groups))
+        if not total or count <= 0:
             return []
 
-        sample_size = min(count, len(all_entries))
-        return random.sample(all_entries, sample_size)
+        sample = []
+        for position in random.sample(range(total), min(count, total)):
+            for values in groups:
+                if position < len(values):
+                    value = values[position]
+                    sample.append(int_to_ip(value) if values is ip_ints else value)
+                    break
+                position -= len(values)
+        return sample
 
     def get_last_update(self) -> datetime:
         """Get timestamp of last update from database."""
-        conn = self._get_connection()
-        try:
+        with self._get_connection() as conn:
             cursor = conn.execute("SELECT MAX(timestamp) FROM updates")
             result = cursor.fetchone()[0]
             return datetime.fromisoformat(result) if result else datetime.min
-        finally:
-            conn.close()
 
     def get_last_update_per_source(self) -> Dict[str, str]:
         """Get last update timestamp for each source."""
-        conn = self._get_connection()
-        try:
+        with self._get_connection() as conn:
             cursor = conn.execute(
                 "SELECT source, MAX(timestamp) FROM updates GROUP BY source"
             )
             return {row[0]: row[1] for row in cursor.fetchall()}
-        finally:
-            conn.close()
 
     def get_update_history(self, source: str = None, start: str = None, end: str = None) -> list:
         """Return update history records from database."""
-        conn = self._get_connection()
-        try:
+        with self._get_connection() as conn:
             parts = []
             params = []
 
@@ -1390,20 +1679,15 @@ class HybridStorage:
                 {"timestamp": row[0], "source": row[1], "entry_count": row[2]}
                 for row in cursor.fetchall()
             ]
-        finally:
-            conn.close()
 
     def log_update(self, source: str, entry_count: int):
         """Log an update to the database."""
-        conn = self._get_connection()
-        try:
+        with self._get_connection() as conn:
             conn.execute(
                 "INSERT INTO updates (source, entry_count) VALUES (?, ?)",
                 (source, entry_count)
             )
             conn.commit()
-        finally:
-            conn.close()
 
     # ========== Utility Methods ==========
 
@@ -1424,41 +1708,23 @@ class HybridStorage:
     def remove_entry(self, value: str) -> bool:
         """Remove an entry from both memory and database."""
         with self._lock:
+            self._flush_pending()
             removed = False
 
             # Try to remove from all types
-            if value.lower() in self._domains:
-                self._domains.discard(value.lower())
-                self._domain_meta.pop(value.lower(), None)
-                self._hot_domains.discard(value.lower())
-                self._cold_domains.discard(value.lower())
+            if self._domain_meta.pop(value.lower(), None) is not None:
                 removed = True
 
-            value_normalized = normalize_url(value)
-            if value_normalized in self._urls:
-                self._urls.discard(value_normalized)
-                self._url_meta.pop(value_normalized, None)
-                self._hot_urls.discard(value_normalized)
-                self._cold_urls.discard(value_normalized)
+            if self._url_meta.pop(normalize_url(value), None) is not None:
                 removed = True
 
-            # Try IP as string
-            if value in self._ips or value in self._ips_str:
-                self._ips.discard(value)
-                self._ips_str.discard(value)
-                self._ip_meta.pop(value, None)
-                self._hot_ips_str.discard(value)
-                self._cold_ips_str.discard(value)
+            # Try IP as string (IPv6)
+            if self._ip_meta.pop(value, None) is not None:
                 removed = True
 
-            # Try IP as integer
+            # Try IP as integer (IPv4)
             ip_int = ip_to_int(value)
-            if ip_int is not None and ip_int in self._ips_int:
-                self._ips_int.discard(ip_int)
-                self._ip_int_meta.pop(ip_int, None)
-                self._hot_ips_int.discard(ip_int)
-                self._cold_ips_int.discard(ip_int)
-                self._ips.discard(value)  # Also remove from legacy
+            if ip_int is not None and self._ip_int_meta.pop(ip_int, None) is not None:
                 removed = True
 
             if value in self._cidr_metadata:
@@ -1468,14 +1734,11 @@ class HybridStorage:
 
             if removed:
                 # Remove from database
-                conn = self._get_connection()
-                try:
+                with self._get_connection() as conn:
                     conn.execute("DELETE FROM blacklist_domain WHERE domain = ?", (value,))
                     conn.execute("DELETE FROM blacklist_url WHERE url = ?", (value,))
                     conn.execute("DELETE FROM blacklist_ip WHERE ip = ?", (value,))
                     conn.commit()
-                finally:
-                    conn.close()
 
             return removed
 
@@ -1488,18 +1751,27 @@ class HybridStorage:
         except (ImportError, Exception):
             self.metrics.memory_usage_mb = 0.0
 
-        total_lookups = self.metrics.total_lookups
+        counts = self.metrics.lookup_counts.copy()
+        per_kind = Counter()
+        cache_hits = 0
+        for (kind, found), count in counts.items():
+            per_kind[kind] += count
+            if found:
+                cache_hits += count
+        total_lookups = per_kind.total()
         hot_hit_rate = (self.metrics.hot_source_hits / total_lookups * 100) if total_lookups > 0 else 0
+        timed = self.metrics.timed_lookups
+        avg_lookup_time_ms = self.metrics.lookup_time_ns / timed / 1e6 if timed else 0.0
 
         return {
             "total_lookups": total_lookups,
-            "domain_lookups": self.metrics.domain_lookups,
-            "url_lookups": self.metrics.url_lookups,
-            "ip_lookups": self.metrics.ip_lookups,
-            "cache_hits": self.metrics.cache_hits,
-            "cache_misses": self.metrics.cache_misses,
-            "hit_rate": self.metrics.cache_hits / total_lookups if total_lookups > 0 else 0,
-            "avg_lookup_time_ms": f"{self.metrics.avg_lookup_time_ms:.4f}",
+            "domain_lookups": per_kind['domain'],
+            "url_lookups": per_kind['url'],
+            "ip_lookups": per_kind['ip'],
+            "cache_hits": cache_hits,
+            "cache_misses": total_lookups - cache_hits,
+            "hit_rate": cache_hits / total_lookups if total_lookups > 0 else 0,
+            "avg_lookup_time_ms": f"{avg_lookup_time_ms:.4f}",
             "memory_usage_mb": f"{self.metrics.memory_usage_mb:.1f}",
             "last_reload": self.metrics.last_reload.isoformat() if self.metrics.last_reload else None,
             "entry_count": self.count_entries(),
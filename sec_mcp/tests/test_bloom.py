@@ -0,0 +1,96 @@
+"""Test the Bloom filter."""
+import ipaddress
+from sec_mcp.bloom import BloomFilter, FingerprintSet, NetworkSet, PrefixMap, ScalableBloomFilter
+
+def test_no_false_negatives():
+    """Every added value must test as present."""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    values = [f"domain{i}.example.com" for i in range(1000)]
+    bloom.update(values)
+    assert all(v in bloom for v in values)
+    assert len(bloom) == 1000
+    assert not bloom.is_full
+
+def test_false_positive_rate():
+    """Misses should stay close to the configured error rate."""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    bloom.update(f"bad{i}.com" for i in range(1000))
+    false_positives = sum(f"good{i}.com" in bloom for i in range(10000))
+    assert false_positives < 300
+
+def test_contains_many_matches_contains():
+    """Batch membership must agree with single-value membership."""
+    bloom = BloomFilter(capacity=100, error_rate=0.01)
+    bloom.update(["a.com", "b.com", "1.2.3.4"])
+    values = ["a.com", "c.com", "1.2.3.4", "5.6.7.8"]
+    assert bloom.contains_many(values) == [v in bloom for v in values]
+
+def test_scalable_bloom_grows_without_false_negatives():
+    """Adding past the initial capacity starts new stages and keeps every value."""
+    bloom = ScalableBloomFilter(initial_capacity=100, error_rate=0.01)
+    values = [f"url{i}" for i in range(1000)]
+    bloom.update(values)
+    assert len(bloom._stages) > 1
+    assert all(v in bloom for v in values)
+    assert all(bloom.contains_many(values))
+    assert len(bloom) == 1000
+
+def test_fingerprint_set_membership():
+    """Fingerprint set supports add, discard and growing its table."""
+    fps = FingerprintSet(["a.com", "b.com"])
+    fps.update(f"added{i}.com" for i in range(5000))  # forces several resizes
+    assert "a.com" in fps and "added4999.com" in fps
+    assert "c.com" not in fps
+    fps.discard("a.com")
+    fps.discard("added4999.com")
+    fps.discard("missing.com")
+    assert "a.com" not in fps and "added4999.com" not in fps
+    assert len(fps) == 5000
+
+def test_fingerprint_set_discard_keeps_probe_chains():
+    """Removing values from crowded slots must not hide the values probed past them."""
+    fps = FingerprintSet()
+    values = [f"v{i}" for i in range(2000)]
+    fps.update(values)
+    for value in values[::2]:
+        fps.discard(value)
+    assert all(value not in fps for value in values[::2])
+    assert all(value in fps for value in values[1::2])
+    assert len(fps) == 1000
+
+def test_fingerprint_set_update_skips_duplicates():
+    """Bulk updates count each distinct value once, including ones already stored."""
+    fps = FingerprintSet(["a.com", "b.com"])
+    fps.update(["a.com", "c.com", "c.com"] + [f"x{i}.com" for i in range(100)])
+    assert len(fps) == 103
+    assert all(value in fps for value in ["a.com", "b.com", "c.com", "x99.com"])
+
+def test_network_set_matches_linear_scan():
+    """Merged ranges must agree with testing each network, including nested and adjacent ones."""
+    networks = [ipaddress.ip_network(n) for n in
+                ["10.0.0.0/8", "10.1.0.0/16", "192.168.1.0/25", "192.168.1.128/25", "172.16.5.0/24", "2001:db8::/32"]]
+    nets = NetworkSet(networks[:3])
+    nets.update(networks[3:5])
+    nets.add(networks[5])
+    addrs = [ipaddress.ip_address(a) for a in
+             ["10.200.1.1", "10.1.2.3", "11.0.0.0", "9.255.255.255", "192.168.1.127", "192.168.1.128",
+              "192.168.2.0", "172.16.5.255", "172.16.6.0", "2001:db8::1", "2001:db9::1", "0.0.0.0"]]
+    assert [a in nets for a in addrs] == [any(a in n for n in networks) for a in addrs]
+    nets.discard(networks[0])
+    assert ipaddress.ip_address("10.1.2.3") in nets
+    assert ipaddress.ip_address("10.200.1.1") not in nets
+    assert len(nets) == 5
+
+def test_prefix_map_returns_longest_match():
+    """The most specific stored network wins, whatever the insertion order."""
+    prefixes = PrefixMap()
+    prefixes[ipaddress.ip_network("10.1.0.0/16")] = "narrow"
+    prefixes[ipaddress.ip_network("10.0.0.0/8")] = "wide"
+    prefixes[ipaddress.ip_network("10.1.2.0/24")] = None
+    prefixes[ipaddress.ip_network("2001:db8::/32")] = "v6"
+    assert prefixes.get(ipaddress.ip_address("10.1.9.9")) == "narrow"
+    assert prefixes.get(ipaddress.ip_address("10.2.0.1")) == "wide"
+    assert prefixes.get(ipaddress.ip_address("10.1.2.3"), "missing") is None
+    assert prefixes.get(ipaddress.ip_address("11.0.0.1"), "missing") == "missing"
+    assert prefixes.get(ipaddress.ip_address("2001:db8::1")) == "v6"
+    assert len(prefixes) == 4
@@ -0,0 +1,76 @@
+"""Test the striped LRU cache and the TTL cache."""
+import threading
+
+import pytest
+
+from sec_mcp.cache import StripedLRUCache, TTLCache
+
+def test_evicts_least_recently_used():
+    """A full stripe drops its oldest value; get() refreshes recency."""
+    cache = StripedLRUCache(max_size=2, stripes=1)
+    cache.put("a")
+    cache.put("b")
+    assert cache.get("a")  # refresh a, so b is now the oldest
+    cache.put("c")
+    assert list(cache) == ["a", "c"]
+    assert not cache.get("b")
+
+def test_size_is_bounded_across_stripes():
+    """Total size never exceeds stripes * stripe_size."""
+    cache = StripedLRUCache(max_size=64, stripes=8)
+    for i in range(1000):
+        cache.put(f"value{i}")
+    assert len(cache) <= 64
+    assert "value999" in cache
+
+def test_discard_and_clear():
+    """Values can be dropped individually or all at once."""
+    cache = StripedLRUCache(max_size=100, stripes=4)
+    cache.put("x")
+    cache.put("y")
+    cache.discard("x")
+    assert "x" not in cache and "y" in cache
+    cache.clear()
+    assert len(cache) == 0
+
+def test_concurrent_puts():
+    """Concurrent writers keep every stripe within bounds."""
+    cache = StripedLRUCache(max_size=256, stripes=16)
+    def worker(n):
+        for i in range(2000):
+            cache.put(f"{n}-{i}")
+            cache.get(f"{n}-{i // 2}")
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(cache) <= 256
+
+def test_stripes_must_be_power_of_two():
+    """Stripe selection masks the hash, so the count must be a power of two."""
+    with pytest.raises(ValueError):
+        StripedLRUCache(stripes=3)
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    """Entries are returned until their ttl has passed."""
+    now = [100.0]
+    monkeypatch.setattr("sec_mcp.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(max_size=10, ttl=60.0)
+    cache.put("evil.com", "blacklisted")
+    now[0] += 59.0
+    assert cache.get("evil.com") == "blacklisted"
+    now[0] += 2.0
+    assert cache.get("evil.com") is None
+    assert len(cache) == 0
+
+def test_ttl_cache_evicts_oldest():
+    """A full cache drops the entry stored first; clear() empties it."""
+    cache = TTLCache(max_size=2, ttl=60.0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("c", 3)
+    assert cache.get("a") is None
+    assert (cache.get("b"), cache.get("c")) == (2, 3)
+    cache.clear()
+    assert cache.get("b", "missing") == "missing"
@@ -35,3 +35,11 @@ def test_cli_batch():
         assert result.returncode == 0, f"CLI batch failed: {result.stderr}"
         assert 'is_safe' in result.stdout
     Path(f.name).unlink()
+
+def test_cli_check_stdin():
+    sec_mcp_executable = os.path.join(os.path.dirname(sys.executable), 'sec-mcp')
+    result = subprocess.run([
+            sec_mcp_executable, 'check', '--stdin', '--json'
+        ], input='https://example.com\n1.2.3.4\n', capture_output=True, text=True, env=os.environ.copy())
+    assert result.returncode == 0, f"CLI check --stdin failed: {result.stderr}"
+    assert result.stdout.count('is_safe') == 2
@@ -263,6 +263,23 @@ class TestV040Optimizations:
         # Test trailing slash removal
         assert normalize_url("http://evil.com/path/") == "http://evil.com/path"
 
+    def test_url_normalization_matches_urllib(self):
+        """The string-slicing path gives the same result as the urllib parsers."""
+        from sec_mcp.storage_v2 import normalize_url, _normalize_url_parsed
+
+        urls = [
+            "HTTP://Evil.com/Login/?utm_source=x&id=7#top",
+            "https://evil.com:8443/a//?ref=y",
+            "http://evil.com/p?a=1&a=2",
+            "http://evil.com/p?a=&b=%41+c",
+            "http://[::1]/x/",
+            "http://evil.com/p;params?q=1",
+            "evil.com/path/",
+            "http://evil.com/ünïcode/",
+        ]
+        for url in urls:
+            assert normalize_url(url) == _normalize_url_parsed(url.lower())
+
     def test_url_normalization_in_storage(self):
         """Test that storage uses normalized URLs."""
         storage = HybridStorage(":memory:")
@@ -291,6 +308,10 @@ class TestV040Optimizations:
         # Test IPv6 returns None (not converted to int)
         assert ip_to_int("2001:db8::1") is None
 
+        # Non-canonical forms keep the lenient parsing
+        assert ip_to_int("010.0.0.1") == 167772161
+        assert ip_to_int("1.2.3") is None
+
     def test_tiered_lookup_sources(self):
         """Test that hot sources are classified correctly."""
         from sec_mcp.storage_v2 import HOT_URL_SOURCES, HOT_IP_SOURCES, HOT_DOMAIN_SOURCES
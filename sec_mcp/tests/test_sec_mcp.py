@@ -52,3 +52,11 @@ def test_sample_entries(secmcp):
     secmcp.storage.sample_entries.return_value = ['a', 'b']
     sample = secmcp.sample(2)
     assert sample == ['a', 'b']
+
+def test_is_ip():
+    assert SecMCP.is_ip('203.0.113.42')
+    assert SecMCP.is_ip('2001:db8::1')
+    assert SecMCP.is_ip('fe80::1%eth0')
+    assert not SecMCP.is_ip('010.0.0.1')
+    assert not SecMCP.is_ip('256.0.0.1')
+    assert not SecMCP.is_ip('example.com')
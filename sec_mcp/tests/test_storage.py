@@ -1,6 +1,7 @@
 """Test the storage functionality."""
 import pytest
 import os
+import sqlite3
 from sec_mcp.storage import Storage
 
 @pytest.fixture
@@ -14,6 +15,7 @@ def storage():
 
     storage_instance = Storage(db_path=db_path)
     yield storage_instance
+    storage_instance.close()
     # Cleanup after tests
     if os.path.exists(db_path):
         try:
@@ -63,8 +65,275 @@ def test_cache_functionality(storage):
     assert storage.is_ip_blacklisted(ip_to_cache)
     assert storage.is_domain_blacklisted(domain_to_cache)
 
-    # Cache should contain these entries
+    # Each kind's cache should contain its entry
     with storage._cache_lock:
-        assert url_to_cache in storage._cache
-        assert ip_to_cache in storage._cache
-        assert domain_to_cache in storage._cache
+        assert url_to_cache in storage._caches["url"]
+        assert ip_to_cache in storage._caches["ip"]
+        assert domain_to_cache in storage._caches["domain"]
+
+def test_is_ip_blacklisted_many(storage):
+    """Test batch IP lookups (exact, CIDR and invalid inputs)."""
+    storage.add_ip("4.4.4.4", "2025-04-18T00:00:00", 5.0, "TestSource")
+    storage.add_ip("10.0.0.0/8", "2025-04-18T00:00:00", 5.0, "TestSource")
+
+    results = storage.is_ip_blacklisted_many(["4.4.4.4", "10.1.2.3", "5.5.5.5", "not-an-ip"])
+    assert results == [True, True, False, False]
+
+def test_index_tracks_entries(storage):
+    """Test that added entries reach the fingerprint index and reopened storage rebuilds it."""
+    storage.add_domain("indexed.com", "2025-04-18T00:00:00", 5.0, "TestSource")
+    storage.add_urls([("https://indexed.com/x", "2025-04-18T00:00:00", 5.0, "TestSource")])
+    assert "indexed.com" in storage._fingerprints["domain"]
+    assert "https://indexed.com/x" in storage._fingerprints["url"]
+    assert not storage.is_url_blacklisted("https://not-indexed.com/x")
+
+    reopened = Storage(db_path=storage.db_path)
+    assert "indexed.com" in reopened._fingerprints["domain"]
+    assert reopened.is_domain_blacklisted("sub.indexed.com")
+
+def test_connections_are_per_thread(storage):
+    """Test that each thread reuses its own connection and sees committed writes."""
+    import threading
+    storage.add_domain("threaded.com", "2025-04-18T00:00:00", 5.0, "TestSource")
+    assert storage._get_connection() is storage._get_connection()
+
+    results = {}
+    def worker():
+        results["conn"] = storage._get_connection()
+        results["hit"] = storage.is_domain_blacklisted("threaded.com")
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert results["hit"]
+    assert results["conn"] is not storage._get_connection()
+
+def test_removed_entries_are_not_reported(storage):
+    """Test that removal updates the in-memory index used for exact lookups."""
+    storage.add_url("https://removed.com/x", "2025-04-18T00:00:00", 5.0, "TestSource")
+    storage.add_ip("6.6.6.6", "2025-04-18T00:00:00", 5.0, "TestSource")
+    assert storage.is_url_blacklisted("https://removed.com/x")
+    assert storage.remove_url("https://removed.com/x")
+    assert storage.remove_ip("6.6.6.6")
+    assert not storage.is_url_blacklisted("https://removed.com/x")
+    assert not storage.is_ip_blacklisted("6.6.6.6")
+
+def test_batch_add_accepts_generators(storage):
+    """Test that batch adds stream any iterable into the database and index."""
+    storage.add_urls((f"https://gen.com/{i}", "2025-04-18T00:00:00", 5.0, "TestSource") for i in range(3))
+    assert storage.count_entries() == 3
+    assert storage.is_url_blacklisted("https://gen.com/2")
+
+def test_get_blacklist_sources(storage):
+    """Test batch source lookup through the temporary join table."""
+    storage.add_domain("src1.com", "2025-04-18T00:00:00", 5.0, "DomainSource")
+    storage.add_ip("7.7.7.7", "2025-04-18T00:00:00", 5.0, "IPSource")
+    sources = storage.get_blacklist_sources("domain", ["src1.com", "other.com", "src1.com"])
+    assert sources == {"src1.com": "DomainSource"}
+    assert storage.get_blacklist_sources("ip", ["7.7.7.7", "8.8.8.8"]) == {"7.7.7.7": "IPSource"}
+    # The join table is cleared between calls
+    assert storage.get_blacklist_sources("domain", []) == {}
+
+def test_entry_counts_follow_inserts_and_removals(storage):
+    """Test that the trigger-maintained counts match the table contents."""
+    storage.add_domains([("cnt1.com", "2025-04-18T00:00:00", 5.0, "A"), ("cnt2.com", "2025-04-18T00:00:00", 5.0, "B")])
+    storage.add_domain("cnt1.com", "2025-04-18T00:00:00", 5.0, "A")  # ignored duplicate
+    storage.add_ip("9.9.9.9", "2025-04-18T00:00:00", 5.0, "A")
+    assert storage.count_entries() == 3
+    assert storage.get_source_counts() == {"A": 2, "B": 1}
+    assert storage.get_source_type_counts()["A"] == {"domain": 1, "url": 0, "ip": 1}
+    storage.remove_domain("cnt2.com")
+    assert storage.count_entries() == 2
+    assert sorted(storage.get_active_sources()) == ["A"]
+
+def test_cidr_entries_are_matched_in_memory(storage, monkeypatch):
+    """Test that CIDR entries are matched without querying the database and follow removals."""
+    monkeypatch.setattr("sec_mcp.storage.INDEX_CHECK_INTERVAL", 60.0)
+    storage.add_ips([("172.16.0.0/12", "2025-04-18T00:00:00", 5.0, "TestSource")])
+    statements = []
+    storage._get_connection().set_trace_callback(statements.append)
+    assert storage.is_ip_blacklisted("172.20.1.1")
+    assert storage.is_ip_blacklisted_many(["172.20.1.2", "8.8.8.8"]) == [True, False]
+    storage._get_connection().set_trace_callback(None)
+    assert statements == []
+    storage.remove_ip("172.16.0.0/12")
+    assert not storage.is_ip_blacklisted("172.20.1.1")
+
+def test_failed_batch_add_is_rolled_back(storage):
+    """Test that a bulk load is one transaction and synchronous is restored afterwards."""
+    def rows():
+        yield ("rollback1.com", "2025-04-18T00:00:00", 5.0, "TestSource")
+        raise ValueError("feed parse error")
+    with pytest.raises(ValueError):
+        storage.add_domains(rows())
+    assert storage.count_entries() == 0
+    assert storage._get_connection().execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    storage.add_domains([("rollback2.com", "2025-04-18T00:00:00", 5.0, "TestSource")])
+    assert storage.count_entries() == 1
+
+def test_sample_entries_skips_deleted_entries(storage):
+    """Test that sampling returns only live entries, even after deletions."""
+    storage.add_domains([(f"sample{i}.com", "2025-04-18T00:00:00", 5.0, "TestSource") for i in range(50)])
+    for i in range(0, 50, 2):
+        storage.remove_domain(f"sample{i}.com")
+    live = {f"sample{i}.com" for i in range(1, 50, 2)}
+    sample = storage.sample_entries(10)
+    assert len(sample) == 10 and len(set(sample)) == 10
+    assert set(sample) <= live
+    assert set(storage.sample_entries(100)) == live
+
+def test_diagnostics_snapshot(storage):
+    """Test that the snapshot matches the individual queries and is reused within its TTL."""
+    assert storage.get_diagnostics_snapshot()["per_source"] == {}
+    storage._snapshot = None  # drop the cached empty snapshot
+    storage.add_domain("diag.com", "2025-04-18T00:00:00", 5.0, "A")
+    storage.add_url("https://diag.com/x", "2025-04-18T00:00:00", 5.0, "B")
+    storage.log_update("A", 1)
+    snapshot = storage.get_diagnostics_snapshot()
+    assert snapshot["total_entries"] == storage.count_entries() == 2
+    assert snapshot["per_source"] == storage.get_source_counts()
+    assert snapshot["per_source_detail"] == storage.get_source_type_counts()
+    assert snapshot["last_updates"] == storage.get_last_update_per_source()
+    storage.add_ip("5.5.5.5", "2025-04-18T00:00:00", 5.0, "A")
+    assert storage.get_diagnostics_snapshot() is snapshot
+
+def test_remove_entry_any_kind(storage):
+    """Test that remove_entry deletes a value from whichever table holds it."""
+    storage.add_domain("gone.com", "2025-04-18T00:00:00", 5.0, "TestSource")
+    storage.add_ip("3.3.3.3", "2025-04-18T00:00:00", 5.0, "TestSource")
+    assert storage.remove_entry("gone.com")
+    assert storage.remove_entry("3.3.3.3")
+    assert not storage.remove_entry("never-added.com")
+    assert not storage.is_domain_blacklisted("gone.com")
+    assert storage.count_entries() == 0
+
+def test_add_entries_visible_before_flush(storage):
+    """Test that queued entries are matched at once and written before any read of the tables."""
+    storage.add_entries([
+        ("https://queued.com", None, "2025-04-18T00:00:00", 5.0, "manual"),
+        ("https://queued.org/path", "9.9.0.0/16", "2025-04-18T00:00:00", 5.0, "manual"),
+    ])
+    assert storage.is_domain_blacklisted("www.queued.com")
+    assert storage.is_url_blacklisted("https://queued.org/path")
+    assert storage.is_ip_blacklisted("9.9.1.1")
+    assert storage.get_domain_blacklist_source("queued.com") == "manual"
+    assert storage.count_entries() == 3
+    assert storage.remove_entry("9.9.0.0/16")
+    storage.flush()
+    assert storage.get_source_type_counts() == {"manual": {"domain": 1, "url": 1, "ip": 0}}
+
+def test_domain_source_prefers_most_specific_parent(storage):
+    """Test that the closest blacklisted parent domain gives the source."""
+    storage.add_domain("parent.com", "2025-04-18T00:00:00", 5.0, "Broad")
+    storage.add_domain("sub.parent.com", "2025-04-18T00:00:00", 5.0, "Narrow")
+    assert storage.get_domain_blacklist_source("x.sub.parent.com") == "Narrow"
+    assert storage.get_domain_blacklist_source("other.parent.com") == "Broad"
+    assert storage.get_domain_blacklist_source("parent.org") is None
+
+def test_tables_are_rebuilt_without_rowid(tmp_path):
+    """Test that tables from an older schema are migrated with their data and counts."""
+    import sqlite3
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE blacklist_url (url TEXT PRIMARY KEY, date TEXT, score REAL, source TEXT)")
+    conn.execute("ALTER TABLE blacklist_url ADD COLUMN url_norm TEXT")
+    conn.execute("INSERT INTO blacklist_url VALUES ('http://old.com/x', '2025-04-18', 5.0, 'Old', NULL)")
+    conn.commit()
+    conn.close()
+    storage = Storage(db_path=str(db_path))
+    try:
+        sql = storage._get_connection().execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'blacklist_url'"
+        ).fetchone()[0]
+        assert sql.endswith("WITHOUT ROWID") and "url_norm" in sql
+        assert storage.get_url_blacklist_source("http://old.com/x") == "Old"
+        storage.add_url("http://new.com/y", "2025-04-18", 5.0, "New")
+        assert storage.get_source_counts() == {"Old": 1, "New": 1}
+    finally:
+        storage.close()
+
+def test_remove_waits_for_in_flight_flush(storage):
+    """Test that a removal during a background write waits for it, so the entry does not come back."""
+    import threading
+    started, release = threading.Event(), threading.Event()
+    write = storage._writer._write
+    def slow_write(batch):
+        started.set()
+        release.wait(5)
+        write(batch)
+    storage._writer._write = slow_write
+    storage.add_entries([(None, "1.2.3.4", "2025-04-18T00:00:00", 5.0, "manual")])
+    assert started.wait(5)
+
+    results = {}
+    remover = threading.Thread(target=lambda: results.update(removed=storage.remove_entry("1.2.3.4")))
+    remover.start()
+    remover.join(0.2)
+    assert remover.is_alive()  # blocked until the batch is stored
+    release.set()
+    remover.join(5)
+    assert results["removed"]
+    assert not storage.is_ip_blacklisted("1.2.3.4")
+    assert not Storage(db_path=storage.db_path).is_ip_blacklisted("1.2.3.4")
+
+def test_failed_flush_keeps_rows_queued(storage, monkeypatch):
+    """Test that rows whose write fails are queued again and stored by the next flush."""
+    monkeypatch.setattr("sec_mcp.storage.FLUSH_INTERVAL", 10.0)  # only the explicit flushes write
+    write = storage._writer._write
+    def failing_write(batch):
+        storage._writer._write = write
+        raise sqlite3.OperationalError("database is locked")
+    storage._writer._write = failing_write
+    storage.add_entries([("https://retried.com", None, "2025-04-18T00:00:00", 5.0, "manual")])
+    with pytest.raises(sqlite3.OperationalError):
+        storage.flush()
+    storage.flush()
+    assert storage.get_domain_blacklist_source("retried.com") == "manual"
+
+def test_same_value_in_other_kinds_is_kept(storage):
+    """Test that kinds are indexed apart: removing or checking a value as one kind leaves the others alone."""
+    storage.add_ips([("1.2.3.4", "2025-04-18T00:00:00", 5.0, "TestSource")])
+    storage.add_domain("evil.com", "2025-04-18T00:00:00", 5.0, "TestSource")
+    assert not storage.remove_domain("1.2.3.4")
+    assert not storage.remove_url("evil.com")
+    assert storage.is_ip_blacklisted("1.2.3.4")
+    assert storage.is_domain_blacklisted("evil.com")
+    assert not storage.is_domain_blacklisted("1.2.3.4")
+    assert not storage.is_url_blacklisted("evil.com")
+
+def test_index_follows_writes_from_another_instance(storage, monkeypatch):
+    """Test that entries added or removed through another instance (or process) are seen."""
+    monkeypatch.setattr("sec_mcp.storage.INDEX_CHECK_INTERVAL", 0.0)
+    storage.add_domain("before.com", "2025-04-18T00:00:00", 5.0, "TestSource")
+    assert storage.is_domain_blacklisted("before.com")
+    other = Storage(db_path=storage.db_path)
+    try:
+        other.add_domains([("added-elsewhere.com", "2025-04-18T00:00:00", 5.0, "Other")])
+        other.add_ip("5.6.7.8", "2025-04-18T00:00:00", 5.0, "Other")
+        assert other.remove_domain("before.com")
+    finally:
+        other.close()
+    assert storage.is_domain_blacklisted("www.added-elsewhere.com")
+    assert storage.is_ip_blacklisted("5.6.7.8")
+    assert not storage.is_domain_blacklisted("before.com")
+    # Own writes keep the index current without another rebuild
+    storage.add_domain("own.com", "2025-04-18T00:00:00", 5.0, "TestSource")
+    fingerprints = storage._fingerprints
+    assert storage.is_domain_blacklisted("own.com")
+    assert storage._fingerprints is fingerprints
+
+def test_rebuild_skips_null_keys(tmp_path):
+    """Test that NULL keys accepted by an old rowid table do not stop the migration."""
+    db_path = tmp_path / "old.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE blacklist_domain (domain TEXT PRIMARY KEY, date TEXT, score REAL, source TEXT)")
+    conn.execute("INSERT INTO blacklist_domain VALUES (NULL, '2025-04-18', 5.0, 'Old')")
+    conn.execute("INSERT INTO blacklist_domain VALUES ('old.com', '2025-04-18', 5.0, 'Old')")
+    conn.commit()
+    conn.close()
+    storage = Storage(db_path=str(db_path))
+    try:
+        assert storage.is_domain_blacklisted("old.com")
+        assert storage.count_entries() == 1
+    finally:
+        storage.close()
+    Storage(db_path=str(db_path)).close()  # later starts find the table already migrated
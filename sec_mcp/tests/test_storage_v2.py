@@ -3,6 +3,7 @@
 import pytest
 import sqlite3
 import tempfile
+import threading
 import os
 from datetime import datetime
 from sec_mcp.storage_v2 import HybridStorage, EntryMetadata
@@ -17,7 +18,8 @@ class TestHybridStorageInitialization:
         assert storage.db_path == ":memory:"
         assert len(storage._domains) == 0
         assert len(storage._urls) == 0
-        assert len(storage._ips) == 0
+        assert len(storage._ip_int_meta) == 0
+        assert len(storage._ip_meta) == 0
 
     def test_initialization_with_file_db(self):
         """Test initialization with file database."""
@@ -44,6 +46,33 @@ class TestHybridStorageInitialization:
         conn.close()
 
 
+class TestEntryMetadata:
+    """Test the per-entry metadata record."""
+
+    def test_source_and_date_are_shared(self):
+        """Equal sources and dates from separate entries are the same object."""
+        a = EntryMetadata("".join(["Open", "Phish"]), "".join(["2025-", "01-01"]), 9.0)
+        b = EntryMetadata("".join(["Open", "Phish"]), "".join(["2025-", "01-01"]), 8.0)
+        assert a.source is b.source
+        assert a.date is b.date
+        assert not hasattr(a, "__dict__")
+
+    def test_loaded_entries_share_equal_metadata(self):
+        """Entries loaded with the same source, date and score share one record."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            storage = HybridStorage(os.path.join(tmpdir, "test.db"))
+            storage.add_domains([
+                ("a.com", "2025-01-01", 9.0, "test"),
+                ("b.com", "2025-01-01", 9.0, "test"),
+                ("c.com", "2025-01-02", 9.0, "test"),
+            ])
+            storage.reload()
+            meta = storage._domain_meta
+            assert meta["a.com"] is meta["b.com"]
+            assert meta["c.com"] is not meta["a.com"]
+            assert meta["c.com"].date == "2025-01-02"
+
+
 class TestDomainLookups:
     """Test domain blacklist lookups."""
 
@@ -64,6 +93,14 @@ class TestDomainLookups:
         assert storage.is_domain_blacklisted("sub.evil.com") is True
         assert storage.is_domain_blacklisted("a.b.c.evil.com") is True
 
+    def test_parent_match_stops_at_label_boundary(self):
+        """Test that a shared suffix without a dot before it is not a parent."""
+        storage = HybridStorage(":memory:")
+        storage.add_domain("evil.com", "2025-01-01", 9.0, "test")
+
+        assert storage.is_domain_blacklisted("notevil.com") is False
+        assert storage.is_domain_blacklisted("sub.notevil.com") is False
+
     def test_case_insensitive_domain(self):
         """Test case-insensitive domain matching."""
         storage = HybridStorage(":memory:")
@@ -111,6 +148,13 @@ class TestURLLookups:
         source = storage.get_url_blacklist_source("http://safe.com")
         assert source is None
 
+    def test_repeated_lookup_sees_new_entries(self):
+        """Lookups remember normalized URLs, not verdicts, so a later add is still found."""
+        storage = HybridStorage(":memory:")
+        assert storage.is_url_blacklisted("HTTP://Repeat.example.com/x/?utm_source=a") is False
+        storage.add_url("http://repeat.example.com/x", "2025-01-01", 8.0, "test")
+        assert storage.is_url_blacklisted("HTTP://Repeat.example.com/x/?utm_source=a") is True
+
 
 class TestIPLookups:
     """Test IP blacklist lookups."""
@@ -155,6 +199,24 @@ class TestIPLookups:
         source = storage.get_ip_blacklist_source("198.51.100.1")
         assert source is None
 
+    def test_is_ip_blacklisted_many(self):
+        """Test batch IP lookups against exact entries and CIDR ranges."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            storage = HybridStorage(os.path.join(tmpdir, "test.db"))
+            storage.add_ip("192.168.1.100", "2025-01-01", 7.0, "BlocklistDE")
+            storage.add_ip("10.0.0.0/8", "2025-01-01", 8.0, "test")
+            storage.add_ip("2001:db8::1", "2025-01-01", 8.0, "test")
+
+            results = storage.is_ip_blacklisted_many(
+                ["192.168.1.100", "10.5.5.5", "2001:db8::1", "11.0.0.1"]
+            )
+
+            assert results == [True, True, True, False]
+            metrics = storage.get_metrics()
+            assert metrics["ip_lookups"] == 4
+            assert metrics["cache_hits"] == 3
+            assert metrics["hot_source_hits"] == 1
+
 
 class TestBatchOperations:
     """Test batch write operations."""
@@ -176,6 +238,68 @@ class TestBatchOperations:
         assert storage.is_domain_blacklisted("evil3.com") is True
         assert storage.count_entries() == 3
 
+    def test_add_domains_written_in_chunks(self, monkeypatch):
+        """A batch larger than BULK_CHUNK is written completely, one transaction per chunk."""
+        monkeypatch.setattr("sec_mcp.storage_v2.BULK_CHUNK", 4)
+        storage = HybridStorage(":memory:")
+        storage.add_domains([(f"chunk{i}.com", "2025-01-01", 9.0, "test") for i in range(10)])
+
+        conn = storage._get_connection()
+        assert conn.execute("SELECT COUNT(*) FROM blacklist_domain").fetchone()[0] == 10
+        assert not conn.in_transaction
+
+    def test_add_entries_written_behind(self):
+        """Queued entries match at once and reach the database by the next flush or reload."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "test.db")
+            storage = HybridStorage(db_path)
+            storage.add_entries([
+                ("https://queued.com", None, "2025-04-18", 5.0, "manual"),
+                ("https://queued.org/Path/", "9.9.0.0/16", "2025-04-18", 5.0, "manual"),
+            ])
+            assert storage.is_domain_blacklisted("www.queued.com") is True
+            assert storage.is_url_blacklisted("https://queued.org/path") is True
+            assert storage.is_ip_blacklisted("9.9.1.1") is True
+
+            storage.reload()
+            assert storage.count_entries() == 3
+            conn = sqlite3.connect(db_path)
+            url_norm = conn.execute("SELECT url_norm FROM blacklist_url").fetchone()[0]
+            conn.close()
+            assert url_norm == "https://queued.org/path"
+
+            storage.add_entries([("https://later.com", None, "2025-04-18", 5.0, "manual")])
+            storage.close()
+            assert HybridStorage(db_path).is_domain_blacklisted("later.com") is True
+
+    def test_remove_waits_for_in_flight_flush(self):
+        """A removal during a background write waits for it, so the entry stays removed after a restart."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "test.db")
+            storage = HybridStorage(db_path)
+            started, release = threading.Event(), threading.Event()
+            write = storage._writer._write
+
+            def slow_write(batch):
+                started.set()
+                release.wait(5)
+                write(batch)
+
+            storage._writer._write = slow_write
+            storage.add_entries([(None, "1.2.3.4", "2025-04-18", 5.0, "manual")])
+            assert started.wait(5)
+
+            results = {}
+            remover = threading.Thread(target=lambda: results.update(removed=storage.remove_entry("1.2.3.4")))
+            remover.start()
+            remover.join(0.2)
+            assert remover.is_alive()  # blocked until the batch is stored
+            release.set()
+            remover.join(5)
+            assert results["removed"] is True
+            storage.close()
+            assert HybridStorage(db_path).is_ip_blacklisted("1.2.3.4") is False
+
     def test_add_urls_batch(self):
         """Test adding multiple URLs at once."""
         storage = HybridStorage(":memory:")
@@ -235,6 +359,21 @@ class TestStatistics:
         assert counts["Source1"] == 3  # 2 domains + 1 IP
         assert counts["Source2"] == 1  # 1 URL
 
+    def test_diagnostics_do_not_wait_for_writers(self):
+        """Diagnostics are served while a writer holds the storage lock."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # A file database, since each thread opens its own connection
+            storage = HybridStorage(os.path.join(tmpdir, "test.db"))
+            storage.add_domain("evil.com", "2025-01-01", 9.0, "Source1")
+            result = []
+            with storage._lock:
+                reader = threading.Thread(target=lambda: result.append(storage.get_diagnostics_snapshot()))
+                reader.start()
+                reader.join(timeout=5)
+                assert not reader.is_alive()
+            storage.close()
+            assert result[0]["per_source"] == {"Source1": 1}
+
     def test_get_active_sources(self):
         """Test getting list of active sources."""
         storage = HybridStorage(":memory:")
@@ -248,6 +387,36 @@ class TestStatistics:
         assert "PhishTank" in sources
         assert len(sources) == 2
 
+    def test_source_counts_follow_replace_and_remove(self):
+        """Per-source counters track re-added and removed entries."""
+        storage = HybridStorage(":memory:")
+
+        storage.add_domain("evil1.com", "2025-01-01", 9.0, "Source1")
+        storage.add_domain("evil2.com", "2025-01-01", 9.0, "Source1")
+        storage.add_domain("evil2.com", "2025-01-02", 9.0, "Source2")
+        storage.add_url("http://phishing.com/login", "2025-01-01", 8.5, "Source3")
+        storage.remove_entry("http://phishing.com/login")
+
+        assert storage.get_source_type_counts() == {
+            "Source1": {"domain": 1, "url": 0, "ip": 0},
+            "Source2": {"domain": 1, "url": 0, "ip": 0},
+        }
+        assert sorted(storage.get_active_sources()) == ["Source1", "Source2"]
+
+    def test_source_counts_survive_reload(self):
+        """Counters rebuilt by a reload match the ones kept by the writes."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            storage = HybridStorage(os.path.join(tmpdir, "test.db"))
+            storage.add_domains([("evil1.com", "2025-01-01", 9.0, "Source1"),
+                                 ("evil2.com", "2025-01-01", 9.0, "Source2")])
+            storage.add_ips([("192.0.2.1", "2025-01-01", 7.0, "Source1"),
+                             ("2001:db8::1", "2025-01-01", 7.0, "Source1"),
+                             ("10.0.0.0/8", "2025-01-01", 7.0, "Source2")])
+            before = storage.get_source_type_counts()
+            storage.reload()
+            assert storage.get_source_type_counts() == before
+            assert storage.count_entries() == 5
+
     def test_sample_entries(self):
         """Test sampling random entries."""
         storage = HybridStorage(":memory:")
@@ -261,6 +430,17 @@ class TestStatistics:
         assert len(sample) == 10
         assert all(entry.startswith("evil") and entry.endswith(".com") for entry in sample)
 
+    def test_sample_entries_covers_every_kind(self):
+        """Sampling more than stored returns each entry once, IPv4 addresses as strings."""
+        storage = HybridStorage(":memory:")
+        storage.add_domain("evil.com", "2025-01-01", 9.0, "test")
+        storage.add_url("http://bad.com/x", "2025-01-01", 9.0, "test")
+        storage.add_ips([(ip, "2025-01-01", 9.0, "test") for ip in ["1.2.3.4", "2001:db8::1", "10.0.0.0/8"]])
+
+        sample = storage.sample_entries(100)
+
+        assert sorted(sample) == sorted(["evil.com", "http://bad.com/x", "1.2.3.4", "2001:db8::1", "10.0.0.0/8"])
+
 
 class TestPersistence:
     """Test data persistence between sessions."""
@@ -286,6 +466,38 @@ class TestPersistence:
             assert storage2.is_ip_blacklisted("192.168.1.100") is True
             assert storage2.count_entries() == 3
 
+    def test_restart_uses_snapshot_until_tables_change(self, monkeypatch):
+        """An unchanged database is loaded from the snapshot file; any write makes it stale."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "test.db")
+            storage1 = HybridStorage(db_path)
+            storage1.add_domains([("evil.com", "2025-01-01", 9.0, "a"), ("bad.org", "2025-01-01", 9.0, "b")])
+            storage1.add_ips([("10.0.0.0/8", "2025-01-01", 7.0, "c"), ("192.168.1.100", "2025-01-01", 7.0, "c")])
+            storage1.reload()  # reads the tables and writes the snapshot
+            storage1.close()
+            assert os.path.exists(db_path + ".snap")
+
+            def fail(self, index):
+                raise AssertionError("tables read despite an up-to-date snapshot")
+            with monkeypatch.context() as m:
+                m.setattr(HybridStorage, "_load_domains_from_db", fail)
+                storage2 = HybridStorage(db_path)
+            assert storage2.is_domain_blacklisted("sub.evil.com") is True
+            assert storage2.is_ip_blacklisted("10.1.2.3") is True
+            assert storage2.get_ip_blacklist_source("10.1.2.3") == "c"
+            assert storage2.get_source_counts() == {"a": 1, "b": 1, "c": 2}
+            storage2.close()
+
+            # A write from another connection clears the snapshot token
+            conn = sqlite3.connect(db_path)
+            conn.execute("DELETE FROM blacklist_domain WHERE domain = 'evil.com'")
+            conn.commit()
+            conn.close()
+            storage3 = HybridStorage(db_path)
+            assert storage3.is_domain_blacklisted("evil.com") is False
+            assert storage3.count_entries() == 3
+            storage3.close()
+
 
 class TestRemoval:
     """Test entry removal."""
@@ -352,6 +564,27 @@ class TestReload:
             assert "evil.com" in storage._domains
             assert storage.is_domain_blacklisted("evil.com") is True
 
+    def test_lookups_see_old_data_during_reload(self):
+        """Test that a reload publishes new data at once instead of clearing first."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            storage = HybridStorage(os.path.join(tmpdir, "test.db"))
+            storage.add_domain("evil.com", "2025-01-01", 9.0, "test")
+            storage.add_ip("192.0.2.1", "2025-01-01", 9.0, "test")
+
+            seen = []
+            load_ips = storage._load_ips_from_db
+
+            def load_ips_and_look(index):
+                seen.append(storage.is_domain_blacklisted("evil.com"))
+                seen.append(storage.is_ip_blacklisted("192.0.2.1"))
+                load_ips(index)
+
+            storage._load_ips_from_db = load_ips_and_look
+            storage.reload()
+
+            assert seen == [True, True]
+            assert storage.is_ip_blacklisted("192.0.2.1") is True
+
 
 class TestMetrics:
     """Test performance metrics tracking."""
@@ -375,6 +608,18 @@ class TestMetrics:
         assert metrics["cache_misses"] == 2  # safe.com and url not found
         assert float(metrics["avg_lookup_time_ms"]) >= 0
 
+    def test_source_tier_follows_current_source(self):
+        """Test that hot/cold hits are attributed by the entry's current source."""
+        storage = HybridStorage(":memory:")
+        storage.add_domain("evil.com", "2025-01-01", 9.0, "PhishTank")  # Hot source
+        storage.is_domain_blacklisted("sub.evil.com")
+        storage.add_domain("evil.com", "2025-01-02", 9.0, "OpenPhish")  # Now cold
+        storage.is_domain_blacklisted("sub.evil.com")
+
+        metrics = storage.get_metrics()
+        assert metrics["hot_source_hits"] == 1
+        assert metrics["cold_source_hits"] == 1
+
 
 class TestUpdateHistory:
     """Test update history tracking."""
@@ -410,3 +655,44 @@ class TestUpdateHistory:
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+
+class TestURLNormalizationPersistence:
+    """Test that normalized URLs are stored and reused on load."""
+
+    def test_url_norm_stored_and_backfilled(self, monkeypatch):
+        """New URLs store url_norm; legacy rows are normalized once and backfilled."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "test.db")
+            storage = HybridStorage(db_path)
+            storage.add_url("HTTP://Evil.com/Path/?utm_source=x", "2025-01-01", 9.0, "test")
+
+            conn = sqlite3.connect(db_path)
+            # A row written by the DB-only storage has no url_norm
+            conn.execute(
+                "INSERT INTO blacklist_url (url, date, score, source) VALUES (?, ?, ?, ?)",
+                ("http://legacy.com/a/", "2025-01-01", 9.0, "test")
+            )
+            conn.commit()
+            stored = dict(conn.execute("SELECT url, url_norm FROM blacklist_url").fetchall())
+            assert stored["HTTP://Evil.com/Path/?utm_source=x"] == "http://evil.com/path"
+            assert stored["http://legacy.com/a/"] is None
+
+            storage.reload()
+            assert storage.is_url_blacklisted("http://legacy.com/a") is True
+            backfilled = conn.execute(
+                "SELECT url_norm FROM blacklist_url WHERE url = ?", ("http://legacy.com/a/",)
+            ).fetchone()[0]
+            conn.close()
+            assert backfilled == "http://legacy.com/a"
+            storage.close()
+
+            # The backfill commits before the snapshot token is stored, so the
+            # snapshot written by that reload is still valid on restart
+            def fail(self, index):
+                raise AssertionError("tables read despite an up-to-date snapshot")
+            with monkeypatch.context() as m:
+                m.setattr(HybridStorage, "_load_urls_from_db", fail)
+                restarted = HybridStorage(db_path)
+            assert restarted.is_url_blacklisted("http://legacy.com/a") is True
+            restarted.close()
@@ -17,18 +17,23 @@ async def test_update_source_success():
     await updater._update_source(mock_client, "PhishStats", "http://fake-url")
 
     # Based on the test data and current parsing logic for PhishStats:
-    # "https://malicious.com" (no path) -> add_domain("malicious.com"), add_ip("1.2.3.4")
-    # "https://phishing.com" (no path) -> add_domain("phishing.com"), add_ip("2.2.2.2")
-    assert storage.add_domain.call_count == 2
-    assert storage.add_ip.call_count == 2
-    assert storage.add_url.call_count == 0 # add_url is not called for domain-only entries
+    # "https://malicious.com" (no path) -> domain "malicious.com", IP "1.2.3.4"
+    # "https://phishing.com" (no path) -> domain "phishing.com", IP "2.2.2.2"
+    # Each table gets one batch insert per source
+    assert storage.add_domains.call_count == 1
+    assert storage.add_ips.call_count == 1
+    assert storage.add_urls.call_count == 0 # no URL batch for domain-only entries
 
-    storage.add_domain.assert_any_call("malicious.com", "2025-04-18T00:00:00", 9.0, "PhishStats")
-    storage.add_ip.assert_any_call("1.2.3.4", "2025-04-18T00:00:00", 9.0, "PhishStats")
+    domains = storage.add_domains.call_args[0][0]
+    ips = storage.add_ips.call_args[0][0]
+    assert len(domains) == 2
+    assert len(ips) == 2
+    assert ("malicious.com", "2025-04-18T00:00:00", 9.0, "PhishStats") in domains
+    assert ("1.2.3.4", "2025-04-18T00:00:00", 9.0, "PhishStats") in ips
 
     # For the second entry, date is now_str (mocked by ANY) and score is default 8.0
-    storage.add_domain.assert_any_call("phishing.com", ANY, 8.0, "PhishStats")
-    storage.add_ip.assert_any_call("2.2.2.2", ANY, 8.0, "PhishStats")
+    assert ("phishing.com", ANY, 8.0, "PhishStats") in domains
+    assert ("2.2.2.2", ANY, 8.0, "PhishStats") in ips
 
 @pytest.mark.asyncio
 async def test_update_source_network_error():
@@ -43,5 +48,31 @@ async def test_update_source_network_error():
     assert not storage.add_domain.called
     assert not storage.add_ip.called
     assert not storage.add_url.called
+    assert not storage.add_domains.called
+    assert not storage.add_ips.called
+    assert not storage.add_urls.called
 
 # More tests can be added for CSV parsing and error logging
+
+def test_request_update_wakes_scheduler():
+    storage = MagicMock(spec=Storage)
+    updater = BlacklistUpdater(storage)
+    updater.update_all = AsyncMock()
+    updater.request_update()
+    updater._scheduler_thread.join(timeout=0.5)  # still alive: it waits for the next run
+    updater.stop()
+    updater._scheduler_thread.join(timeout=5)
+    assert not updater._scheduler_thread.is_alive()
+    updater.update_all.assert_awaited_once()
+
+def test_parse_feed_and_split_entries():
+    from sec_mcp.update_blacklist import parse_feed, split_entries
+    entries = parse_feed("CINSSCORE", "# comment\n1.1.1.1\n1.1.1.1\n2.2.2.2\n")
+    assert [e[1] for e in entries] == ["1.1.1.1", "2.2.2.2"]  # deduplicated
+    domains, urls, ips = split_entries([
+        ("https://bad.com", None, "2025-04-18", 8, "S"),
+        ("https://bad.com/path", "3.3.3.3", "2025-04-18", 8, "S"),
+    ])
+    assert domains == [("bad.com", "2025-04-18", 8, "S")]
+    assert urls == [("https://bad.com/path", "2025-04-18", 8, "S")]
+    assert ips == [("3.3.3.3", "2025-04-18", 8, "S")]
@@ -1,7 +1,8 @@
 """Test the utility functions."""
 import pytest
-from sec_mcp.utility import validate_input, load_config, setup_logging
+from sec_mcp.utility import split_http_url, validate_input, validate_inputs, load_config, setup_logging
 import logging
+from urllib.parse import urlparse
 
 def test_validate_url():
     """Test URL validation."""
@@ -22,6 +23,12 @@ def test_validate_domain():
     assert validate_input("xn--bcher-kva.com")  # IDN domain
     assert not validate_input("invalid..com")
 
+def test_validate_inputs_matches_validate_input():
+    """Test that batch validation agrees with validate_input value by value."""
+    values = ["example.com", "https://example.com/x", "192.168.1.1", "01.2.3.4",
+              "xn--bcher-kva.com", "bücher.de", "invalid..com", "not-a-url", ""]
+    assert validate_inputs(values) == [validate_input(v) for v in values]
+
 def test_load_config():
     """Test configuration loading."""
     config = load_config()
@@ -35,3 +42,13 @@ def test_setup_logging():
     setup_logging("DEBUG")
     logger = logging.getLogger("sec_mcp")
     assert logger.level == logging.DEBUG
+
+def test_split_http_url_matches_urlparse():
+    """The fast split must give urlparse's netloc and path, including for the URLs it hands over."""
+    urls = ["http://a.com", "https://a.com/", "http://a.com:8080/p/q?x=1#f", "http://a.com?x",
+            "http://a.com/;params", "http://[::1]/x", "http://exämple.de/", "http://a.com/x\ty"]
+    for url in urls:
+        parsed = urlparse(url)
+        assert split_http_url(url) == (parsed.netloc, parsed.path)
+    with pytest.raises(ValueError):
+        split_http_url("http://bad]/x")
@@ -1,22 +1,33 @@
 import asyncio
 import csv
-import httpx
 import json
 import os
-from datetime import datetime
-import schedule
+from datetime import datetime, timedelta
 import threading
-from typing import List, Dict
+from concurrent.futures import Executor, ProcessPoolExecutor
+import multiprocessing
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 from .storage import Storage
-from .utility import validate_input, setup_logging
+from .utility import split_http_url, validate_input, setup_logging
 import logging
 
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger("sec_mcp.update_blacklist")
+
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
 class BlacklistUpdater:
     """Handles downloading and updating blacklists from various sources."""
     
     # Sources loaded from config.json
 
-    def __init__(self, storage: Storage, config_path: str = None):
+    def __init__(self, storage: Storage, config_path: str = None, start_scheduler: bool = True):
         self.storage = storage
         setup_logging()
         self.logger = logging.getLogger("sec_mcp.update_blacklist")
@@ -26,27 +37,81 @@ class BlacklistUpdater:
         with open(config_path, "r") as f:
             config = json.load(f)
         self.sources = config.get("blacklist_sources", {})
-        self._start_scheduler()
+        self._scheduler_cond = threading.Condition()
+        self._update_requested = False
+        self._stopped = False
+        self._scheduler_thread = None
+        if start_scheduler:
+            self._start_scheduler()
+
+    @staticmethod
+    def _next_midnight(now: datetime) -> datetime:
+        """Return the next local 00:00 after now."""
+        return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
 
     def _start_scheduler(self):
-        """Start the daily update scheduler in a background thread."""
+        """Start the daily update scheduler in a background thread.
+
+        The thread sleeps on a condition until the next midnight (or until
+        request_update/stop wakes it) instead of polling every minute.
+        """
         def run_scheduler():
-            schedule.every().day.at("00:00").do(self.update_all)
+            next_run = self._next_midnight(datetime.now())
             while True:
-                schedule.run_pending()
-                asyncio.run(asyncio.sleep(60))
+                with self._scheduler_cond:
+                    self._scheduler_cond.wait_for(
+                        lambda: self._stopped or self._update_requested or datetime.now() >= next_run,
+                        timeout=max((next_run - datetime.now()).total_seconds(), 0)
+                    )
+                    if self._stopped:
+                        return
+                    due = self._update_requested or datetime.now() >= next_run
+                    self._update_requested = False
+                if not due:
+                    continue
+                try:
+                    asyncio.run(self.update_all())
+                except Exception as e:
+                    self.logger.error(f"Scheduled update failed: {e}")
+                next_run = self._next_midnight(datetime.now())
+
+        self._scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+        self._scheduler_thread.start()
 
-        thread = threading.Thread(target=run_scheduler, daemon=True)
-        thread.start()
+    def request_update(self):
+        """Wake the scheduler thread to run an update now, without blocking the caller."""
+        with self._scheduler_cond:
+            self._update_requested = True
+            self._scheduler_cond.notify()
+
+    def stop(self):
+        """Stop the scheduler thread."""
+        with self._scheduler_cond:
+            self._stopped = True
+            self._scheduler_cond.notify()
 
     async def update_all(self):
         """Update blacklists from all sources."""
+        # httpx (and everything it pulls in) is only needed once an update runs,
+        # so importing the package for lookups does not pay for it
+        import httpx
         # Use follow_redirects to allow redirect handling
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            tasks = []
-            for source, url in self.sources.items():
-                tasks.append(self._update_source(client, source, url))
-            await asyncio.gather(*tasks)
+        # Use HTTP/2 when the optional h2 package is installed
+        async with httpx.AsyncClient(
+            timeout=30.0,
+            follow_redirects=True,
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=8),
+        ) as client:
+            if not self.sources:
+                return
+            # Feeds parse in parallel worker processes (spawned, since this process runs threads)
+            workers = min(len(self.sources), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                tasks = []
+                for source, url in self.sources.items():
+                    tasks.append(self._update_source(client, source, url, executor))
+                await asyncio.gather(*tasks)
 
     def _is_domain_blacklisted(self, url: str) -> bool:
         """Check if the domain of a URL is blacklisted."""
@@ -60,12 +125,11 @@ class BlacklistUpdater:
             self.logger.warning(f"Failed to parse URL {url}: {e}")
         return False
 
-    async def _update_source(self, client: httpx.AsyncClient, source: str, url: str):
+    async def _update_source(self, client: "httpx.AsyncClient", source: str, url: str, executor: Optional[Executor] = None):
         """Update blacklist from a single source."""
         import os
         import time
         from datetime import datetime, timedelta
-        from urllib.parse import urlparse
         try:
             os.makedirs("downloads", exist_ok=True)
             filename = os.path.join("downloads", f"{source}.txt" if not url.endswith('.csv') else f"{source}.csv")
@@ -84,299 +148,348 @@ class BlacklistUpdater:
                 content = response.text
                 with open(filename, "w", encoding="utf-8") as f:
                     f.write(content)
-            entries = []
+            # Parse in the executor (a process pool during update_all, the default
+            # thread pool otherwise) and insert from a thread, keeping the event
+            # loop free for the other downloads
+            batches = await asyncio.get_running_loop().run_in_executor(executor, _parse_feed_worker, source, content)
+            if batches is None:
+                return
+            await asyncio.to_thread(self._store_batches, source, *batches)
+        
+        except Exception as e:
+            self.logger.error(f"Failed to update {source}: {e}")
+            import traceback
+            self.logger.debug(traceback.format_exc())
+
+    def _store_batches(self, source: str, domains: List[Tuple], urls: List[Tuple], ips: List[Tuple]):
+        """Insert one feed's batches, each in a single transaction."""
+        url_count = 0
+        ip_count = 0
+        domain_count = 0
+        if domains:
+            try:
+                self.storage.add_domains(domains)
+                domain_count = len(domains)
+            except Exception as e:
+                self.logger.error(f"Domain insertion error for {source}: {e}")
+        if urls:
+            try:
+                self.storage.add_urls(urls)
+                url_count = len(urls)
+            except Exception as e:
+                self.logger.error(f"URL insertion error for {source}: {e}")
+        if ips:
+            try:
+                self.storage.add_ips(ips)
+                ip_count = len(ips)
+            except Exception as e:
+                self.logger.error(f"IP insertion error for {source}: {e}")
+
+        self.logger.info(f"Updated {source}: {url_count} URLs, {domain_count} domains, {ip_count} IPs.")
+
+    def force_update(self):
+        """Force an immediate update of all blacklists."""
+        asyncio.run(self.update_all())
+
+
+def parse_feed(source: str, content: str) -> Optional[List[Tuple]]:
+    """Parse a downloaded feed into deduplicated (url, ip, date, score, source) entries.
+
+    Returns None when the feed cannot be parsed.
+    """
+    entries = []
+    
+    # Source-specific parsing logic
+    if source == "PhishStats":
+        try:
+            # Skip comment lines and use the first non-comment line as header
+            lines = content.splitlines()
+            data_lines = [line for line in lines if line.strip() and not line.strip().startswith('#')]
+            if len(data_lines) < 2: # Need at least a header and one data row
+                logger.warning(f"No data (or only header) found for PhishStats after stripping comments. Content head: {content[:300]}")
+                return None
             
-            # Source-specific parsing logic
-            if source == "PhishStats":
-                try:
-                    # Skip comment lines and use the first non-comment line as header
-                    lines = content.splitlines()
-                    data_lines = [line for line in lines if line.strip() and not line.strip().startswith('#')]
-                    if len(data_lines) < 2: # Need at least a header and one data row
-                        self.logger.warning(f"No data (or only header) found for PhishStats after stripping comments. Content head: {content[:300]}")
-                        return
-                    
-                    reader = csv.DictReader(data_lines) # Uses the first line of data_lines as fieldnames
-                    now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
-                    first5 = []
-                    for idx, row_dict in enumerate(reader):
-                        url_val = row_dict.get('url', '').strip()
-                        ip_val = row_dict.get('ip', '').strip() or None # Ensures empty string becomes None
-                        
-                        date_str = row_dict.get('date', '').strip()
-                        # Validate or default date_val. PhishStats format can be 'YYYY-MM-DD HH:MM:SS'
-                        # For simplicity, we'll use it as is if present, or default to now_str
-                        date_val = date_str if date_str else now_str
-                        
-                        score_str = row_dict.get('score', '').strip()
-                        try:
-                            score_val = float(score_str) if score_str else 8.0
-                        except ValueError:
-                            self.logger.warning(f"Could not parse score '{score_str}' for {source} at row {idx+1}, using default 8.0. Row: {row_dict}")
-                            score_val = 8.0
+            # Plain row lists with column indexes resolved once from the header,
+            # rather than a dict per row
+            reader = csv.reader(data_lines)
+            header = next(reader)
+            columns = {name: i for i, name in enumerate(header)}
+            url_idx = columns.get('url')
+            ip_idx = columns.get('ip')
+            date_idx = columns.get('date')
+            score_idx = columns.get('score')
+            if url_idx is None:
+                logger.warning(f"No 'url' column found for PhishStats. Header: {header}")
+                return None
+            now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
+            first5 = []
+            for idx, row in enumerate(reader):
+                row_len = len(row)
+                url_val = row[url_idx].strip() if url_idx < row_len else ''
+                if not url_val: # Must have a URL at least
+                    continue
+                ip_val = (row[ip_idx].strip() if ip_idx is not None and ip_idx < row_len else '') or None # Ensures empty string becomes None
 
-                        if idx < 5: # For debugging
-                            first5.append({'date': date_val, 'score': score_val, 'url': url_val, 'ip': ip_val})
-                        
-                        if url_val: # Must have a URL at least
-                            entries.append((url_val, ip_val, date_val, score_val, source))
-                        if first5:
-                            self.logger.debug(f"PhishStats first 5 parsed rows: {first5}")
-                except Exception as e:
-                    self.logger.error(f"CSV parsing error for {source}: {e}. Raw content head: {content[:300]}")
-                    return
-            elif source == "PhishTank":
-                try:
-                    lines = content.splitlines()
-                    data_lines = [line for line in lines if line.strip()]
-                    reader = csv.DictReader(data_lines)
-                    first5 = []
-                    for idx, row in enumerate(reader):
-                        url_val = row.get("url", "").strip()
-                        date_val = row.get("submission_time", "").replace("T", " ").split("+")[0] if row.get("submission_time") else ""
-                        score_val = 8
-                        target_val = row.get("target", "")
-                        # Optionally: use target_val for tagging or notes
-                        ip_val = None  # PhishTank doesn't provide direct IP
-                        if idx < 5:
-                            first5.append({'date': date_val, 'score': score_val, 'url': url_val, 'target': target_val})
-                        if url_val:
-                            entries.append((url_val, ip_val, date_val, score_val, source))
-                    if first5:
-                        self.logger.debug(f"PhishTank first 5 parsed rows: {first5}")
-                except Exception as e:
-                    self.logger.error(f"CSV parsing error for {source}: {e}. Raw content head: {content[:300]}")
-                    return
-            elif source == "SpamhausDROP":
-                try:
-                    lines = content.splitlines()
-                    first5 = []
-                    from datetime import datetime
-                    now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
-                    for idx, line in enumerate(lines):
-                        line = line.strip()
-                        if not line or line.startswith(';'):
-                            continue
-                        # Extract the network mask (before the first ';')
-                        netmask = line.split(';')[0].strip()
-                        if not netmask:
-                            continue
-                        ip_val = netmask
-                        url_val = None
-                        date_val = now_str
-                        score_val = 8
-                        if idx < 5:
-                            first5.append({'ip_network': ip_val, 'date': date_val, 'score': score_val})
-                        entries.append((url_val, ip_val, date_val, score_val, source))
-                    if first5:
-                        self.logger.debug(f"SpamhausDROP first 5 parsed rows: {first5}")
-                except Exception as e:
-                    self.logger.error(f"Parsing error for {source}: {e}. Raw content head: {content[:300]}")
-                    return
-            elif source == "Dshield":
+                date_str = row[date_idx].strip() if date_idx is not None and date_idx < row_len else ''
+                # Validate or default date_val. PhishStats format can be 'YYYY-MM-DD HH:MM:SS'
+                # For simplicity, we'll use it as is if present, or default to now_str
+                date_val = date_str if date_str else now_str
+
+                score_str = row[score_idx].strip() if score_idx is not None and score_idx < row_len else ''
                 try:
-                    lines = content.splitlines()
-                    from datetime import datetime
-                    now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
-                    first5 = []
-                    for idx, line in enumerate(lines):
-                        line = line.strip()
-                        # Skip header lines and empty lines
-                        if not line or line.startswith('#') or line.startswith('Start') or line.startswith('('):
-                            continue
-                        
-                        # Parse tab-delimited fields
-                        fields = line.split('\t')
-                        if len(fields) < 3:  # Ensure at least IP range start, end, and subnet
-                            continue
-                            
-                        # Use the start IP of the range
-                        ip_val = fields[0].strip()
-                        url_val = None
-                        date_val = now_str
-                        score_val = 8
-                        
-                        if idx < 5:
-                            first5.append({'ip': ip_val, 'date': date_val, 'score': score_val})
-                        entries.append((url_val, ip_val, date_val, score_val, source))
+                    score_val = float(score_str) if score_str else 8.0
+                except ValueError:
+                    logger.warning(f"Could not parse score '{score_str}' for {source} at row {idx+1}, using default 8.0. Row: {row}")
+                    score_val = 8.0
+
+                if idx < 5: # For debugging
+                    first5.append({'date': date_val, 'score': score_val, 'url': url_val, 'ip': ip_val})
+
+                entries.append((url_val, ip_val, date_val, score_val, source))
+            if first5:
+                logger.debug(f"PhishStats first 5 parsed rows: {first5}")
+        except Exception as e:
+            logger.error(f"CSV parsing error for {source}: {e}. Raw content head: {content[:300]}")
+            return None
+    elif source == "PhishTank":
+        try:
+            lines = content.splitlines()
+            data_lines = [line for line in lines if line.strip()]
+            reader = csv.DictReader(data_lines)
+            first5 = []
+            for idx, row in enumerate(reader):
+                url_val = row.get("url", "").strip()
+                date_val = row.get("submission_time", "").replace("T", " ").split("+")[0] if row.get("submission_time") else ""
+                score_val = 8
+                target_val = row.get("target", "")
+                # Optionally: use target_val for tagging or notes
+                ip_val = None  # PhishTank doesn't provide direct IP
+                if idx < 5:
+                    first5.append({'date': date_val, 'score': score_val, 'url': url_val, 'target': target_val})
+                if url_val:
+                    entries.append((url_val, ip_val, date_val, score_val, source))
+            if first5:
+                logger.debug(f"PhishTank first 5 parsed rows: {first5}")
+        except Exception as e:
+            logger.error(f"CSV parsing error for {source}: {e}. Raw content head: {content[:300]}")
+            return None
+    elif source == "SpamhausDROP":
+        try:
+            lines = content.splitlines()
+            first5 = []
+            now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
+            for idx, line in enumerate(lines):
+                line = line.strip()
+                if not line or line.startswith(';'):
+                    continue
+                # Extract the network mask (before the first ';')
+                netmask = line.split(';')[0].strip()
+                if not netmask:
+                    continue
+                ip_val = netmask
+                url_val = None
+                date_val = now_str
+                score_val = 8
+                if idx < 5:
+                    first5.append({'ip_network': ip_val, 'date': date_val, 'score': score_val})
+                entries.append((url_val, ip_val, date_val, score_val, source))
+            if first5:
+                logger.debug(f"SpamhausDROP first 5 parsed rows: {first5}")
+        except Exception as e:
+            logger.error(f"Parsing error for {source}: {e}. Raw content head: {content[:300]}")
+            return None
+    elif source == "Dshield":
+        try:
+            lines = content.splitlines()
+            now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
+            first5 = []
+            for idx, line in enumerate(lines):
+                line = line.strip()
+                # Skip header lines and empty lines
+                if not line or line.startswith('#') or line.startswith('Start') or line.startswith('('):
+                    continue
+                
+                # Parse tab-delimited fields
+                fields = line.split('\t')
+                if len(fields) < 3:  # Ensure at least IP range start, end, and subnet
+                    continue
                     
-                    if first5:
-                        self.logger.info(f"Dshield first 5 parsed entries: {first5}")
-                except Exception as e:
-                    self.logger.error(f"Parsing error for {source}: {e}. Raw content head: {content[:300]}")
-                    return
-            elif source == "CINSSCORE":
-                try:
-                    lines = content.splitlines()
-                    from datetime import datetime
-                    now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
-                    first5 = []
+                # Use the start IP of the range
+                ip_val = fields[0].strip()
+                url_val = None
+                date_val = now_str
+                score_val = 8
+                
+                if idx < 5:
+                    first5.append({'ip': ip_val, 'date': date_val, 'score': score_val})
+                entries.append((url_val, ip_val, date_val, score_val, source))
+            
+            if first5:
+                logger.info(f"Dshield first 5 parsed entries: {first5}")
+        except Exception as e:
+            logger.error(f"Parsing error for {source}: {e}. Raw content head: {content[:300]}")
+            return None
+    elif source == "CINSSCORE":
+        try:
+            lines = content.splitlines()
+            now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
+            first5 = []
+            
+            for idx, line in enumerate(lines):
+                line = line.strip()
+                # Skip empty lines and comments
+                if not line or line.startswith('#'):
+                    continue
                     
-                    for idx, line in enumerate(lines):
-                        line = line.strip()
-                        # Skip empty lines and comments
-                        if not line or line.startswith('#'):
-                            continue
-                            
-                        # Each line contains a single IP address
-                        ip_val = line
-                        url_val = None
-                        date_val = now_str
-                        score_val = 8
-                        
-                        if idx < 5:
-                            first5.append({'ip': ip_val, 'date': date_val, 'score': score_val})
-                        entries.append((url_val, ip_val, date_val, score_val, source))
+                # Each line contains a single IP address
+                ip_val = line
+                url_val = None
+                date_val = now_str
+                score_val = 8
+                
+                if idx < 5:
+                    first5.append({'ip': ip_val, 'date': date_val, 'score': score_val})
+                entries.append((url_val, ip_val, date_val, score_val, source))
+            
+            if first5:
+                logger.info(f"CINSSCORE first 5 parsed entries: {first5}")
+        except Exception as e:
+            logger.error(f"Parsing error for {source}: {e}. Raw content head: {content[:300]}")
+            return None
+    elif source == "EmergingThreats" or source == "FeodoTracker" or source == "BlocklistDE":
+        try:
+            lines = content.splitlines()
+            now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
+            first5 = []
+            
+            for idx, line in enumerate(lines):
+                line = line.strip()
+                # Skip empty lines and comments
+                if not line or line.startswith('#'):
+                    continue
                     
-                    if first5:
-                        self.logger.info(f"CINSSCORE first 5 parsed entries: {first5}")
-                except Exception as e:
-                    self.logger.error(f"Parsing error for {source}: {e}. Raw content head: {content[:300]}")
-                    return
-            elif source == "EmergingThreats" or source == "FeodoTracker" or source == "BlocklistDE":
+                # Each line should contain an IP address or domain
+                entry = line
+                
+                # Determine if the entry is an IP address
                 try:
-                    lines = content.splitlines()
-                    from datetime import datetime
-                    now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
-                    first5 = []
-                    
-                    for idx, line in enumerate(lines):
-                        line = line.strip()
-                        # Skip empty lines and comments
-                        if not line or line.startswith('#'):
-                            continue
-                            
-                        # Each line should contain an IP address or domain
-                        entry = line
-                        
-                        # Determine if the entry is an IP address
-                        try:
-                            from ipaddress import ip_address
-                            ip_address(entry)
-                            ip_val = entry
-                            url_val = None
-                        except ValueError:
-                            # If not an IP, treat as domain/URL
-                            if not entry.startswith(('http://', 'https://')):
-                                url_val = f"http://{entry}"
-                            else:
-                                url_val = entry
-                            ip_val = None
-                        
-                        date_val = now_str
-                        score_val = 8
-                        
-                        if idx < 5:
-                            first5.append({'ip': ip_val, 'url': url_val, 'date': date_val, 'score': score_val})
-                        entries.append((url_val, ip_val, date_val, score_val, source))
-                    
-                    if first5:
-                        self.logger.info(f"{source} first 5 parsed entries: {first5}")
-                except Exception as e:
-                    self.logger.error(f"Parsing error for {source}: {e}. Raw content head: {content[:300]}")
-                    return
-            else:
-                from datetime import datetime
-                from ipaddress import ip_address
-                now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
-                for line in content.splitlines():
-                    line = line.strip()
-                    if not line or line.startswith("#") or not validate_input(line):
-                        continue
-                    
-                    # Try to parse fields if CSV, else treat as single value (IP or URL)
-                    if ',' in line:
-                        parts = [p.strip() for p in line.split(',')]
-                        url_val = parts[0] if parts else None
-                        ip_val = parts[1] if len(parts) > 1 else None
-                        date_val = parts[2] if len(parts) > 2 and parts[2] else now_str
-                        try:
-                            score_val = float(parts[3]) if len(parts) > 3 and parts[3] else 8
-                        except Exception:
-                            score_val = 8
+                    from ipaddress import ip_address
+                    ip_address(entry)
+                    ip_val = entry
+                    url_val = None
+                except ValueError:
+                    # If not an IP, treat as domain/URL
+                    if not entry.startswith(('http://', 'https://')):
+                        url_val = f"http://{entry}"
                     else:
-                        # Determine if the single value is an IP address or URL
-                        try:
-                            # Try parsing as IP address
-                            ip_address(line)
-                            url_val = None
-                            ip_val = line
-                        except ValueError:
-                            # If not an IP, treat as URL
-                            # Add http:// prefix if neither http:// nor https:// is present
-                            if not line.startswith(('http://', 'https://')):
-                                url_val = f"http://{line}"
-                            else:
-                                url_val = line
-                            ip_val = None
-                        
-                        date_val = now_str
-                        score_val = 8
-                        
-                    entries.append((url_val, ip_val, date_val, score_val, source))
+                        url_val = entry
+                    ip_val = None
+                
+                date_val = now_str
+                score_val = 8
+                
+                if idx < 5:
+                    first5.append({'ip': ip_val, 'url': url_val, 'date': date_val, 'score': score_val})
+                entries.append((url_val, ip_val, date_val, score_val, source))
             
-            # Deduplicate: for IP-based sources use ip_val, otherwise use url_val
-            seen = set()
-            deduped_entries = []
-            for entry in entries:
-                url_val, ip_val, date_val, score_val, source = entry
-                key = ip_val if ip_val else url_val  # Use IP if available, otherwise URL
-                if key and key not in seen:
-                    seen.add(key)
-                    deduped_entries.append(entry)
+            if first5:
+                logger.info(f"{source} first 5 parsed entries: {first5}")
+        except Exception as e:
+            logger.error(f"Parsing error for {source}: {e}. Raw content head: {content[:300]}")
+            return None
+    else:
+        from ipaddress import ip_address
+        now_str = datetime.now().isoformat(sep=' ', timespec='seconds')
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith("#") or not validate_input(line):
+                continue
             
-            if deduped_entries:
-                self.logger.info(f"First 5 parsed entries for {source}: {deduped_entries[:5]}")
+            # Try to parse fields if CSV, else treat as single value (IP or URL)
+            if ',' in line:
+                parts = [p.strip() for p in line.split(',')]
+                url_val = parts[0] if parts else None
+                ip_val = parts[1] if len(parts) > 1 else None
+                date_val = parts[2] if len(parts) > 2 and parts[2] else now_str
+                try:
+                    score_val = float(parts[3]) if len(parts) > 3 and parts[3] else 8
+                except Exception:
+                    score_val = 8
             else:
-                self.logger.warning(f"No valid entries found for {source} during update.")
-            
-            # Insert entries into database
-            url_count = 0
-            ip_count = 0
-            domain_count = 0
-            for entry in deduped_entries:
-                url_val, ip_val, date_val, score_val, src = entry
-                # Add URL if present and valid
-                if url_val and url_val.startswith(('http://', 'https://')):
-                    try:
-                        # from urllib.parse import urlparse # Moved to top of method
-                        parsed_url = urlparse(url_val)
-                        domain = parsed_url.netloc
-                        if domain: # Ensure domain was successfully parsed
-                            # Check if the URL is essentially just a domain (e.g., http://domain.com or http://domain.com/)
-                            # A URL is considered a "domain entry" if its path component is empty or just "/"
-                            is_domain_entry = not parsed_url.path or parsed_url.path == '/'
-
-                            if is_domain_entry:
-                                if validate_input(domain):  # Validate domain
-                                    self.storage.add_domain(domain, date_val, score_val, src)
-                                    domain_count += 1
-                            else: # It's a specific URL with a path (e.g., http://domain.com/some/path)
-                                # Add the full URL to the URL blacklist
-                                self.storage.add_url(url_val, date_val, score_val, src)
-                                url_count += 1
-                                # Per user request, do NOT add the domain part (domain) to the domain blacklist
-                                # when a specific sub-path URL is being added.
-                    except Exception as e:
-                        self.logger.debug(f"URL parsing error: {e} for {url_val}")
-                        continue
+                # Determine if the single value is an IP address or URL
+                try:
+                    # Try parsing as IP address
+                    ip_address(line)
+                    url_val = None
+                    ip_val = line
+                except ValueError:
+                    # If not an IP, treat as URL
+                    # Add http:// prefix if neither http:// nor https:// is present
+                    if not line.startswith(('http://', 'https://')):
+                        url_val = f"http://{line}"
+                    else:
+                        url_val = line
+                    ip_val = None
                 
-                # Add IP if present and valid
-                if ip_val:
-                    try:
-                        self.storage.add_ip(ip_val, date_val, score_val, src)
-                        ip_count += 1
-                    except Exception as e:
-                        self.logger.debug(f"IP insertion error: {e} for {ip_val}")
-                        continue
-            
-            self.logger.info(f"Updated {source}: {url_count} URLs, {domain_count} domains, {ip_count} IPs.")
-        
-        except Exception as e:
-            self.logger.error(f"Failed to update {source}: {e}")
-            import traceback
-            self.logger.debug(traceback.format_exc())
+                date_val = now_str
+                score_val = 8
+                
+            entries.append((url_val, ip_val, date_val, score_val, source))
+    
+    # Deduplicate: for IP-based sources use ip_val, otherwise use url_val
+    seen = set()
+    deduped_entries = []
+    for entry in entries:
+        url_val, ip_val, date_val, score_val, source = entry
+        key = ip_val if ip_val else url_val  # Use IP if available, otherwise URL
+        if key and key not in seen:
+            seen.add(key)
+            deduped_entries.append(entry)
+    
+    if deduped_entries:
+        logger.info(f"First 5 parsed entries for {source}: {deduped_entries[:5]}")
+    else:
+        logger.warning(f"No valid entries found for {source} during update.")
+    return deduped_entries
 
-    def force_update(self):
-        """Force an immediate update of all blacklists."""
-        asyncio.run(self.update_all())
+
+def split_entries(entries: List[Tuple]) -> Tuple[List[Tuple], List[Tuple], List[Tuple]]:
+    """Sort parsed entries into (domain, url, ip) batches of (value, date, score, source) rows."""
+    domains = []
+    urls = []
+    ips = []
+    for entry in entries:
+        url_val, ip_val, date_val, score_val, src = entry
+        # Add URL if present and valid
+        if url_val and url_val.startswith(('http://', 'https://')):
+            try:
+                domain, path = split_http_url(url_val)
+                if domain: # Ensure domain was successfully parsed
+                    # Check if the URL is essentially just a domain (e.g., http://domain.com or http://domain.com/)
+                    # A URL is considered a "domain entry" if its path component is empty or just "/"
+                    is_domain_entry = not path or path == '/'
+
+                    if is_domain_entry:
+                        if validate_input(domain):  # Validate domain
+                            domains.append((domain, date_val, score_val, src))
+                    else: # It's a specific URL with a path (e.g., http://domain.com/some/path)
+                        # Add the full URL to the URL blacklist
+                        urls.append((url_val, date_val, score_val, src))
+                        # Per user request, do NOT add the domain part (domain) to the domain blacklist
+                        # when a specific sub-path URL is being added.
+            except Exception as e:
+                logger.debug(f"URL parsing error: {e} for {url_val}")
+                continue
+
+        # Add IP if present
+        if ip_val:
+            ips.append((ip_val, date_val, score_val, src))
+    return domains, urls, ips
+
+
+def _parse_feed_worker(source: str, content: str):
+    """Parse and split one feed; top-level so it can run in a worker process."""
+    entries = parse_feed(source, content)
+    if entries is None:
+        return None
+    return split_entries(entries)
@@ -4,9 +4,9 @@ import json
 import logging
 import re
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlparse
 import idna
-import ipaddress
 
 def setup_logging(log_level: str = "INFO") -> None:
     """Configure logging for the MCP client and server."""
@@ -32,34 +32,77 @@ def load_config() -> Dict[str, Any]:
     with open(config_path) as f:
         return json.load(f)
 
+# Compiled once at import; validate_input runs for every checked value
+_URL_RE = re.compile(
+    r'^https?://'
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,63}\.?|'
+    r'localhost)'
+    r'(?::\d+)?'
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
+# Plain LDH (letters, digits, hyphen) ASCII domains that idna.encode would accept
+_ASCII_DOMAIN_RE = re.compile(
+    r'(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,63}', re.IGNORECASE)
+
+# Dotted-quad IPv4 with the same rules as ipaddress.IPv4Address (no leading zeros)
+_IPV4_RE = re.compile(
+    r'(?:(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9][0-9]|[0-9])\.){3}'
+    r'(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9][0-9]|[0-9])')
+
+def _valid_domain(value: str) -> bool:
+    """Check the host part of a value (scheme and path stripped) as a domain name."""
+    if '://' in value:
+        value = value.split('://', 1)[1]
+    value = value.split('/', 1)[0]
+    if '.' not in value or value.endswith('.'):
+        return False
+    # idna.encode is only needed for non-LDH input (IDNs, "--" labels, odd characters)
+    if len(value) > 253 or '--' in value or not _ASCII_DOMAIN_RE.fullmatch(value):
+        try:
+            idna.encode(value)
+        except (idna.IDNAError, UnicodeError):
+            return False
+    tld = value.rsplit('.', 1)[-1]
+    return 2 <= len(tld) <= 63 and tld.isalpha()
+
+# Everything that validate_input accepts without idna: IPv4, plain LDH domains
+# (no "--", at most 253 characters) and URLs, as one alternation
+_FAST_VALID_RE = re.compile(
+    r'(?:' + _IPV4_RE.pattern + r')'
+    r'|(?!.*--)(?!.{254})(?:' + _ASCII_DOMAIN_RE.pattern + r')'
+    r'|(?:' + _URL_RE.pattern[1:-1] + r')',
+    re.IGNORECASE | re.DOTALL)
+
 def validate_input(value: str) -> bool:
     """Validate if a string is a valid domain, URL, or IP address."""
-    # URL validation
-    url_pattern = re.compile(
-        r'^https?://'
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,63}\.?|'
-        r'localhost)'
-        r'(?::\d+)?'
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-    if url_pattern.match(value):
-        return True
-    # IP address validation (strict)
-    try:
-        ip = ipaddress.ip_address(value)
-        if ip.version == 4:
-            return True
-    except ValueError:
-        pass
-    # Domain validation (must have at least one dot and valid TLD)
-    try:
-        if '://' in value:
-            value = value.split('://', 1)[1]
-        value = value.split('/', 1)[0]
-        if value.count('.') >= 1 and not value.endswith('.'):
-            idna.encode(value)
-            tld = value.rsplit('.', 1)[-1]
-            if 2 <= len(tld) <= 63 and tld.isalpha():
-                return True
-    except (idna.IDNAError, UnicodeError):
-        return False
-    return False
+    # One match of the combined pattern settles the common cases (it includes
+    # IPv4); the rest (IDNs, URLs with unusual hosts, ...) get the full checks
+    return bool(
+        _FAST_VALID_RE.fullmatch(value)
+        or _valid_domain(value)
+        or _URL_RE.match(value)
+    )
+
+def validate_inputs(values: List[str]) -> List[bool]:
+    """Validate many values at once; same result as validate_input for each."""
+    validate = validate_input
+    return [validate(value) for value in values]
+
+# Netloc and path of an http(s) URL, split where urlparse splits them
+_HTTP_URL_RE = re.compile(r'https?://([^/?#]*)([^?#]*)')
+
+def split_http_url(url: str) -> Tuple[str, str]:
+    """Return the (netloc, path) that urlparse gives for an http(s) URL.
+
+    One regex match covers the common case; URLs that urlparse treats
+    specially (control characters, IPv6 brackets, non-ASCII hosts, ;params)
+    still go through it, and raise ValueError where it does.
+    """
+    match = _HTTP_URL_RE.match(url)
+    if match is not None:
+        netloc, path = match.groups()
+        if (url.isprintable() and netloc.isascii()
+                and '[' not in netloc and ']' not in netloc and ';' not in path):
+            return netloc, path
+    parsed = urlparse(url)
+    return parsed.netloc, parsed.path
@@ -11,7 +11,6 @@ setup(
         "idna",
         "mcp[cli]",
         "httpx",
-        "schedule",
     ],
     entry_points={
         "console_scripts": [